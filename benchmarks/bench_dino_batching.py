@@ -0,0 +1,88 @@
+"""
+Compara el throughput de GroundingDINO con batch 1 frente al micro-batching.
+
+Uso:
+    python benchmarks/bench_dino_batching.py --requests 32 --concurrency 8
+
+Con --random-weights usa un GroundingDINO diminuto con pesos aleatorios, sin
+descargas (ver random_models.py).
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+from PIL import Image
+
+from src.config import BOX_THRESHOLD, TEXT_THRESHOLD
+from src.main import model_registry
+from modules.segmentation.grounding_dino import DinoBatchScheduler, detect_batch
+
+PROMPTS = ["shoe", "bag", "jacket", "red sneaker", "leather handbag"]
+
+
+def make_images(count: int, size: int) -> list[Image.Image]:
+    rng = np.random.default_rng(0)
+    return [
+        Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8))
+        for _ in range(count)
+    ]
+
+
+def bench_sequential(images, prompts) -> float:
+    start = time.perf_counter()
+    for image, prompt in zip(images, prompts):
+        detect_batch([image], [prompt], BOX_THRESHOLD, TEXT_THRESHOLD)
+    return time.perf_counter() - start
+
+
+def bench_scheduler(images, prompts, concurrency, max_batch_size, max_wait_ms):
+    scheduler = DinoBatchScheduler(max_batch_size, max_wait_ms)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(
+            pool.map(
+                lambda args: scheduler.submit(*args, BOX_THRESHOLD, TEXT_THRESHOLD),
+                zip(images, prompts),
+            )
+        )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--size", type=int, default=640)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--random-weights", action="store_true")
+    args = parser.parse_args()
+
+    if args.random_weights:
+        from random_models import build_random_dino
+
+        model_registry.set_dino(*build_random_dino())
+
+    images = make_images(args.requests, args.size)
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(args.requests)]
+
+    # Calentamiento para no medir la inicialización de kernels
+    detect_batch(images[:1], prompts[:1], BOX_THRESHOLD, TEXT_THRESHOLD)
+
+    sequential = bench_sequential(images, prompts)
+    batched = bench_scheduler(
+        images, prompts, args.concurrency, args.max_batch_size, args.max_wait_ms
+    )
+
+    print(f"batch=1      : {args.requests / sequential:.2f} img/s ({sequential:.2f}s)")
+    print(f"micro-batch  : {args.requests / batched:.2f} img/s ({batched:.2f}s)")
+    print(f"speedup      : {sequential / batched:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Compara los backends de inferencia en CPU: PyTorch en precisión completa
+frente a cuantización dinámica int8 (INFERENCE_BACKEND=int8).
+
+Mide la latencia de GroundingDINO (detección) y de SAM (set_image + predict)
+y la concordancia de las salidas (IoU de la mejor box y de la máscara).
+
+Uso:
+    python benchmarks/bench_inference_backend.py --iterations 5
+    python benchmarks/bench_inference_backend.py --random-weights --threads 4
+
+Con --random-weights usa modelos diminutos con pesos aleatorios, sin
+descargas (ver random_models.py); los tiempos sirven para comparar backends
+pero la concordancia de salidas no es representativa.
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+
+os.environ.setdefault("INFERENCE_DEVICE", "cpu")
+os.environ.setdefault("DINO_BATCH_MAX_SIZE", "1")
+os.environ.setdefault("SAM_EMBEDDING_CACHE_BYTES", "0")
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from src.main import model_registry
+from modules.segmentation.grounding_dino import detect_batch
+from modules.segmentation.inference_backend import quantize_int8
+from modules.segmentation.sam_segmentation import segment_with_sam
+from config import BOX_THRESHOLD, TEXT_THRESHOLD
+
+
+def make_image(size: int) -> Image.Image:
+    """Fondo gris con un objeto rojo centrado."""
+    image = Image.new("RGB", (size, size * 3 // 4), (200, 200, 200))
+    draw = ImageDraw.Draw(image)
+    w, h = image.size
+    draw.ellipse((w // 4, h // 4, 3 * w // 4, 3 * h // 4), fill=(200, 30, 30))
+    return image
+
+
+def box_iou(a, b) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1])
+    return intersection / max(union - intersection, 1e-9)
+
+
+def mask_iou(a: np.ndarray, b: np.ndarray) -> float:
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+def run_backend(image, prompt, box_threshold, iterations):
+    """Retorna (ms DINO, ms SAM, mejor box, máscara) con los modelos registrados."""
+    dino_times, sam_times = [], []
+    for _ in range(iterations + 1):  # La primera iteración es de calentamiento
+        start = time.perf_counter()
+        result = detect_batch([image], [prompt], box_threshold, TEXT_THRESHOLD)[0]
+        dino_times.append(time.perf_counter() - start)
+
+        if len(result["scores"]):
+            box = result["boxes"][result["scores"].argmax()].numpy()
+        else:
+            box = np.array([0, 0, image.width, image.height], dtype=np.float32)
+        start = time.perf_counter()
+        mask, _ = segment_with_sam(image, box)
+        sam_times.append(time.perf_counter() - start)
+
+    return (
+        1000 * float(np.median(dino_times[1:])),
+        1000 * float(np.median(sam_times[1:])),
+        box,
+        mask,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--prompt", default="red ball")
+    parser.add_argument("--threads", type=int, default=0, help="Hilos intra-op")
+    parser.add_argument("--random-weights", action="store_true")
+    args = parser.parse_args()
+
+    import torch
+
+    torch.manual_seed(0)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    box_threshold = BOX_THRESHOLD
+    if args.random_weights:
+        from random_models import install_random_models
+
+        install_random_models(model_registry)
+        box_threshold = 0.0
+
+    processor, dino_fp32 = model_registry.get_dino()
+    sam_fp32 = model_registry.get_sam_predictor()
+    image = make_image(args.size)
+
+    fp32 = run_backend(image, args.prompt, box_threshold, args.iterations)
+
+    from segment_anything import SamPredictor
+
+    model_registry.set_dino(processor, quantize_int8(copy.deepcopy(dino_fp32)))
+    model_registry.set_sam_predictor(
+        SamPredictor(quantize_int8(copy.deepcopy(sam_fp32.model)))
+    )
+    int8 = run_backend(image, args.prompt, box_threshold, args.iterations)
+
+    print(f"threads: {torch.get_num_threads()}  image: {image.size}")
+    print(f"{'backend':<8} {'dino ms':>9} {'sam ms':>9}")
+    for name, result in (("pytorch", fp32), ("int8", int8)):
+        print(f"{name:<8} {result[0]:9.1f} {result[1]:9.1f}")
+    print(
+        f"speedup  {fp32[0] / int8[0]:8.2f}x {fp32[1] / int8[1]:8.2f}x\n"
+        f"box IoU {box_iou(fp32[2], int8[2]):.3f}  "
+        f"mask IoU {mask_iou(fp32[3], int8[3]):.3f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Micro-benchmarks por etapa del pipeline de imagen (CPU, sin conexión).
+
+Mide por separado cada etapa de `process_image_pipeline` sobre una matriz de
+resoluciones y longitudes de prompt: decodificación, GroundingDINO, SAM,
+codificación del recorte, base64, subida (contra un servidor local) y búsqueda
+(con un SerpAPI simulado). Reporta p50/p95, pico de RSS y pico de memoria
+asignada (tracemalloc, en una pasada aparte para no distorsionar los tiempos).
+
+Uso:
+    python benchmarks/bench_pipeline.py --random-weights --output baseline.json
+    python benchmarks/bench_pipeline.py --random-weights --baseline baseline.json
+
+Con --baseline compara el p50 de cada etapa y termina con código 1 si alguna
+empeora más de --threshold.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# Medir cada etapa de forma aislada: sin micro-batching ni cachés
+os.environ.setdefault("INFERENCE_DEVICE", "cpu")
+os.environ.setdefault("DINO_BATCH_MAX_SIZE", "1")
+os.environ.setdefault("SAM_EMBEDDING_CACHE_BYTES", "0")
+os.environ.setdefault("MODEL_WARMUP_ON_STARTUP", "0")
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from stubs import StubGoogleSearch, start_upload_stand_in
+from src.main import (
+    _encode_full_resolution_crop,
+    _prepare_image,
+    model_registry,
+)
+import modules.search.google_lens_search as google_lens_search
+from modules.search.http_clients import close_http_client
+from modules.search.search_orchestrator import search_orchestrator
+from modules.segmentation.grounding_dino import get_grounding_dino_boxes
+from modules.segmentation.sam_segmentation import (
+    segment_with_sam,
+    segmented_image_encoder,
+)
+from modules.storage.image_store import build_image_store
+from config import BOX_THRESHOLD, TEXT_THRESHOLD, IMAGE_STORE_BACKEND
+
+PROMPT_WORDS = ["red", "leather", "shoe", "bag", "jacket", "blue", "hat", "dress"]
+
+
+def make_image_bytes(long_side: int, seed: int = 0) -> bytes:
+    """JPEG sintético 4:3 con formas de colores."""
+    rng = np.random.default_rng(seed)
+    width, height = long_side, long_side * 3 // 4
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x0, y0 = rng.integers(0, width // 2), rng.integers(0, height // 2)
+        x1 = x0 + rng.integers(width // 8, width // 2)
+        y1 = y0 + rng.integers(height // 8, height // 2)
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        draw.ellipse((x0, y0, x1, y1), fill=color)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def make_prompt(words: int) -> str:
+    return " ".join(PROMPT_WORDS[i % len(PROMPT_WORDS)] for i in range(words))
+
+
+def fallback_mask(image: Image.Image) -> np.ndarray:
+    """Máscara elíptica central, para cuando un modelo aleatorio no segmenta nada."""
+    yy, xx = np.mgrid[: image.height, : image.width]
+    dy = (yy - image.height / 2) / (image.height / 3)
+    dx = (xx - image.width / 2) / (image.width / 3)
+    return dy**2 + dx**2 <= 1
+
+
+def build_stages(image_bytes: bytes, prompt: str, box_threshold: float, loop):
+    """
+    Retorna la lista (nombre, función) de etapas. Cada etapa toma la salida de
+    la anterior a través de `state`, igual que el pipeline.
+    """
+    state = {}
+
+    def decode():
+        state["image"] = _prepare_image(image_bytes)
+
+    def dino():
+        box, score, _ = get_grounding_dino_boxes(
+            state["image"].dino_image, prompt, box_threshold, TEXT_THRESHOLD
+        )
+        state["box"], state["score"] = box, score
+
+    def sam():
+        sam_image = state["image"].sam_image
+        box = state["image"].dino_box_to_sam(state["box"])
+        mask, _ = segment_with_sam(sam_image, box)
+        state["mask"] = mask if mask.any() else fallback_mask(sam_image)
+
+    def encode():
+        state["encoded"] = _encode_full_resolution_crop(state["image"], state["mask"])
+
+    def to_base64():
+        base64.b64encode(state["encoded"]).decode("utf-8")
+
+    def upload():
+        # Almacén nuevo en cada iteración: se mide la escritura, no la deduplicación
+        store = build_image_store(IMAGE_STORE_BACKEND)
+        metadata = {"score": float(state["score"]), "text_prompt": prompt}
+        key = loop.run_until_complete(
+            store.put(state["encoded"], segmented_image_encoder.mime_type, metadata)
+        )
+        state["url"] = loop.run_until_complete(store.public_url(key))
+
+    def search():
+        loop.run_until_complete(search_orchestrator.search(state["url"]))
+
+    return [
+        ("decode", decode),
+        ("dino", dino),
+        ("sam", sam),
+        ("encode", encode),
+        ("base64", to_base64),
+        ("upload", upload),
+        ("search", search),
+    ]
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(resolution, prompt_words, iterations, box_threshold, loop) -> list[dict]:
+    image_bytes = make_image_bytes(resolution)
+    prompt = make_prompt(prompt_words)
+    timings: dict[str, list[float]] = {}
+    rss: dict[str, float] = {}
+
+    # Iteración de calentamiento (no se mide)
+    for _, stage in build_stages(image_bytes, prompt, box_threshold, loop):
+        stage()
+
+    for _ in range(iterations):
+        for name, stage in build_stages(image_bytes, prompt, box_threshold, loop):
+            start = time.perf_counter()
+            stage()
+            timings.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+            rss[name] = peak_rss_mb()
+
+    # Pasada aparte con tracemalloc: pico de memoria asignada por etapa
+    allocations = {}
+    tracemalloc.start()
+    for name, stage in build_stages(image_bytes, prompt, box_threshold, loop):
+        tracemalloc.reset_peak()
+        stage()
+        allocations[name] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    tracemalloc.stop()
+
+    return [
+        {
+            "resolution": resolution,
+            "prompt_words": prompt_words,
+            "stage": name,
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+            "mean_ms": round(sum(values) / len(values), 3),
+            "peak_rss_mb": round(rss[name], 1),
+            "alloc_peak_mb": round(allocations[name], 3),
+        }
+        for name, values in timings.items()
+    ]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(results: list[dict], baseline_path: str, threshold: float) -> bool:
+    """Imprime la comparación con la baseline y retorna True si hay regresiones."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {
+        (r["resolution"], r["prompt_words"], r["stage"]): r for r in baseline["results"]
+    }
+
+    regressed = False
+    print(f"\nComparación con {baseline_path} (commit {baseline['meta']['commit']}):")
+    for result in results:
+        key = (result["resolution"], result["prompt_words"], result["stage"])
+        if key not in previous:
+            continue
+        before, after = previous[key]["p50_ms"], result["p50_ms"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  <-- REGRESSION"
+            regressed = True
+        print(
+            f"  {key[0]:>5}px {key[1]:>2}w {key[2]:<7} "
+            f"{before:9.2f} -> {after:9.2f} ms ({change:+.1%}){flag}"
+        )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[640, 1280, 2048])
+    parser.add_argument("--prompt-lengths", type=int, nargs="+", default=[1, 4, 12])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument(
+        "--random-weights",
+        action="store_true",
+        help="Usa modelos pequeños con pesos aleatorios (sin descargas)",
+    )
+    parser.add_argument("--output", help="Guarda los resultados en este JSON")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior a comparar")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Empeoramiento relativo del p50 que se considera regresión",
+    )
+    args = parser.parse_args()
+
+    import torch
+
+    torch.manual_seed(0)
+    box_threshold = BOX_THRESHOLD
+    if args.random_weights:
+        from random_models import install_random_models
+
+        install_random_models(model_registry)
+        box_threshold = 0.0  # Un modelo aleatorio rara vez supera el umbral real
+
+    google_lens_search.GoogleSearch = StubGoogleSearch
+    server = start_upload_stand_in()
+    loop = asyncio.new_event_loop()
+
+    results = []
+    try:
+        for resolution in args.resolutions:
+            for prompt_words in args.prompt_lengths:
+                results.extend(
+                    run_case(
+                        resolution, prompt_words, args.iterations, box_threshold, loop
+                    )
+                )
+    finally:
+        loop.run_until_complete(close_http_client())
+        loop.close()
+        server.shutdown()
+
+    print(
+        f"{'res':>6} {'words':>5} {'stage':<7} {'p50 ms':>9} {'p95 ms':>9} "
+        f"{'rss MB':>8} {'alloc MB':>9}"
+    )
+    for r in results:
+        print(
+            f"{r['resolution']:>6} {r['prompt_words']:>5} {r['stage']:<7} "
+            f"{r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['peak_rss_mb']:8.1f} "
+            f"{r['alloc_peak_mb']:9.2f}"
+        )
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "device": "cpu",
+            "threads": torch.get_num_threads(),
+            "random_weights": args.random_weights,
+            "iterations": args.iterations,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+    if args.baseline and compare(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
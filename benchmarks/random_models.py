@@ -0,0 +1,91 @@
+"""
+Modelos GroundingDINO y SAM pequeños con pesos aleatorios.
+
+Permiten ejecutar los benchmarks sin conexión (sin descargar pesos ni
+tokenizer) y en poco tiempo. Los tiempos absolutos no son comparables con los
+modelos reales, pero sí sirven para detectar regresiones del código que los
+rodea (pre/post-procesado, codificación, E/S).
+"""
+import os
+import tempfile
+
+# Vocabulario mínimo para el tokenizer BERT: tokens especiales, letras y
+# palabras habituales en los prompts
+VOCAB = (
+    ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", ".", ","]
+    + list("abcdefghijklmnopqrstuvwxyz")
+    + ["shoe", "bag", "jacket", "red", "blue", "leather", "sneaker", "hat", "dress"]
+)
+
+
+def build_random_dino():
+    """Retorna (processor, model) de un GroundingDINO diminuto e inicializado al azar."""
+    from transformers import (
+        BertConfig,
+        BertTokenizerFast,
+        GroundingDinoConfig,
+        GroundingDinoForObjectDetection,
+        GroundingDinoImageProcessor,
+        GroundingDinoProcessor,
+        SwinConfig,
+    )
+
+    vocab_dir = tempfile.mkdtemp(prefix="random_dino_vocab_")
+    vocab_file = os.path.join(vocab_dir, "vocab.txt")
+    with open(vocab_file, "w") as f:
+        f.write("\n".join(VOCAB))
+
+    processor = GroundingDinoProcessor(
+        image_processor=GroundingDinoImageProcessor(
+            size={"shortest_edge": 320, "longest_edge": 512}
+        ),
+        tokenizer=BertTokenizerFast(vocab_file=vocab_file, do_lower_case=True),
+    )
+
+    config = GroundingDinoConfig(
+        backbone_config=SwinConfig(
+            embed_dim=32,
+            depths=[1, 1, 1, 1],
+            num_heads=[1, 2, 4, 8],
+            out_features=["stage2", "stage3", "stage4"],
+        ),
+        text_config=BertConfig(
+            vocab_size=len(VOCAB),
+            hidden_size=64,
+            num_hidden_layers=1,
+            num_attention_heads=2,
+            intermediate_size=128,
+        ),
+        d_model=64,
+        encoder_layers=1,
+        decoder_layers=1,
+        encoder_ffn_dim=128,
+        decoder_ffn_dim=128,
+        encoder_attention_heads=2,
+        decoder_attention_heads=2,
+        num_queries=50,
+    )
+    model = GroundingDinoForObjectDetection(config).eval()
+    return processor, model
+
+
+def build_random_sam_predictor():
+    """Retorna un SamPredictor con un encoder ViT de 2 bloques inicializado al azar."""
+    from segment_anything import SamPredictor
+    from segment_anything.build_sam import _build_sam
+
+    sam_model = _build_sam(
+        encoder_embed_dim=128,
+        encoder_depth=2,
+        encoder_num_heads=4,
+        encoder_global_attn_indexes=[1],
+        checkpoint=None,
+    ).eval()
+    return SamPredictor(sam_model)
+
+
+def install_random_models(model_registry):
+    """Registra los modelos aleatorios en el `model_registry` del pipeline."""
+    processor, model = build_random_dino()
+    model_registry.set_dino(processor, model)
+    model_registry.set_sam_predictor(build_random_sam_predictor())
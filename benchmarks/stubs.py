@@ -0,0 +1,63 @@
+"""
+Sustitutos locales de los servicios externos para los benchmarks.
+
+- Un servidor HTTP local que responde como Supabase Storage (subida y URLs
+  firmadas).
+- Un `GoogleSearch` falso que devuelve coincidencias fijas sin llamar a SerpAPI.
+"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, como los servicios reales
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/storage/v1/object/sign/"):
+            signed_path = self.path[len("/storage/v1"):]
+            payload = {"signedURL": f"{signed_path}?token=stub"}
+        else:
+            payload = {"Key": self.path}
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_upload_stand_in() -> ThreadingHTTPServer:
+    """Arranca el servidor local y apunta SUPABASE_URL a él."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["SUPABASE_URL"] = base_url
+    os.environ["SUPABASE_KEY"] = "benchmark-key"
+    return server
+
+
+class StubGoogleSearch:
+    """Sustituto de `serpapi.GoogleSearch` con una respuesta fija."""
+
+    def __init__(self, params: dict):
+        self.params = params
+
+    def get_dict(self) -> dict:
+        return {
+            "visual_matches": [
+                {
+                    "title": f"Producto {i}",
+                    "link": f"https://shop.example/p/{i}",
+                    "thumbnail": f"https://shop.example/t/{i}.jpg",
+                    "price": {"value": f"{10 + i},99 €"},
+                }
+                for i in range(10)
+            ]
+        }
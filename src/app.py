@@ -1,15 +1,89 @@
-from fastapi import FastAPI, UploadFile, Form, WebSocket
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Callable, List
+
+from fastapi import (
+    FastAPI,
+    File,
+    Form,
+    Request,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
-import shutil
-import os
-from typing import List
-from src.main import process_image_pipeline
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from src.config import (
+    MODEL_WARMUP_ON_STARTUP,
+    JOB_CONCURRENCY,
+    JOB_QUEUE_SIZE,
+    JOB_RESULT_TTL_SECONDS,
+    PROGRESS_QUEUE_SIZE,
+    MULTI_OBJECT_MAX_K,
+    BATCH_MAX_IMAGES,
+)
+from src.main import (
+    Job,
+    JobManager,
+    JobQueueFullError,
+    ProgressHub,
+    SingleFlight,
+    close_http_client,
+    content_type_for,
+    image_store,
+    image_store_key_is_valid,
+    inference_executor,
+    model_registry,
+    process_image_batch,
+    process_image_pipeline,
+    process_multi_object_pipeline,
+    render_metrics,
+    request_key,
+    start_trace,
+    stream_image_pipeline,
+    trace_id_var,
+    vision_clients,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arranque: warmup de los modelos en segundo plano (si
+    MODEL_WARMUP_ON_STARTUP) y workers de la cola de búsquedas. Parada: la
+    cola, el pool de inferencia y los clientes HTTP compartidos.
+    """
+    if MODEL_WARMUP_ON_STARTUP:
+        model_registry.start_warmup()
+    await job_manager.start()
+    try:
+        yield
+    finally:
+        await job_manager.stop()
+        inference_executor.shutdown(wait=False)
+        await close_http_client()
+        await vision_clients.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Tiempo máximo de espera (long polling) en GET /api/results/{search_id}
+MAX_RESULT_WAIT_SECONDS = 30
 
-app = FastAPI()
+# Canales de progreso por búsqueda (WebSocket /ws/{search_id})
+progress_hub = ProgressHub(PROGRESS_QUEUE_SIZE)
 
-# Crear directorios necesarios si no existen
-os.makedirs("input", exist_ok=True)
-os.makedirs("output", exist_ok=True)
+# Búsquedas idénticas (misma imagen, prompt y top_k) en vuelo a la vez se
+# ejecutan una sola vez y comparten resultado y progreso
+search_flights = SingleFlight()
+
+job_manager = JobManager(
+    JOB_QUEUE_SIZE,
+    JOB_CONCURRENCY,
+    JOB_RESULT_TTL_SECONDS,
+    on_finish=lambda job: progress_hub.close(job.id, job.to_dict()),
+)
 
 # Configurar CORS
 app.add_middleware(
@@ -18,60 +92,397 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 
-# Almacenar conexiones WebSocket activas
-active_connections: List[WebSocket] = []
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Asigna a cada petición un id de traza (X-Trace-Id o uno nuevo)."""
+    trace_id = start_trace(request.headers.get("X-Trace-Id"))
+    response = await call_next(request)
+    response.headers["X-Trace-Id"] = trace_id
+    return response
 
-async def broadcast_progress(message: str):
-    """Envía mensaje a todas las conexiones activas"""
-    for connection in active_connections:
-        await connection.send_json({"progress": message})
 
+@app.get("/health/ready")
+async def readiness():
+    """
+    Responde 200 cuando los modelos están cargados y calentados o, sin warmup
+    al arrancar, mientras la carga perezosa no haya fallado; 503 si la carga
+    falló o el warmup sigue en curso.
+    """
+    # Sin warmup los modelos se cargan en la primera petición
+    lazy = not MODEL_WARMUP_ON_STARTUP and model_registry.state == "idle"
+    if model_registry.is_ready or lazy:
+        return {"status": "ready", "models": model_registry.status()}
+    return JSONResponse(
+        status_code=503,
+        content={"status": "not_ready", "models": model_registry.status()},
+    )
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    active_connections.append(websocket)
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Métricas de Prometheus: latencia por etapa, etapas en vuelo, errores por
+    etapa y duración de las llamadas externas.
+    """
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+async def _drain_client(websocket: WebSocket):
+    """Lee (y descarta) mensajes del cliente hasta que se desconecte."""
     try:
         while True:
             await websocket.receive_text()
-    except:
-        active_connections.remove(websocket)
+    except WebSocketDisconnect:
+        pass
 
 
-@app.post("/api/search")
-async def search_object(image: UploadFile, text_prompt: str = Form(...)):
-    safe_filename = os.path.basename(image.filename)
-    temp_image_path = os.path.join("input", f"temp_{safe_filename}")
+@app.websocket("/ws/{search_id}")
+async def search_progress(websocket: WebSocket, search_id: str):
+    """
+    Canal de progreso de una búsqueda. Envía el progreso ya emitido, los nuevos
+    mensajes según se producen y, al terminar, el estado final del trabajo.
+    """
+    await websocket.accept()
+    job = job_manager.get(search_id)
+    if job is None:
+        await websocket.send_json(
+            {"status": "error", "message": "Search not found or expired"}
+        )
+        await websocket.close()
+        return
+
+    backlog = [{"progress": step} for step in job.progress_steps]
+    subscriber = progress_hub.subscribe(search_id, websocket, backlog)
+    if job.is_finished:
+        subscriber.finish(job.to_dict())
 
+    receiver = asyncio.create_task(_drain_client(websocket))
     try:
-        # Paso 1: Guardar imagen
-        with open(temp_image_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-
-        # Procesar imagen usando el pipeline y obtener resultados y mensajes
-        results, progress_steps, segmented_image, segmentation_score = (
-            await process_image_pipeline(
-                image_path=temp_image_path,
+        await asyncio.wait(
+            {receiver, subscriber.task}, return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        receiver.cancel()
+        progress_hub.unsubscribe(search_id, subscriber)
+
+
+@app.post("/api/search", status_code=202)
+async def search_object(
+    image: UploadFile, text_prompt: str = Form(...), top_k: int = Form(1)
+):
+    """
+    Encola la búsqueda y retorna su `search_id` de inmediato. El resultado se
+    consulta con GET /api/results/{search_id}.
+
+    Con `top_k` > 1 (hasta MULTI_OBJECT_MAX_K) se buscan varios objetos de la
+    imagen y el resultado trae un grupo por objeto en `objects`.
+
+    Si llega una búsqueda idéntica mientras otra sigue en curso, ambas
+    comparten una única ejecución del pipeline (y su progreso).
+    """
+    if not 1 <= top_k <= MULTI_OBJECT_MAX_K:
+        return JSONResponse(
+            status_code=422,
+            content={
+                "status": "error",
+                "message": f"top_k must be between 1 and {MULTI_OBJECT_MAX_K}",
+            },
+        )
+
+    # Leer la imagen en memoria (sin ficheros temporales)
+    image_bytes = await image.read()
+    trace_id = trace_id_var.get()
+
+    async def run_pipeline(report_progress) -> dict:
+        if top_k > 1:
+            objects, _ = await process_multi_object_pipeline(
+                image_bytes=image_bytes,
                 text_prompt=text_prompt,
-                progress_callback=broadcast_progress,
+                progress_callback=report_progress,
+                top_k=top_k,
             )
-        )
+            return {"objects": objects}
 
+        results, _, segmented_image, segmentation_score = await process_image_pipeline(
+            image_bytes=image_bytes,
+            text_prompt=text_prompt,
+            progress_callback=report_progress,
+        )
         return {
-            "status": "success",
             "results": results,
-            "progress_steps": progress_steps,
             "segmented_image": segmented_image,
             "segmentation_score": segmentation_score,
         }
 
-    except Exception as e:
-        await broadcast_progress(f"Error: {str(e)}")
-        return {"status": "error", "message": str(e)}
+    flight_key = request_key(image_bytes, text_prompt, top_k)
+
+    async def run_search(job: Job) -> dict:
+        # El worker del trabajo no hereda el contexto de la petición
+        start_trace(trace_id)
+
+        async def report_progress(message: str):
+            job.progress_steps.append(message)
+            progress_hub.publish(job.id, {"progress": message})
+
+        # Cada petición conserva su search_id; el pipeline se comparte
+        return await search_flights.do(flight_key, run_pipeline, report_progress)
+
+    try:
+        job = job_manager.submit(run_search)
+    except JobQueueFullError as e:
+        return _queue_full_response(e)
+
+    return {"status": job.status, "search_id": job.id}
+
+
+@app.post("/api/search/batch")
+async def search_batch(
+    images: List[UploadFile] = File(...), text_prompts: List[str] = Form(...)
+):
+    """
+    Busca productos para varias imágenes en una sola petición. Se envía un
+    `text_prompts` para todas las imágenes o uno por imagen, en el mismo orden.
+
+    La respuesta es NDJSON: una línea por imagen según va terminando (con su
+    `index` y `filename`) y una línea final con `status: "done"` (o
+    `status: "error"`).
+
+    El lote es un trabajo más de la cola de POST /api/search: con la cola
+    llena se responde 429 y, si el cliente se desconecta, el trabajo se
+    cancela.
+    """
+    if not 1 <= len(images) <= BATCH_MAX_IMAGES:
+        return JSONResponse(
+            status_code=422,
+            content={
+                "status": "error",
+                "message": f"Send between 1 and {BATCH_MAX_IMAGES} images",
+            },
+        )
+    if len(text_prompts) == 1:
+        text_prompts = text_prompts * len(images)
+    elif len(text_prompts) != len(images):
+        return JSONResponse(
+            status_code=422,
+            content={
+                "status": "error",
+                "message": "Send one text prompt, or one per image",
+            },
+        )
+
+    images_bytes = [await image.read() for image in images]
+    filenames = [image.filename for image in images]
+    trace_id = trace_id_var.get()
+    events: asyncio.Queue = asyncio.Queue()
+    disconnected = asyncio.Event()
 
+    async def run_batch() -> dict:
+        completed = 0
+        async for result in process_image_batch(images_bytes, text_prompts):
+            result["filename"] = filenames[result["index"]]
+            completed += result["status"] == "completed"
+            await events.put(result)
+        return {"completed": completed, "failed": len(images_bytes) - completed}
+
+    async def run_search(job: Job) -> dict:
+        start_trace(trace_id)
+        return await _unless_disconnected(run_batch(), disconnected)
+
+    try:
+        job = job_manager.submit(run_search)
+    except JobQueueFullError as e:
+        return _queue_full_response(e)
+
+    def final_line(job: Job) -> dict:
+        if job.status == "completed":
+            return {"status": "done", "search_id": job.id, **job.result}
+        return {"status": "error", "search_id": job.id, "message": job.error}
+
+    async def stream_results():
+        async for line in _job_events(job, events, disconnected, final_line):
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+def _queue_full_response(error: JobQueueFullError) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"status": "error", "message": str(error)},
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+async def _unless_disconnected(awaitable, disconnected: asyncio.Event):
+    """
+    Espera a `awaitable` dentro de un trabajo en streaming. Si el cliente se
+    desconecta antes, lo cancela y el trabajo termina como fallido.
+    """
+    task = asyncio.ensure_future(awaitable)
+    gone = asyncio.create_task(disconnected.wait())
+    try:
+        await asyncio.wait({task, gone}, return_when=asyncio.FIRST_COMPLETED)
     finally:
-        if os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
+        gone.cancel()
+        if not task.done():
+            task.cancel()
+    if not task.done() or task.cancelled():
+        raise RuntimeError("Client disconnected")
+    return task.result()
+
+
+def _format_event(event: dict, use_sse: bool) -> str:
+    if use_sse:
+        return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+    return json.dumps(event) + "\n"
+
+
+async def _job_events(
+    job: Job,
+    events: asyncio.Queue,
+    disconnected: asyncio.Event,
+    final_event: Callable[[Job], dict],
+):
+    """
+    Eventos de un trabajo en streaming según se publican y, al terminar, el
+    que construye `final_event(job)`. Al cerrarse (p. ej. si el cliente se
+    desconecta) marca `disconnected` para cancelar el trabajo.
+    """
+    finished = asyncio.create_task(job.done.wait())
+    try:
+        while True:
+            next_event = asyncio.create_task(events.get())
+            await asyncio.wait({next_event, finished}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                break
+            yield next_event.result()
+        while not events.empty():
+            yield events.get_nowait()
+        yield final_event(job)
+    finally:
+        finished.cancel()
+        disconnected.set()
+
+
+@app.post("/api/search/stream")
+async def search_stream(
+    request: Request, image: UploadFile, text_prompt: str = Form(...)
+):
+    """
+    Búsqueda de un objeto con la respuesta en streaming: cada etapa se envía
+    en cuanto termina, sin esperar a la búsqueda completa.
+
+    Eventos, en orden: "detection" (box y score), "segmentation" (imagen
+    segmentada), "results" (resultados acumulados, uno por cada proveedor que
+    responde o uno si aciertan la caché o el índice local) y "done" con los
+    resultados finales y el `search_id` (o "error"). Entre medias llegan
+    eventos "progress".
+
+    La búsqueda es un trabajo más de la cola de POST /api/search: con la cola
+    llena se responde 429, y dos streams idénticos a la vez comparten una
+    ejecución del pipeline. Si el cliente se desconecta, el trabajo se cancela.
+
+    La respuesta es NDJSON (una línea por evento con su campo `event`) o
+    Server-Sent Events si la petición trae `Accept: text/event-stream`.
+    """
+    image_bytes = await image.read()
+    use_sse = "text/event-stream" in request.headers.get("accept", "")
+    trace_id = trace_id_var.get()
+    events: asyncio.Queue = asyncio.Queue()
+    disconnected = asyncio.Event()
+    # Los streams publican eventos, no mensajes: solo se comparten entre sí
+    flight_key = request_key(image_bytes, text_prompt, "stream")
+
+    async def run_pipeline(publish) -> dict:
+        return await stream_image_pipeline(image_bytes, text_prompt, publish)
+
+    async def run_search(job: Job) -> dict:
+        start_trace(trace_id)
+
+        async def forward(event: dict):
+            if event["event"] == "progress":
+                job.progress_steps.append(event["message"])
+                progress_hub.publish(job.id, {"progress": event["message"]})
+            await events.put(event)
+
+        return await _unless_disconnected(
+            search_flights.do(flight_key, run_pipeline, forward), disconnected
+        )
+
+    try:
+        job = job_manager.submit(run_search)
+    except JobQueueFullError as e:
+        return _queue_full_response(e)
+
+    def final_event(job: Job) -> dict:
+        if job.status == "completed":
+            return {
+                "event": "done",
+                "search_id": job.id,
+                "results": job.result["results"],
+                "segmentation_score": job.result["segmentation_score"],
+            }
+        return {"event": "error", "search_id": job.id, "message": job.error}
+
+    async def stream_events():
+        async for event in _job_events(job, events, disconnected, final_event):
+            yield _format_event(event, use_sse)
+
+    if use_sse:
+        return StreamingResponse(
+            stream_events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    return StreamingResponse(stream_events(), media_type="application/x-ndjson")
+
+
+@app.get("/images/{key}")
+async def get_image(key: str, request: Request):
+    """
+    Sirve un recorte segmentado del almacén de imágenes. La clave es el sha256
+    del contenido, así que la imagen nunca cambia: ETag fuerte, caché inmutable
+    y 304 si el cliente ya la tiene (y la imagen sigue en el almacén).
+    """
+    etag = f'"{key.split(".")[0]}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    not_found = JSONResponse(
+        status_code=404, content={"status": "error", "message": "Image not found"}
+    )
+    if not image_store_key_is_valid(key):
+        return not_found
+
+    if request.headers.get("If-None-Match") == etag:
+        if not await image_store.exists(key):
+            return not_found
+        return Response(status_code=304, headers=headers)
+
+    image_data = await image_store.get(key)
+    if image_data is None:
+        return not_found
+    return Response(image_data, media_type=content_type_for(key), headers=headers)
+
+
+@app.get("/api/results/{search_id}")
+async def get_search_results(search_id: str, wait: float = 0):
+    """
+    Estado y resultado de una búsqueda. Con `wait` > 0 espera hasta ese número
+    de segundos a que termine (long polling).
+    """
+    job = job_manager.get(search_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": "Search not found or expired"},
+        )
+
+    if wait > 0 and not job.is_finished:
+        await job_manager.wait(job, min(wait, MAX_RESULT_WAIT_SECONDS))
+
+    return job.to_dict()
@@ -1,10 +1,226 @@
-import torch
+import os
+import json
+import functools
 
 GROUNDING_DINO_MODEL = "IDEA-Research/grounding-dino-base"
 SAM_CHECKPOINT_PATH = "src/models/sam_vit_b_01ec64.pth"  # Using forward slashes
 SAM_MODEL_TYPE = "vit_b"  # "vit_h", "vit_l", "vit_b", etc.
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+
+@functools.lru_cache(maxsize=None)
+def get_device() -> str:
+    """
+    Dispositivo de inferencia (INFERENCE_DEVICE o CUDA si está disponible);
+    importa torch solo cuando se necesita.
+    """
+    if os.getenv("INFERENCE_DEVICE"):
+        return os.getenv("INFERENCE_DEVICE")
+
+    import torch
+
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def __getattr__(name: str):
+    # `from config import DEVICE` sigue funcionando sin importar torch al cargar
+    # este módulo
+    if name == "DEVICE":
+        return get_device()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 BOX_THRESHOLD = 0.3
 TEXT_THRESHOLD = 0.1
 BUCKET_NAME = "images-bucket"
+
+# Caché de la parte de texto de GroundingDINO: captions tokenizadas y salidas
+# del encoder de texto (BERT) por caption normalizada. 0 la desactiva.
+# DINO_PREWARM_PROMPTS (separados por comas) se precalculan en el warmup.
+DINO_TEXT_CACHE_SIZE = int(os.getenv("DINO_TEXT_CACHE_SIZE", "256"))
+DINO_PREWARM_PROMPTS = [
+    prompt.strip()
+    for prompt in os.getenv(
+        "DINO_PREWARM_PROMPTS", "shoe,sneaker,bag,jacket,dress,hat"
+    ).split(",")
+    if prompt.strip()
+]
+
+# Resolución de trabajo (lado mayor, px) de cada modelo. Las imágenes grandes
+# se decodifican reducidas; la resolución completa solo se usa para el recorte
+# final. Los valores por defecto coinciden con el redimensionado interno de
+# cada modelo (1333 en el processor de GroundingDINO, 1024 en SAM).
+DINO_MAX_SIDE = int(os.getenv("DINO_MAX_SIDE", "1333"))
+SAM_MAX_SIDE = int(os.getenv("SAM_MAX_SIDE", "1024"))
+
+# Codificación del recorte segmentado que se devuelve, se sube y se busca:
+# formato (webp | jpeg | png), tamaño objetivo en bytes (la calidad se ajusta
+# entre MIN y MAX para no superarlo; 0 desactiva el ajuste) y lado mayor
+# máximo en px (0 = sin límite).
+SEGMENTED_IMAGE_FORMAT = os.getenv("SEGMENTED_IMAGE_FORMAT", "webp")
+SEGMENTED_IMAGE_TARGET_BYTES = int(os.getenv("SEGMENTED_IMAGE_TARGET_BYTES", "80000"))
+SEGMENTED_IMAGE_MIN_QUALITY = int(os.getenv("SEGMENTED_IMAGE_MIN_QUALITY", "30"))
+SEGMENTED_IMAGE_MAX_QUALITY = int(os.getenv("SEGMENTED_IMAGE_MAX_QUALITY", "80"))
+SEGMENTED_IMAGE_MAX_SIDE = int(os.getenv("SEGMENTED_IMAGE_MAX_SIDE", "1600"))
+
+# Modo multi-objeto (top_k > 1 en POST /api/search): número máximo de objetos
+# por imagen y umbral de IoU de la NMS entre detecciones (0 desactiva la NMS).
+MULTI_OBJECT_MAX_K = int(os.getenv("MULTI_OBJECT_MAX_K", "8"))
+DINO_NMS_IOU_THRESHOLD = float(os.getenv("DINO_NMS_IOU_THRESHOLD", "0.5"))
+
+# Búsqueda por lotes (POST /api/search/batch): máximo de imágenes por petición
+# y de subidas/búsquedas en Lens simultáneas. GroundingDINO procesa las
+# imágenes en lotes de DINO_BATCH_MAX_SIZE.
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "32"))
+BATCH_SEARCH_CONCURRENCY = int(os.getenv("BATCH_SEARCH_CONCURRENCY", "4"))
+
+# Backend de inferencia: "pytorch" (precisión completa) o "int8" (cuantización
+# dinámica de las capas lineales, solo CPU). Hilos de PyTorch en CPU
+# (intra-op e inter-op); 0 deja los valores por defecto de PyTorch.
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "pytorch")
+INFERENCE_NUM_THREADS = int(os.getenv("INFERENCE_NUM_THREADS", "0"))
+INFERENCE_INTEROP_THREADS = int(os.getenv("INFERENCE_INTEROP_THREADS", "0"))
+
+# Perfiles de ejecución de GroundingDINO y SAM. Cada perfil combina:
+#   inference_mode: torch.inference_mode en lugar de torch.no_grad
+#   autocast: "float16" | "bfloat16" (autocast de precisión reducida)
+#   channels_last: formato de memoria NHWC para las convoluciones
+#   compile: torch.compile de DINO y del encoder de imagen de SAM
+#   num_threads: hilos intra-op de PyTorch (0 = sin cambios)
+#   devices: dispositivos en los que tiene sentido (por defecto todos)
+# EXECUTION_PROFILES_JSON añade o sustituye perfiles ({"nombre": {...}}).
+# EXECUTION_PROFILE elige uno por nombre, o "auto" para medir en el warmup los
+# de AUTOTUNE_PROFILES (vacío = todos) sobre una imagen de calibración
+# (AUTOTUNE_IMAGE_PATH o una sintética) y quedarse con el más rápido cuya box
+# de DINO y máscara de SAM tengan IoU >= AUTOTUNE_MIN_IOU respecto a "fp32".
+EXECUTION_PROFILES = {
+    "fp32": {},
+    "inference": {"inference_mode": True},
+    "bf16": {"inference_mode": True, "autocast": "bfloat16"},
+    "compiled": {"inference_mode": True, "compile": True},
+    "fp16": {
+        "inference_mode": True,
+        "autocast": "float16",
+        "channels_last": True,
+        "devices": ["cuda"],
+    },
+    "fp16-compiled": {
+        "inference_mode": True,
+        "autocast": "float16",
+        "channels_last": True,
+        "compile": True,
+        "devices": ["cuda"],
+    },
+}
+EXECUTION_PROFILES.update(json.loads(os.getenv("EXECUTION_PROFILES_JSON", "{}")))
+EXECUTION_PROFILE = os.getenv("EXECUTION_PROFILE", "fp32")
+AUTOTUNE_PROFILES = [
+    name.strip()
+    for name in os.getenv("AUTOTUNE_PROFILES", "").split(",")
+    if name.strip()
+]
+AUTOTUNE_ITERATIONS = int(os.getenv("AUTOTUNE_ITERATIONS", "3"))
+AUTOTUNE_MIN_IOU = float(os.getenv("AUTOTUNE_MIN_IOU", "0.9"))
+AUTOTUNE_IMAGE_PATH = os.getenv("AUTOTUNE_IMAGE_PATH") or None
+
+# Pool de inferencia: hilos dedicados a GroundingDINO/SAM y tamaño máximo de la
+# cola de tareas pendientes. Los pipelines usan run_when_available: un trabajo
+# ya admitido por la cola de búsquedas espera a que quede hueco en lugar de
+# fallar (InferenceExecutor.run lanza InferenceQueueFullError con la cola llena).
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "4"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "16"))
+
+# Micro-batching de GroundingDINO: agrupa peticiones concurrentes durante como
+# máximo DINO_BATCH_MAX_WAIT_MS o hasta DINO_BATCH_MAX_SIZE imágenes.
+# Con DINO_BATCH_MAX_SIZE = 1 se desactiva el scheduler.
+# DINO_BATCH_RESULT_TIMEOUT_SECONDS: espera máxima de cada petición a su lote.
+DINO_BATCH_MAX_SIZE = int(os.getenv("DINO_BATCH_MAX_SIZE", "8"))
+DINO_BATCH_MAX_WAIT_MS = float(os.getenv("DINO_BATCH_MAX_WAIT_MS", "10"))
+DINO_BATCH_RESULT_TIMEOUT_SECONDS = float(
+    os.getenv("DINO_BATCH_RESULT_TIMEOUT_SECONDS", "120")
+)
+
+# Caché de embeddings de SAM (bytes). 0 desactiva la caché.
+SAM_EMBEDDING_CACHE_BYTES = int(
+    os.getenv("SAM_EMBEDDING_CACHE_BYTES", str(256 * 1024 * 1024))
+)
+
+# Carga de modelos en segundo plano al arrancar la app, con un forward pass de
+# prueba. Si se desactiva, los modelos se cargan en la primera petición.
+MODEL_WARMUP_ON_STARTUP = os.getenv("MODEL_WARMUP_ON_STARTUP", "1") == "1"
+
+# Servidor de modelos compartido (uvicorn con varios workers). Con
+# MODEL_SERVER_ADDRESS (ruta de un socket Unix, o "127.0.0.1:puerto": solo se
+# admite loopback) los workers no cargan GroundingDINO ni SAM: envían la
+# inferencia al proceso `python src/model_server.py`, que escucha en esa
+# dirección en la misma máquina. Imágenes y máscaras viajan en memoria
+# compartida. MODEL_SERVER_AUTHKEY es el secreto compartido que autentica las
+# conexiones (obligatorio, sin valor por defecto: las peticiones se
+# deserializan con pickle) y MODEL_SERVER_TIMEOUT_SECONDS limita cada llamada.
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS", "")
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY", "").encode()
+MODEL_SERVER_TIMEOUT_SECONDS = float(os.getenv("MODEL_SERVER_TIMEOUT_SECONDS", "120"))
+
+# Cliente HTTP asíncrono compartido (Supabase Storage)
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_RETRY_BACKOFF_SECONDS = float(os.getenv("HTTP_RETRY_BACKOFF_SECONDS", "0.5"))
+
+# Almacén de recortes segmentados direccionado por contenido (la clave es el
+# sha256 de los bytes codificados). Backend "supabase" (bucket BUCKET_NAME y
+# URL firmada válida IMAGE_STORE_SIGNED_URL_SECONDS) o "local" (directorio
+# IMAGE_STORE_DIR, servido por GET /images/{key}). Con "local", PUBLIC_BASE_URL
+# es la URL pública de esta API, que deben poder alcanzar los proveedores de
+# búsqueda.
+IMAGE_STORE_BACKEND = os.getenv("IMAGE_STORE_BACKEND", "supabase")
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "data/images")
+IMAGE_STORE_SIGNED_URL_SECONDS = int(
+    os.getenv("IMAGE_STORE_SIGNED_URL_SECONDS", "3600")
+)
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+
+# Caché de resultados de Google Lens por hash perceptual (dHash) del recorte y
+# text prompt normalizado. Dos recortes buscados con el mismo prompt se
+# consideran el mismo producto si la distancia de Hamming entre sus hashes es
+# <= SEARCH_CACHE_MAX_DISTANCE. Con SEARCH_CACHE_SQLITE_PATH la
+# caché persiste entre reinicios.
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024"))
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "21600"))
+SEARCH_CACHE_MAX_DISTANCE = int(os.getenv("SEARCH_CACHE_MAX_DISTANCE", "6"))
+SEARCH_CACHE_SQLITE_PATH = os.getenv("SEARCH_CACHE_SQLITE_PATH") or None
+
+# Índice visual local (descriptores de color/forma de los recortes ya
+# buscados y sus resultados): directorio del índice (vacío = desactivado) y
+# similitud coseno mínima para servir los resultados sin llamar a los
+# proveedores externos. Los workers de un mismo host pueden compartir el
+# directorio (las escrituras se serializan con flock); no usar un disco de red.
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "")
+LOCAL_INDEX_MIN_SIMILARITY = float(os.getenv("LOCAL_INDEX_MIN_SIMILARITY", "0.97"))
+
+# Búsqueda visual multi-proveedor: proveedores activos (lens, product_search,
+# web_detection, separados por comas), límite global en segundos, margen
+# adicional para el resto una vez que uno responde con resultados (negativo =
+# esperar hasta el límite) y número de resultados tras unir y deduplicar.
+SEARCH_PROVIDERS = [
+    name.strip()
+    for name in os.getenv("SEARCH_PROVIDERS", "lens").split(",")
+    if name.strip()
+]
+SEARCH_DEADLINE_SECONDS = float(os.getenv("SEARCH_DEADLINE_SECONDS", "8"))
+SEARCH_HEDGE_SECONDS = float(os.getenv("SEARCH_HEDGE_SECONDS", "1.5"))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "10"))
+
+# Clientes de Google Cloud Vision compartidos: segundos de antelación con los
+# que se renueva el token de acceso antes de que caduque.
+VISION_CREDENTIALS_REFRESH_MARGIN_SECONDS = float(
+    os.getenv("VISION_CREDENTIALS_REFRESH_MARGIN_SECONDS", "300")
+)
+
+# Trabajos de búsqueda asíncronos (POST /api/search -> GET /api/results/{id})
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "64"))
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "600"))
+
+# Mensajes de progreso pendientes por WebSocket suscrito; al llenarse se
+# descarta el más antiguo.
+PROGRESS_QUEUE_SIZE = int(os.getenv("PROGRESS_QUEUE_SIZE", "32"))
@@ -1,86 +1,336 @@
 import sys
 import os
 import base64
+import asyncio
+import collections
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator
 
-from src.modules.search.load_to_supabase import load_to_supabase
+import numpy as np
 
 current_dir = os.path.dirname(__file__)
 sys.path.append(current_dir)
 
-from PIL import Image
-from modules.search.google_lens_search import search_similar_product_online
-from modules.segmentation.grounding_dino import get_grounding_dino_boxes
+from modules.search.http_clients import close_http_client
+from modules.search.local_index import compute_descriptor, local_index
+from modules.search.search_cache import compute_dhash, lens_search_cache
+from modules.search.search_orchestrator import search_orchestrator
+from modules.search.vision_clients import vision_clients
+from modules.storage.image_store import (
+    content_type_for,
+    image_store,
+    is_valid_key as image_store_key_is_valid,
+)
+from modules.jobs.job_manager import Job, JobManager, JobQueueFullError
+from modules.jobs.progress_hub import ProgressHub
+from modules.jobs.single_flight import SingleFlight, request_key
+from modules.observability.tracing import (
+    render_metrics,
+    stage_span,
+    start_trace,
+    trace_id_var,
+)
+from modules.segmentation.grounding_dino import (
+    get_grounding_dino_boxes,
+    get_grounding_dino_boxes_batch,
+    get_grounding_dino_detections,
+)
+from modules.segmentation.model_registry import model_registry
+from modules.segmentation.preprocessing import PreparedImage, scale_box
 from modules.segmentation.sam_segmentation import (
-    save_optimized_segmented_image,
+    encode_segmented_image,
+    segment_boxes_with_sam,
     segment_with_sam,
+    segmented_image_encoder,
 )
-from config import BOX_THRESHOLD, TEXT_THRESHOLD, BUCKET_NAME
+from config import (
+    BOX_THRESHOLD,
+    TEXT_THRESHOLD,
+    INFERENCE_WORKERS,
+    INFERENCE_QUEUE_SIZE,
+    DINO_MAX_SIDE,
+    SAM_MAX_SIDE,
+    DINO_NMS_IOU_THRESHOLD,
+    DINO_BATCH_MAX_SIZE,
+    BATCH_SEARCH_CONCURRENCY,
+)
+
+
+class InferenceQueueFullError(RuntimeError):
+    """Se lanza cuando la cola del pool de inferencia está llena."""
+
+
+class InferenceExecutor:
+    """
+    Pool de hilos dedicado a la inferencia de GroundingDINO y SAM.
+
+    Los modelos se cargan una sola vez por proceso y se comparten entre los hilos
+    (PyTorch libera el GIL durante la inferencia). La cola está acotada: como
+    máximo `max_workers + max_queue_size` tareas en vuelo; a partir de ahí `run`
+    lanza `InferenceQueueFullError` en lugar de acumular trabajo sin límite, y
+    `run_when_available` espera a que quede hueco.
+    """
+
+    def __init__(self, max_workers: int, max_queue_size: int):
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="inference"
+        )
+        self._pending = 0  # Solo se modifica desde el event loop
+        self._waiters: collections.deque[asyncio.Future] = collections.deque()
+
+    @property
+    def pending(self) -> int:
+        """Número de tareas en ejecución o esperando un hilo libre."""
+        return self._pending
+
+    @property
+    def is_full(self) -> bool:
+        return self._pending >= self.max_workers + self.max_queue_size
+
+    async def run(self, func, *args, **kwargs):
+        """Ejecuta `func` en el pool sin bloquear el event loop."""
+        if self.is_full:
+            raise InferenceQueueFullError("Inference queue is full, try again later")
+        return await self._submit(func, *args, **kwargs)
+
+    async def run_when_available(self, func, *args, **kwargs):
+        """Como `run`, pero si la cola está llena espera a que quede hueco."""
+        loop = asyncio.get_running_loop()
+        while self.is_full:
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        return await self._submit(func, *args, **kwargs)
+
+    async def _submit(self, func, *args, **kwargs):
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # Propaga el contexto (p. ej. el id de traza) al hilo del pool
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(context.run, func, *args, **kwargs)
+            )
+        finally:
+            self._pending -= 1
+            # Despierta al primer llamante que sigue esperando hueco
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    break
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+inference_executor = InferenceExecutor(INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE)
+
+
+def _prepare_image(image_bytes: bytes) -> PreparedImage:
+    return PreparedImage(image_bytes, DINO_MAX_SIDE, SAM_MAX_SIDE)
+
+
+def _encode_full_resolution_crop(prepared: PreparedImage, mask) -> bytes:
+    cropped_image, cropped_mask = prepared.full_resolution_crop(mask)
+    return encode_segmented_image(cropped_image, cropped_mask)
+
+
+def _encode_full_resolution_crops(prepared: PreparedImage, masks) -> list[bytes]:
+    # El original a resolución completa se decodifica una sola vez para todos
+    # los recortes
+    return [
+        encode_segmented_image(cropped_image, cropped_mask)
+        for cropped_image, cropped_mask in prepared.full_resolution_crops(masks)
+    ]
+
+
+async def _search_similar_products(
+    segmented_bytes: bytes, score: float, prompt: str, report, on_partial=None
+) -> dict:
+    """
+    Busca productos similares a un recorte segmentado: caché por hash
+    perceptual, índice visual local (LOCAL_INDEX_DIR) y, si no hay acierto,
+    una única escritura en el almacén de imágenes (IMAGE_STORE_BACKEND) y
+    búsqueda en los proveedores configurados (SEARCH_PROVIDERS) con la URL
+    pública del recorte. Los resultados externos se añaden al índice local.
+    `on_partial(results, source)` recibe los resultados según responde cada
+    proveedor, o una vez con los de la caché o el índice local si aciertan.
+    """
+
+    async def partial(results: list, source: str):
+        if on_partial is not None:
+            await on_partial(results, source)
+
+    # Si un recorte casi idéntico se buscó hace poco con el mismo prompt, se
+    # reutilizan sus resultados y se evitan la subida y la llamada a SerpAPI
+    with stage_span("search_cache"):
+        phash = await asyncio.to_thread(compute_dhash, segmented_bytes)
+        search_results = lens_search_cache.get(phash, prompt)
+    if search_results is not None:
+        await report("Found cached results for a similar image")
+        await partial(search_results, "cache")
+        return search_results
+
+    # Productos parecidos ya buscados antes (sin llamadas externas)
+    descriptor = None
+    if local_index is not None:
+        with stage_span("local_index"):
+            descriptor = await asyncio.to_thread(compute_descriptor, segmented_bytes)
+            search_results = await asyncio.to_thread(
+                local_index.lookup, descriptor, prompt
+            )
+        if search_results is not None:
+            await report("Found results for a similar product in the local index")
+            lens_search_cache.put(phash, search_results, prompt)
+            await partial(search_results, "local_index")
+            return search_results
+
+    # 4) Guardar el recorte (una sola vez por contenido) y obtener su URL
+    await report("Uploading segmented image...")
+    with stage_span("upload"):
+        image_key = await image_store.put(
+            segmented_bytes,
+            segmented_image_encoder.mime_type,
+            {"score": score, "text_prompt": prompt},
+        )
+        image_url = await image_store.public_url(image_key)
+    await report("Image uploaded successfully")
+
+    # 5) Buscar productos similares
+    await report("Searching for similar products...")
+    with stage_span("search"):
+        search_results = await search_orchestrator.search(image_url, on_partial)
+    if search_results:
+        lens_search_cache.put(phash, search_results, prompt)
+        if descriptor is not None:
+            await asyncio.to_thread(local_index.add, descriptor, search_results, prompt)
+    await report("Search completed successfully")
+    return search_results
+
+
+def _data_uri(segmented_bytes: bytes) -> str:
+    segmented_base64 = base64.b64encode(segmented_bytes).decode("utf-8")
+    return f"data:{segmented_image_encoder.mime_type};base64,{segmented_base64}"
 
 
 async def process_image_pipeline(
-    image_path: str, text_prompt: str, progress_callback
+    image_bytes: bytes, text_prompt: str, progress_callback, event_callback=None
 ) -> tuple[dict, list[str], str, float]:
-    """Procesa una imagen a través del pipeline completo."""
+    """
+    Procesa una imagen a través del pipeline completo.
+
+    La imagen viaja en memoria entre etapas: se decodifica desde los bytes
+    subidos a la resolución de trabajo de cada modelo (DINO_MAX_SIDE,
+    SAM_MAX_SIDE), y solo el recorte final se toma de la resolución completa.
+    La imagen segmentada se codifica una sola vez y se reutiliza para la
+    respuesta, la subida y la búsqueda.
+
+    La inferencia se ejecuta en `inference_executor` y el resto de pasos
+    bloqueantes (codificación y búsqueda) en el pool por defecto, de
+    modo que el event loop queda libre para otras peticiones y WebSockets.
+
+    Cada etapa se mide con `stage_span` (métricas en /metrics y log con el id
+    de traza de la petición).
+
+    Si se indica, `event_callback` recibe el resultado de cada etapa en cuanto
+    está listo: "detection" (box en coordenadas de la imagen original),
+    "segmentation" (recorte y score) y "results" (resultados parciales).
+    """
 
     progress_steps = []  # Lista para almacenar los pasos
 
+    async def emit(event: dict):
+        if event_callback is not None:
+            await event_callback(event)
+
     try:
         # 1) Cargar imagen
         await progress_callback("Loading image...")
         progress_steps.append("Loading image...")
-        image_pil = Image.open(image_path).convert("RGB")
+        with stage_span("decode"):
+            prepared = await asyncio.to_thread(_prepare_image, image_bytes)
         await progress_callback("Image loaded successfully")
         progress_steps.append("Image loaded successfully")
 
         # 2) Obtener bounding box
         await progress_callback("Detecting object in image...")
         progress_steps.append("Detecting object in image...")
-        best_box, best_score, used_prompt = get_grounding_dino_boxes(
-            image=image_pil,
-            text_prompt=text_prompt,
-            box_threshold=BOX_THRESHOLD,
-            text_threshold=TEXT_THRESHOLD,
-        )
+        with stage_span("dino"):
+            best_box, best_score, used_prompt = await inference_executor.run_when_available(
+                get_grounding_dino_boxes,
+                image=prepared.dino_image,
+                text_prompt=text_prompt,
+                box_threshold=BOX_THRESHOLD,
+                text_threshold=TEXT_THRESHOLD,
+            )
         progress_msg = f"Object detected with confidence score: {best_score:.2f}"
         await progress_callback(progress_msg)
         progress_steps.append(progress_msg)
+        await emit(
+            {
+                "event": "detection",
+                "box": [
+                    round(float(v), 1)
+                    for v in scale_box(
+                        best_box, prepared.dino_image.size, prepared.full_size
+                    )
+                ],
+                "detection_score": float(best_score),
+                "label": used_prompt,
+            }
+        )
 
         # 3) Segmentar con SAM
         await progress_callback("Segmenting object from background...")
         progress_steps.append("Segmenting object from background...")
-        mask, segmentation_score = segment_with_sam(image_pil, best_box)
-        segmented_path = "output/segmented_object.webp"
-        save_optimized_segmented_image(image_pil, mask, segmented_path)
+        with stage_span("sam"):
+            mask, segmentation_score = await inference_executor.run_when_available(
+                segment_with_sam,
+                prepared.sam_image,
+                prepared.dino_box_to_sam(best_box),
+            )
+        with stage_span("encode"):
+            segmented_bytes = await asyncio.to_thread(
+                _encode_full_resolution_crop, prepared, mask
+            )
         progress_msg = (
             f"Object segmented successfully with confidence: {segmentation_score:.2%}"
         )
         await progress_callback(progress_msg)
         progress_steps.append(progress_msg)
+        segmented_image = _data_uri(segmented_bytes)
+        await emit(
+            {
+                "event": "segmentation",
+                "segmented_image": segmented_image,
+                "segmentation_score": segmentation_score,
+            }
+        )
 
-        # Convertir la imagen segmentada a base64
-        with open(segmented_path, "rb") as image_file:
-            segmented_base64 = base64.b64encode(image_file.read()).decode("utf-8")
+        async def report(message: str):
+            await progress_callback(message)
+            progress_steps.append(message)
 
-        # 4) Subir a Supabase y obtener URL
-        await progress_callback("Uploading segmented image...")
-        progress_steps.append("Uploading segmented image...")
-        imgur_url = load_to_supabase(
-            segmented_path, BUCKET_NAME, best_score, used_prompt
-        )
-        await progress_callback("Image uploaded successfully")
-        progress_steps.append("Image uploaded successfully")
+        async def partial_results(results: list[dict], source: str):
+            await emit({"event": "results", "source": source, "results": results})
 
-        # 5) Buscar productos similares
-        await progress_callback("Searching for similar products...")
-        progress_steps.append("Searching for similar products...")
-        search_results = search_similar_product_online(imgur_url)
-        await progress_callback("Search completed successfully")
-        progress_steps.append("Search completed successfully")
+        search_results = await _search_similar_products(
+            segmented_bytes, best_score, used_prompt, report, partial_results
+        )
 
         return (
             search_results,
             progress_steps,
-            f"data:image/webp;base64,{segmented_base64}",
+            segmented_image,
             segmentation_score,
         )
 
@@ -89,3 +339,219 @@ async def process_image_pipeline(
         await progress_callback(error_msg)
         progress_steps.append(error_msg)
         raise
+
+
+async def stream_image_pipeline(image_bytes: bytes, text_prompt: str, publish) -> dict:
+    """
+    Ejecuta `process_image_pipeline` y pasa a `publish` cada evento en cuanto
+    está listo: "progress", "detection", "segmentation" y "results"
+    (parciales). Retorna el resultado final, como el de POST /api/search.
+    """
+
+    async def on_progress(message: str):
+        await publish({"event": "progress", "message": message})
+
+    results, _, segmented_image, segmentation_score = await process_image_pipeline(
+        image_bytes, text_prompt, on_progress, publish
+    )
+    return {
+        "results": results,
+        "segmented_image": segmented_image,
+        "segmentation_score": segmentation_score,
+    }
+
+
+async def process_multi_object_pipeline(
+    image_bytes: bytes, text_prompt: str, progress_callback, top_k: int
+) -> tuple[list[dict], list[str]]:
+    """
+    Variante de `process_image_pipeline` para fotos con varios productos.
+
+    Detecta hasta `top_k` objetos (con NMS si DINO_NMS_IOU_THRESHOLD > 0), los
+    segmenta todos con una sola pasada del encoder de SAM y busca cada recorte
+    de forma concurrente. Retorna un grupo por objeto, con 'label',
+    'detection_score', 'segmentation_score', 'segmented_image' y 'results',
+    y la lista de pasos de progreso.
+    """
+    progress_steps = []
+
+    async def report(message: str):
+        await progress_callback(message)
+        progress_steps.append(message)
+
+    try:
+        await report("Loading image...")
+        with stage_span("decode"):
+            prepared = await asyncio.to_thread(_prepare_image, image_bytes)
+        await report("Image loaded successfully")
+
+        await report("Detecting objects in image...")
+        with stage_span("dino"):
+            detections = await inference_executor.run_when_available(
+                get_grounding_dino_detections,
+                image=prepared.dino_image,
+                text_prompt=text_prompt,
+                box_threshold=BOX_THRESHOLD,
+                text_threshold=TEXT_THRESHOLD,
+                top_k=top_k,
+                nms_iou_threshold=DINO_NMS_IOU_THRESHOLD,
+            )
+        await report(f"Detected {len(detections)} object(s)")
+        if not detections:
+            return [], progress_steps
+
+        await report("Segmenting objects from background...")
+        boxes = np.stack([detection["box"] for detection in detections])
+        with stage_span("sam"):
+            masks, segmentation_scores = await inference_executor.run_when_available(
+                segment_boxes_with_sam,
+                prepared.sam_image,
+                prepared.dino_box_to_sam(boxes),
+            )
+        # Una máscara vacía no se puede recortar
+        kept = [i for i in range(len(detections)) if masks[i].any()]
+        with stage_span("encode"):
+            segmented_images = await asyncio.to_thread(
+                _encode_full_resolution_crops, prepared, [masks[i] for i in kept]
+            )
+        await report(f"Segmented {len(kept)} object(s) successfully")
+
+        async def search_object(position: int, index: int, segmented_bytes: bytes):
+            detection = detections[index]
+
+            async def report_object(message: str):
+                await report(f"[object {position + 1}/{len(kept)}] {message}")
+
+            results = await _search_similar_products(
+                segmented_bytes, detection["score"], detection["label"], report_object
+            )
+            return {
+                "label": detection["label"],
+                # En coordenadas de la imagen original
+                "box": [
+                    round(float(v), 1)
+                    for v in scale_box(
+                        detection["box"], prepared.dino_image.size, prepared.full_size
+                    )
+                ],
+                "detection_score": detection["score"],
+                "segmentation_score": float(segmentation_scores[index]),
+                "segmented_image": _data_uri(segmented_bytes),
+                "results": results,
+            }
+
+        objects = await asyncio.gather(
+            *(
+                search_object(position, index, segmented_bytes)
+                for position, (index, segmented_bytes) in enumerate(
+                    zip(kept, segmented_images)
+                )
+            )
+        )
+        return list(objects), progress_steps
+
+    except Exception as e:
+        await report(f"Error: {str(e)}")
+        raise
+
+
+async def process_image_batch(
+    images: list[bytes], text_prompts: list[str]
+) -> AsyncIterator[dict]:
+    """
+    Procesa un lote de imágenes y produce el resultado de cada una según
+    termina (no en el orden de entrada).
+
+    Las imágenes avanzan en bloques de DINO_BATCH_MAX_SIZE: cada bloque se
+    decodifica en paralelo y pasa por GroundingDINO en un único forward pass
+    con padding. Después cada imagen se segmenta y se busca por su cuenta, con
+    como mucho INFERENCE_WORKERS segmentaciones y BATCH_SEARCH_CONCURRENCY
+    subidas/búsquedas simultáneas, mientras el siguiente bloque se detecta.
+
+    Cada resultado trae 'index' (posición en la entrada) y 'status'
+    ('completed' o 'failed').
+    """
+    results: asyncio.Queue = asyncio.Queue()
+    # Reparto justo del pool: un lote no ocupa más de INFERENCE_WORKERS hilos
+    inference_slots = asyncio.Semaphore(INFERENCE_WORKERS)
+    search_slots = asyncio.Semaphore(BATCH_SEARCH_CONCURRENCY)
+    chunk_size = max(1, DINO_BATCH_MAX_SIZE)
+
+    async def no_progress(message: str):
+        pass
+
+    async def segment_and_search(index: int, prepared: PreparedImage, detection):
+        try:
+            if detection is None:
+                raise ValueError("No object matching the prompt was detected")
+            best_box, best_score, used_prompt = detection
+            async with inference_slots:
+                with stage_span("sam"):
+                    mask, segmentation_score = await inference_executor.run_when_available(
+                        segment_with_sam,
+                        prepared.sam_image,
+                        prepared.dino_box_to_sam(best_box),
+                    )
+                with stage_span("encode"):
+                    segmented_bytes = await asyncio.to_thread(
+                        _encode_full_resolution_crop, prepared, mask
+                    )
+            async with search_slots:
+                search_results = await _search_similar_products(
+                    segmented_bytes, float(best_score), used_prompt, no_progress
+                )
+            await results.put(
+                {
+                    "index": index,
+                    "status": "completed",
+                    "results": search_results,
+                    "segmented_image": _data_uri(segmented_bytes),
+                    "segmentation_score": segmentation_score,
+                }
+            )
+        except Exception as e:
+            await results.put({"index": index, "status": "failed", "message": str(e)})
+
+    async def decode(index: int):
+        try:
+            with stage_span("decode"):
+                return await asyncio.to_thread(_prepare_image, images[index])
+        except Exception as e:
+            await results.put({"index": index, "status": "failed", "message": str(e)})
+            return None
+
+    async def produce():
+        for start in range(0, len(images), chunk_size):
+            indices = range(start, min(start + chunk_size, len(images)))
+            prepared = await asyncio.gather(*(decode(i) for i in indices))
+            chunk = [(i, p) for i, p in zip(indices, prepared) if p is not None]
+            if not chunk:
+                continue
+            try:
+                with stage_span("dino"):
+                    detections = await inference_executor.run_when_available(
+                        get_grounding_dino_boxes_batch,
+                        [p.dino_image for _, p in chunk],
+                        [text_prompts[i] for i, _ in chunk],
+                        BOX_THRESHOLD,
+                        TEXT_THRESHOLD,
+                    )
+            except Exception as e:
+                for i, _ in chunk:
+                    await results.put(
+                        {"index": i, "status": "failed", "message": str(e)}
+                    )
+                continue
+            for (i, p), detection in zip(chunk, detections):
+                tasks.append(asyncio.create_task(segment_and_search(i, p, detection)))
+
+    tasks: list[asyncio.Task] = []
+    producer = asyncio.create_task(produce())
+    try:
+        for _ in range(len(images)):
+            yield await results.get()
+    finally:
+        # Si el cliente se desconecta se cancela el trabajo pendiente
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
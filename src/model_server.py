@@ -0,0 +1,24 @@
+"""
+Servidor de modelos: carga GroundingDINO y SAM una vez y atiende la inferencia
+de todos los workers de la API (ver MODEL_SERVER_ADDRESS en config.py).
+
+Uso (MODEL_SERVER_AUTHKEY con el mismo secreto en ambos procesos):
+    export MODEL_SERVER_AUTHKEY=$(openssl rand -hex 32)
+    MODEL_SERVER_ADDRESS=/tmp/want-that-models.sock python src/model_server.py
+    MODEL_SERVER_ADDRESS=/tmp/want-that-models.sock uvicorn src.app:app --workers 4
+"""
+import sys
+import os
+import logging
+
+current_dir = os.path.dirname(__file__)
+sys.path.append(current_dir)
+
+from config import MODEL_SERVER_ADDRESS, MODEL_SERVER_AUTHKEY
+from modules.segmentation.model_server import serve
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if not MODEL_SERVER_ADDRESS:
+        sys.exit("Set MODEL_SERVER_ADDRESS to the address the model server listens on")
+    serve(MODEL_SERVER_ADDRESS, MODEL_SERVER_AUTHKEY)
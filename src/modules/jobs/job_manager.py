@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import math
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFullError(RuntimeError):
+    """Se lanza al encolar un trabajo cuando la cola está llena."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Search queue is full, try again later")
+        self.retry_after = retry_after
+
+
+class Job:
+    """Estado de un trabajo de búsqueda: queued -> running -> completed | failed."""
+
+    def __init__(self, handler: Callable[["Job"], Awaitable[dict]]):
+        self.id = uuid.uuid4().hex
+        self.handler = handler
+        self.status = "queued"
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.progress_steps: list[str] = []
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> dict:
+        data = {
+            "search_id": self.id,
+            "status": self.status,
+            "progress_steps": self.progress_steps,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if self.result is not None:
+            data.update(self.result)
+        if self.error is not None:
+            data["message"] = self.error
+        return data
+
+
+class JobManager:
+    """
+    Cola acotada de trabajos con un número fijo de workers asíncronos.
+
+    `submit` retorna inmediatamente con el trabajo encolado o lanza
+    `JobQueueFullError` si la cola está llena. Los trabajos terminados se
+    conservan `result_ttl_seconds` para poder consultarlos y después se eliminan.
+    Si se indica, `on_finish(job)` se llama al terminar cada trabajo.
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int,
+        concurrency: int,
+        result_ttl_seconds: float,
+        on_finish: Optional[Callable[[Job], None]] = None,
+    ):
+        self.max_queue_size = max_queue_size
+        self.concurrency = concurrency
+        self.result_ttl_seconds = result_ttl_seconds
+        self.on_finish = on_finish
+        self._jobs: dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._avg_duration = 5.0  # Media móvil de la duración de los trabajos (s)
+
+    async def start(self):
+        """Crea la cola y lanza los workers en el event loop actual."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, handler: Callable[[Job], Awaitable[dict]]) -> Job:
+        """Encola un trabajo; `handler(job)` debe retornar el resultado (dict)."""
+        self._purge_expired()
+        job = Job(handler)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFullError(self.retry_after())
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._purge_expired()
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """Espera como máximo `timeout` segundos a que el trabajo termine."""
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    def retry_after(self) -> int:
+        """Segundos estimados hasta que la cola tenga hueco."""
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return max(1, math.ceil(self._avg_duration * queued / self.concurrency))
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": sum(job.status == "running" for job in self._jobs.values()),
+            "retained": len(self._jobs),
+            "max_queue_size": self.max_queue_size,
+            "concurrency": self.concurrency,
+        }
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = await job.handler(job)
+                job.status = "completed"
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Job cancelled"
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {str(e)}")
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                job.handler = None  # Libera la imagen retenida por el closure
+                job.done.set()
+                if self.on_finish is not None:
+                    self.on_finish(job)
+                self._queue.task_done()
+                duration = job.finished_at - job.started_at
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.result_ttl_seconds
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.is_finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
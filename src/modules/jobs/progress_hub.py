@@ -0,0 +1,97 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Marca de fin de canal: el sender cierra el WebSocket al recibirla
+_CLOSE = object()
+
+
+class Subscriber:
+    """WebSocket suscrito a un trabajo, con su propia cola de envío acotada."""
+
+    def __init__(self, websocket, max_queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self.task = None
+
+    def offer(self, message):
+        """Encola sin bloquear; si la cola está llena descarta el mensaje más antiguo."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    def finish(self, message: dict):
+        """Envía un último mensaje y cierra el canal."""
+        self.offer(message)
+        self.offer(_CLOSE)
+
+
+class ProgressHub:
+    """
+    Pub/sub de mensajes de progreso por trabajo.
+
+    Cada WebSocket se suscribe a un único `job_id` y tiene una tarea de envío
+    propia. `publish` solo encola (nunca espera a la red), por lo que un cliente
+    lento o caído no frena el pipeline ni al resto de suscriptores, y el coste
+    por mensaje es proporcional a los suscriptores de ese trabajo.
+    """
+
+    def __init__(self, max_queue_size: int):
+        self.max_queue_size = max_queue_size
+        self._subscribers: dict[str, set[Subscriber]] = {}
+
+    def subscribe(self, job_id: str, websocket, backlog: list = ()) -> Subscriber:
+        """
+        Suscribe `websocket` a `job_id`. Los mensajes de `backlog` (progreso ya
+        emitido) se envían antes que los nuevos.
+        """
+        subscriber = Subscriber(websocket, self.max_queue_size)
+        for message in backlog:
+            subscriber.offer(message)
+        self._subscribers.setdefault(job_id, set()).add(subscriber)
+        subscriber.task = asyncio.create_task(self._send_loop(job_id, subscriber))
+        return subscriber
+
+    def unsubscribe(self, job_id: str, subscriber: Subscriber):
+        self._discard(job_id, subscriber)
+        if subscriber.task is not None and not subscriber.task.done():
+            subscriber.task.cancel()
+
+    def publish(self, job_id: str, message: dict):
+        """Entrega `message` a los suscriptores de `job_id` sin bloquear."""
+        for subscriber in self._subscribers.get(job_id, ()):
+            subscriber.offer(message)
+
+    def close(self, job_id: str, final_message: dict):
+        """Envía el mensaje final a los suscriptores de `job_id` y cierra sus canales."""
+        for subscriber in self._subscribers.pop(job_id, ()):
+            subscriber.finish(final_message)
+
+    def subscriber_count(self, job_id: str) -> int:
+        return len(self._subscribers.get(job_id, ()))
+
+    async def _send_loop(self, job_id: str, subscriber: Subscriber):
+        try:
+            while True:
+                message = await subscriber.queue.get()
+                if message is _CLOSE:
+                    await subscriber.websocket.close()
+                    break
+                await subscriber.websocket.send_json(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Cliente desconectado o error de red: se elimina solo este suscriptor
+            logger.info(f"Dropping progress subscriber for job {job_id}: {e!r}")
+        finally:
+            self._discard(job_id, subscriber)
+
+    def _discard(self, job_id: str, subscriber: Subscriber):
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[job_id]
@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[str], Awaitable[None]]
+
+
+def request_key(image_bytes: bytes, text_prompt: str, *extra) -> str:
+    """
+    Clave de una búsqueda: sha256 de la imagen, prompt normalizado (minúsculas
+    y espacios colapsados) y el resto de parámetros que cambian el resultado.
+    """
+    digest = hashlib.sha256(image_bytes)
+    digest.update(b"\0" + " ".join(text_prompt.lower().split()).encode("utf-8"))
+    for value in extra:
+        digest.update(b"\0" + str(value).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _Flight:
+    """Una ejecución en vuelo: su tarea, el progreso emitido y quién espera."""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.history: list[str] = []
+        self.listeners: list[ProgressCallback] = []
+        self.waiters = 0
+
+    async def publish(self, message: str):
+        self.history.append(message)
+        for listener in list(self.listeners):
+            try:
+                await listener(message)
+            except Exception as e:
+                logger.error(f"Progress listener failed: {str(e)}")
+
+
+class SingleFlight:
+    """
+    Deduplica ejecuciones concurrentes con la misma clave.
+
+    La primera llamada a `do` con una clave lanza `func(publish)`; las que
+    llegan mientras sigue en vuelo se enganchan a esa misma ejecución y
+    reciben su resultado (o su excepción). Cada llamante recibe en su
+    `progress_callback` el progreso ya emitido y el que se emita después.
+    Terminada la ejecución la clave se libera: no es una caché.
+
+    Si todos los llamantes se cancelan, la ejecución se cancela también.
+    """
+
+    def __init__(self):
+        self._flights: dict[Hashable, _Flight] = {}
+        self.shared = 0  # Llamadas que se engancharon a una ejecución en vuelo
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(
+        self,
+        key: Hashable,
+        func: Callable[[ProgressCallback], Awaitable],
+        progress_callback: Optional[ProgressCallback] = None,
+    ):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, func))
+        else:
+            self.shared += 1
+            logger.info("Attached to an in-flight identical search")
+
+        flight.waiters += 1
+        try:
+            if progress_callback is not None:
+                # Reenvía el progreso ya emitido (también el que llegue mientras
+                # tanto) y a partir de ahí recibe el nuevo como un oyente más
+                sent = 0
+                while sent < len(flight.history):
+                    await progress_callback(flight.history[sent])
+                    sent += 1
+                flight.listeners.append(progress_callback)
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+            if progress_callback is not None and progress_callback in flight.listeners:
+                flight.listeners.remove(progress_callback)
+
+    async def _run(self, key: Hashable, flight: _Flight, func):
+        try:
+            return await func(flight.publish)
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
@@ -0,0 +1,115 @@
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+logger = logging.getLogger(__name__)
+
+# Id de traza de la petición en curso; se propaga a las tareas asyncio y a los
+# hilos lanzados con asyncio.to_thread
+trace_id_var: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_DURATION = Histogram(
+    "pipeline_stage_duration_seconds",
+    "Duración de cada etapa de process_image_pipeline",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+STAGE_IN_FLIGHT = Gauge(
+    "pipeline_stage_in_flight",
+    "Etapas de process_image_pipeline en ejecución",
+    ["stage"],
+)
+STAGE_ERRORS = Counter(
+    "pipeline_stage_errors_total",
+    "Errores por etapa de process_image_pipeline",
+    ["stage"],
+)
+EXTERNAL_CALL_DURATION = Histogram(
+    "external_call_duration_seconds",
+    "Duración de las llamadas a servicios externos",
+    ["service", "outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+SEARCH_PROVIDER_OUTCOMES = Counter(
+    "search_provider_outcomes_total",
+    "Respuestas de cada proveedor de búsqueda visual (ok, error, timeout)",
+    ["provider", "outcome"],
+)
+
+
+def start_trace(trace_id: Optional[str] = None) -> str:
+    """Fija el id de traza del contexto actual (genera uno si no se indica)."""
+    trace_id = trace_id or uuid.uuid4().hex
+    trace_id_var.set(trace_id)
+    return trace_id
+
+
+@contextmanager
+def stage_span(stage: str):
+    """
+    Mide una etapa del pipeline: histograma de latencia, gauge de etapas en
+    vuelo, contador de errores y una línea de log con el id de traza.
+    """
+    STAGE_IN_FLIGHT.labels(stage).inc()
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except Exception:
+        outcome = "error"
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_DURATION.labels(stage).observe(duration)
+        STAGE_IN_FLIGHT.labels(stage).dec()
+        logger.info(
+            "stage=%s outcome=%s duration_ms=%.1f trace_id=%s",
+            stage,
+            outcome,
+            duration * 1000,
+            trace_id_var.get(),
+        )
+
+
+@contextmanager
+def external_call(service: str):
+    """
+    Mide la duración de una llamada a un servicio externo. Produce un dict en el
+    que el llamante puede fijar `outcome` (p. ej. "error" ante un HTTP 5xx).
+    """
+    start = time.perf_counter()
+    call = {"outcome": "ok"}
+    try:
+        yield call
+    except Exception:
+        call["outcome"] = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        EXTERNAL_CALL_DURATION.labels(service, call["outcome"]).observe(duration)
+        logger.info(
+            "external_call=%s outcome=%s duration_ms=%.1f trace_id=%s",
+            service,
+            call["outcome"],
+            duration * 1000,
+            trace_id_var.get(),
+        )
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Retorna las métricas en formato de exposición de Prometheus."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,12 +1,20 @@
 import os
+import sys
 from dotenv import load_dotenv
 from serpapi import GoogleSearch
 from typing import List, Dict
 from google.cloud import vision
-from google.api_core import retry
-from google.oauth2 import service_account
+from google.api_core import retry, retry_async
+from google.api_core.exceptions import GoogleAPICallError
 import logging
 
+current_dir = os.path.dirname(__file__)  # ruta de /src/modules/search
+src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
+sys.path.append(src_dir)
+
+from modules.observability.tracing import external_call
+from modules.search.vision_clients import vision_clients
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -24,7 +32,7 @@ def search_similar_product_online(image_url: str) -> list[dict]:
                    título, link y thumbnail. Lista vacía si no hay coincidencias.
     """
 
-    print(f"\nBuscando producto similar con Google Lens para la imagen: {image_url}\n")
+    logger.info(f"Buscando producto similar con Google Lens para la imagen: {image_url}")
 
     # --------------------------------------------------------------------
     # Búsqueda inversa en Google Lens (vía SerpAPI)
@@ -33,11 +41,12 @@ def search_similar_product_online(image_url: str) -> list[dict]:
         "engine": "google_lens",
         "api_key": os.getenv("SERPAPI_API_KEY"),
         "hl": "es",  # idioma
-        "url": image_url,  # Se utiliza la URL de imgur
+        "url": image_url,  # URL pública del recorte en el almacén de imágenes
     }
 
     search = GoogleSearch(params)
-    results = search.get_dict()
+    with external_call("serpapi_lens"):
+        results = search.get_dict()
 
     # --------------------------------------------------------------------
     # Procesar coincidencias visuales (visual_matches)
@@ -57,20 +66,68 @@ def search_similar_product_online(image_url: str) -> list[dict]:
 
     return top_matches
 
-def get_product_search_client():
-    """Initialize Product Search client with credentials"""
-    try:
-        credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-        if not credentials_path:
-            raise ValueError("GOOGLE_APPLICATION_CREDENTIALS environment variable not set")
-            
-        credentials = service_account.Credentials.from_service_account_file(
-            credentials_path
-        )
-        return vision.ProductSearchClient(credentials=credentials)
-    except Exception as e:
-        logger.error(f"Error initializing Product Search client: {str(e)}")
-        raise
+def get_vision_client() -> vision.ImageAnnotatorClient:
+    """Cliente de Vision compartido (credenciales y canal gRPC reutilizados)."""
+    return vision_clients.get_vision_client()
+
+
+def get_product_search_client() -> vision.ProductSearchClient:
+    """Cliente de Product Search compartido (credenciales y canal gRPC reutilizados)."""
+    return vision_clients.get_product_search_client()
+
+
+def _product_search_context(
+    product_search_client, project_id, location, product_set_id, product_category
+) -> vision.ImageContext:
+    # Construct product set path
+    product_set_path = product_search_client.product_set_path(
+        project=project_id,
+        location=location,
+        product_set=product_set_id
+    )
+
+    # Configure product search parameters
+    product_search_params = vision.ProductSearchParams(
+        product_set=product_set_path,
+        product_categories=[product_category],
+        filter="",  # Add filters if needed
+    )
+
+    return vision.ImageContext(product_search_params=product_search_params)
+
+
+def _format_product_results(response, max_results: int) -> List[Dict]:
+    # Extract and format results
+    results = response.product_search_results.results
+    top_matches = []
+
+    for result in results[:max_results]:
+        product = result.product
+        match = {
+            "name": product.name.split('/')[-1],  # Extract ID from full path
+            "display_name": product.display_name,
+            "description": product.description,
+            "score": float(result.score),  # Convert to native Python float
+            "image_url": result.image
+        }
+        top_matches.append(match)
+
+    # Registra cada uno de los resultados formateados:
+    for match in top_matches:
+        logger.debug(f"Name: {match['name']}, "
+                     f"Display Name: {match['display_name']}, "
+                     f"Description: {match['description']}, "
+                     f"Score: {match['score']}, "
+                     f"Image URL: {match['image_url']}")
+
+    logger.info(f"Found {len(top_matches)} product matches")
+    return top_matches
+
+
+def _validate_image_url(image_url: str):
+    if not image_url or not image_url.startswith(('http://', 'https://')):
+        raise ValueError("Invalid image URL provided")
+
 
 @retry.Retry(predicate=retry.if_transient_error)
 def product_search(image_url: str, 
@@ -99,80 +156,34 @@ def product_search(image_url: str,
             - image_url: Product image URL
             
     Raises:
-        vision.ImageAnnotatorError: If the API request fails
+        GoogleAPICallError: If the API request fails
         ValueError: If the input parameters are invalid
     """
     try:
-        # Initialize clients with credentials
+        # Clientes compartidos por el proceso
         image_annotator_client = get_vision_client()
         product_search_client = get_product_search_client()
-        
 
         # Validate inputs
-        if not image_url or not image_url.startswith(('http://', 'https://')):
-            raise ValueError("Invalid image URL provided")
-
-        # Construct product set path
-        product_set_path = product_search_client.product_set_path(
-            project=project_id,
-            location=location,
-            product_set=product_set_id
-        )
+        _validate_image_url(image_url)
 
         # Create image source and context
         image_source = vision.ImageSource(image_uri=image_url)
         image = vision.Image(source=image_source)
-        
-        # Configure product search parameters
-        product_search_params = vision.ProductSearchParams(
-            product_set=product_set_path,
-            product_categories=[product_category],
-            filter="",  # Add filters if needed
-        )
-        
-        image_context = vision.ImageContext(
-            product_search_params=product_search_params
+        image_context = _product_search_context(
+            product_search_client, project_id, location, product_set_id, product_category
         )
-        
 
         # Perform the product search including image_context
-        response = image_annotator_client.product_search(
-            image=image,
-            image_context=image_context
-        )
-        
-        # Se elimina la impresión cruda y se prepara la salida formateada
-
-        # Extract and format results
-        results = response.product_search_results.results
-        top_matches = []
-        
-
-
-        for result in results[:max_results]:
-            product = result.product
-            match = {
-                "name": product.name.split('/')[-1],  # Extract ID from full path
-                "display_name": product.display_name,
-                "description": product.description,
-                "score": float(result.score),  # Convert to native Python float
-                "image_url": result.image
-            }
-            top_matches.append(match)
-
-        # Imprime en consola cada uno de los resultados formateados:
-        print("Top product matches:")
-        for match in top_matches:
-            print(f"Name: {match['name']}, "
-                  f"Display Name: {match['display_name']}, "
-                  f"Description: {match['description']}, "
-                  f"Score: {match['score']}, "
-                  f"Image URL: {match['image_url']}")
+        with external_call("vision_product_search"):
+            response = image_annotator_client.product_search(
+                image=image,
+                image_context=image_context
+            )
 
-        logger.info(f"Found {len(top_matches)} product matches")
-        return top_matches
+        return _format_product_results(response, max_results)
 
-    except vision.ImageAnnotatorError as e:
+    except GoogleAPICallError as e:
         logger.error(f"Vision API error: {str(e)}")
         raise
     except Exception as e:
@@ -200,10 +211,9 @@ def related_search(image_url: str, max_results: int = 5) -> List[Dict]:
         Exception: Si ocurre un error al llamar a la API.
     """
     # Validar la URL de la imagen.
-    if not image_url or not image_url.startswith(('http://', 'https://')):
-        raise ValueError("Invalid image URL provided")
+    _validate_image_url(image_url)
 
-    print(f"\nBuscando productos relacionados (WEB_DETECTION) para la imagen: {image_url}\n")
+    logger.info(f"Buscando productos relacionados (WEB_DETECTION) para la imagen: {image_url}")
 
     try:
         # Inicializar el cliente de Vision y construir la petición de WEB_DETECTION
@@ -214,52 +224,112 @@ def related_search(image_url: str, max_results: int = 5) -> List[Dict]:
             "features": [{"type_": vision.Feature.Type.WEB_DETECTION, "max_results": max_results}]
         }
 
-        response = client.annotate_image(request)
-        web_detection = response.web_detection
+        with external_call("vision_web_detection"):
+            response = client.annotate_image(request)
+        return _format_web_detection(response.web_detection, max_results)
+
+    except Exception as e:
+        logger.error(f"Error in related_search: {str(e)}")
+        raise
 
-        top_products = []
 
-        # Usar pages_with_matching_images si están disponibles
-        if web_detection.pages_with_matching_images:
-            for page in web_detection.pages_with_matching_images[:max_results]:
-                title = page.page_title if page.page_title else "Sin título"
-                link = page.url if page.url else "Link no disponible"
-                if page.full_matching_images:
-                    thumbnail = page.full_matching_images[0].url
-                else:
-                    thumbnail = "Thumbnail no disponible"
-                price = "Precio no disponible"
+def _format_web_detection(web_detection, max_results: int) -> List[Dict]:
+    top_products = []
 
+    # Usar pages_with_matching_images si están disponibles
+    if web_detection.pages_with_matching_images:
+        for page in web_detection.pages_with_matching_images[:max_results]:
+            title = page.page_title if page.page_title else "Sin título"
+            link = page.url if page.url else "Link no disponible"
+            if page.full_matching_images:
+                thumbnail = page.full_matching_images[0].url
+            else:
+                thumbnail = "Thumbnail no disponible"
+            price = "Precio no disponible"
+
+            top_products.append({
+                "title": title,
+                "link": link,
+                "thumbnail": thumbnail,
+                "price": price
+            })
+    else:
+        # Fallback: usar full_matching_images si no hay pages
+        if web_detection.full_matching_images:
+            for img in web_detection.full_matching_images[:max_results]:
                 top_products.append({
-                    "title": title,
-                    "link": link,
-                    "thumbnail": thumbnail,
-                    "price": price
+                    "title": "Sin título",
+                    "link": img.url if img.url else "Link no disponible",
+                    "thumbnail": img.url if img.url else "Thumbnail no disponible",
+                    "price": "Precio no disponible"
                 })
         else:
-            # Fallback: usar full_matching_images si no hay pages
-            if web_detection.full_matching_images:
-                for img in web_detection.full_matching_images[:max_results]:
-                    top_products.append({
-                        "title": "Sin título",
-                        "link": img.url if img.url else "Link no disponible",
-                        "thumbnail": img.url if img.url else "Thumbnail no disponible",
-                        "price": "Precio no disponible"
-                    })
-            else:
-                print("No se encontraron coincidencias en WEB_DETECTION.")
-
-        # Imprimir en consola los resultados formateados.
-        print("Resultados de productos relacionados:")
-        for product in top_products:
-            print(f"Title: {product['title']}")
-            print(f"Link: {product['link']}")
-            print(f"Thumbnail: {product['thumbnail']}")
-            print(f"Price: {product['price']}")
-            print("-------------")
-    
-        return top_products
-
-    except Exception as e:
-        logger.error(f"Error in related_search: {str(e)}")
-        raise
\ No newline at end of file
+            logger.info("No se encontraron coincidencias en WEB_DETECTION.")
+
+    # Registrar los resultados formateados.
+    for product in top_products:
+        logger.debug(f"Title: {product['title']}, "
+                     f"Link: {product['link']}, "
+                     f"Thumbnail: {product['thumbnail']}, "
+                     f"Price: {product['price']}")
+
+    return top_products
+
+
+async def _annotate_async(request: vision.AnnotateImageRequest):
+    """Anota una imagen con el cliente asíncrono compartido (con reintentos)."""
+    client = vision_clients.get_async_vision_client()
+    response = await client.batch_annotate_images(
+        requests=[request],
+        retry=retry_async.AsyncRetry(predicate=retry.if_transient_error),
+    )
+    result = response.responses[0]
+    if result.error.message:
+        raise RuntimeError(f"Vision API error: {result.error.message}")
+    return result
+
+
+async def product_search_async(image_url: str,
+                               project_id: str = "item-finder-alejandro",
+                               location: str = "us-west1",
+                               product_set_id: str = "your_product_set_id",
+                               product_category: str = "general-goods",
+                               max_results: int = 5) -> List[Dict]:
+    """
+    Versión asíncrona de `product_search`: usa los clientes gRPC asíncronos
+    compartidos, sin bloquear el event loop ni crear canales por llamada.
+    """
+    _validate_image_url(image_url)
+
+    image_context = _product_search_context(
+        vision_clients.get_async_product_search_client(),
+        project_id, location, product_set_id, product_category
+    )
+    request = vision.AnnotateImageRequest(
+        image=vision.Image(source=vision.ImageSource(image_uri=image_url)),
+        features=[vision.Feature(type_=vision.Feature.Type.PRODUCT_SEARCH,
+                                 max_results=max_results)],
+        image_context=image_context,
+    )
+    with external_call("vision_product_search"):
+        response = await _annotate_async(request)
+    return _format_product_results(response, max_results)
+
+
+async def related_search_async(image_url: str, max_results: int = 5) -> List[Dict]:
+    """
+    Versión asíncrona de `related_search` (WEB_DETECTION) con los clientes
+    gRPC asíncronos compartidos.
+    """
+    _validate_image_url(image_url)
+
+    logger.info(f"Buscando productos relacionados (WEB_DETECTION) para la imagen: {image_url}")
+
+    request = vision.AnnotateImageRequest(
+        image=vision.Image(source=vision.ImageSource(image_uri=image_url)),
+        features=[vision.Feature(type_=vision.Feature.Type.WEB_DETECTION,
+                                 max_results=max_results)],
+    )
+    with external_call("vision_web_detection"):
+        response = await _annotate_async(request)
+    return _format_web_detection(response.web_detection, max_results)
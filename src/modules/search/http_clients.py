@@ -0,0 +1,91 @@
+import sys
+import os
+import asyncio
+import logging
+from typing import Optional
+
+import httpx
+
+current_dir = os.path.dirname(__file__)  # ruta de /src/modules/search
+src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
+sys.path.append(src_dir)
+
+from config import (
+    HTTP_TIMEOUT_SECONDS,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_MAX_RETRIES,
+    HTTP_RETRY_BACKOFF_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Códigos de estado que se consideran transitorios y se reintentan
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Retorna el cliente HTTP asíncrono compartido por todo el proceso.
+
+    El cliente mantiene un pool de conexiones keep-alive por host, de modo que
+    las subidas sucesivas a Supabase reutilizan la conexión TLS.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+async def close_http_client():
+    """Cierra el cliente compartido y sus conexiones (al apagar la app)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def request_with_retry(
+    method: str,
+    url: str,
+    max_retries: Optional[int] = None,
+    backoff_seconds: Optional[float] = None,
+    **kwargs,
+) -> httpx.Response:
+    """
+    Realiza una petición con el cliente compartido, reintentando errores de red
+    y respuestas transitorias (429/5xx) con backoff exponencial.
+
+    Retorna la última respuesta recibida; relanza el último error de red si se
+    agotan los reintentos.
+    """
+    if max_retries is None:
+        max_retries = HTTP_MAX_RETRIES
+    if backoff_seconds is None:
+        backoff_seconds = HTTP_RETRY_BACKOFF_SECONDS
+    client = get_http_client()
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            if attempt == max_retries:
+                raise
+            logger.warning(f"{method} {url} failed ({e!r}), retrying")
+        else:
+            if (
+                response.status_code not in RETRYABLE_STATUS_CODES
+                or attempt == max_retries
+            ):
+                return response
+            logger.warning(f"{method} {url} returned {response.status_code}, retrying")
+
+        await asyncio.sleep(backoff_seconds * 2**attempt)
@@ -0,0 +1,277 @@
+import sys
+import os
+import io
+import json
+import time
+import sqlite3
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+current_dir = os.path.dirname(__file__)  # ruta de /src/modules/search
+src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
+sys.path.append(src_dir)
+
+from config import LOCAL_INDEX_DIR, LOCAL_INDEX_MIN_SIMILARITY
+from utils.utils import preprocess_caption
+
+# Histograma HSV (tono x saturación x valor) + disposición en gris 8x8
+HUE_BINS, SATURATION_BINS, VALUE_BINS = 8, 4, 4
+LAYOUT_SIZE = 8
+DESCRIPTOR_DIM = HUE_BINS * SATURATION_BINS * VALUE_BINS + LAYOUT_SIZE**2
+_ROW_BYTES = DESCRIPTOR_DIM * 2  # float16
+
+# Los recortes se componen sobre blanco: esos píxeles no son del producto
+_BACKGROUND_MIN = 250
+# Filas que se convierten a float32 a la vez al buscar (acota la memoria)
+_SEARCH_CHUNK_ROWS = 65536
+# Filas por encima del umbral que `lookup` revisa buscando el mismo prompt
+_LOOKUP_CANDIDATES = 512
+
+
+def compute_descriptor(image_bytes: bytes) -> np.ndarray:
+    """
+    Descriptor visual compacto (float32, norma 1) de un recorte segmentado.
+
+    Une dos partes normalizadas por separado: el histograma de color HSV de
+    los píxeles del producto (raíz cuadrada, para que pese la presencia de un
+    color más que su cantidad exacta) y una miniatura en gris 8x8 centrada en
+    su media, que distingue formas con colores parecidos. La similitud coseno
+    entre descriptores es alta para recortes casi idénticos o del mismo
+    producto fotografiado de forma parecida.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("RGB", (128, 128))  # Solo afecta a JPEG
+        rgb = image.convert("RGB")
+        rgb.thumbnail((128, 128))
+        hsv = np.asarray(rgb.convert("HSV")).reshape(-1, 3)
+        pixels = np.asarray(rgb).reshape(-1, 3)
+        layout = np.asarray(
+            rgb.convert("L").resize((LAYOUT_SIZE, LAYOUT_SIZE), Image.BILINEAR),
+            dtype=np.float32,
+        ).ravel()
+
+    foreground = ~(pixels >= _BACKGROUND_MIN).all(axis=1)
+    if foreground.any():
+        hsv = hsv[foreground]
+    bins = (
+        (hsv[:, 0].astype(np.int32) * HUE_BINS // 256) * SATURATION_BINS * VALUE_BINS
+        + (hsv[:, 1].astype(np.int32) * SATURATION_BINS // 256) * VALUE_BINS
+        + hsv[:, 2].astype(np.int32) * VALUE_BINS // 256
+    )
+    histogram = np.sqrt(
+        np.bincount(bins, minlength=HUE_BINS * SATURATION_BINS * VALUE_BINS)
+    ).astype(np.float32)
+
+    layout -= layout.mean()
+    parts = [_normalize(histogram), 0.5 * _normalize(layout)]
+    return _normalize(np.concatenate(parts))
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+class LocalVisualIndex:
+    """
+    Índice local de recortes ya buscados y de los productos que devolvieron
+    los proveedores externos.
+
+    - `vectors.f16`: matriz (N, DESCRIPTOR_DIM) en float16, solo de añadir al
+      final y abierta como memmap; arrancar cuesta lo mismo con 10 que con un
+      millón de filas.
+    - `metadata.sqlite`: por fila, el prompt (normalizado), la fecha y los
+      resultados (JSON).
+
+    Varios procesos (workers de uvicorn) pueden compartir el directorio: las
+    escrituras se serializan con un `flock` sobre `index.lock` y el número de
+    fila se calcula dentro del lock a partir de lo ya guardado, nunca de un
+    contador propio de cada proceso. Las búsquedas no toman el lock y ven las
+    filas que otros procesos ya han confirmado.
+
+    `search` calcula la similitud coseno contra todas las filas con un
+    producto matriz-vector por bloques; `lookup` retorna los resultados de la
+    fila más parecida con el mismo prompt si supera `min_similarity`.
+    """
+
+    def __init__(self, directory: str, min_similarity: float):
+        self.min_similarity = min_similarity
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path = os.path.join(directory, "vectors.f16")
+        self._lock = threading.Lock()
+        self._lock_file = open(os.path.join(directory, "index.lock"), "a")
+        self._db = sqlite3.connect(
+            os.path.join(directory, "metadata.sqlite"), check_same_thread=False
+        )
+        self._matrix: Optional[np.memmap] = None
+        with self._exclusive():
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "row INTEGER PRIMARY KEY, created_at REAL NOT NULL, "
+                "text_prompt TEXT NOT NULL, results TEXT NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS entries_text_prompt ON entries (text_prompt)"
+            )
+            self._normalize_prompts()
+            self._count = self._recover()
+
+    @contextmanager
+    def _exclusive(self):
+        """Lock de escritura entre hilos (threading) y entre procesos (flock)."""
+        with self._lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _normalize_prompts(self):
+        # Índices anteriores guardaban el prompt tal cual llegaba
+        prompts = self._db.execute("SELECT DISTINCT text_prompt FROM entries").fetchall()
+        self._db.executemany(
+            "UPDATE entries SET text_prompt = ? WHERE text_prompt = ?",
+            [
+                (preprocess_caption(prompt), prompt)
+                for (prompt,) in prompts
+                if preprocess_caption(prompt) != prompt
+            ],
+        )
+        self._db.commit()
+
+    def _committed_rows(self) -> int:
+        """Filas con el vector completo y la metadata ya confirmada."""
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        (next_row,) = self._db.execute(
+            "SELECT COALESCE(MAX(row) + 1, 0) FROM entries"
+        ).fetchone()
+        return min(size // _ROW_BYTES, next_row)
+
+    def _recover(self) -> int:
+        """
+        Número de filas válidas. Una escritura interrumpida puede dejar un
+        vector sin metadata (o a medias); esas filas se descartan. Debe
+        llamarse con el lock de escritura adquirido.
+        """
+        count = self._committed_rows()
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        if size != count * _ROW_BYTES:
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(count * _ROW_BYTES)
+        self._db.execute("DELETE FROM entries WHERE row >= ?", (count,))
+        self._db.commit()
+        return count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _view(self) -> Optional[np.ndarray]:
+        # Incluye las filas añadidas por otros procesos; se vuelve a mapear
+        # solo si han llegado filas nuevas
+        self._count = self._committed_rows()
+        if self._count == 0:
+            return None
+        if self._matrix is None or self._matrix.shape[0] != self._count:
+            self._matrix = np.memmap(
+                self._vectors_path,
+                dtype=np.float16,
+                mode="r",
+                shape=(self._count, DESCRIPTOR_DIM),
+            )
+        return self._matrix
+
+    def add(self, descriptor: np.ndarray, results: list, text_prompt: str = ""):
+        """Añade un recorte y los resultados que se obtuvieron para él."""
+        vector = np.asarray(descriptor, dtype=np.float16).reshape(DESCRIPTOR_DIM)
+        with self._exclusive():
+            row = self._recover()
+            self._db.execute(
+                "INSERT INTO entries VALUES (?, ?, ?, ?)",
+                (row, time.time(), preprocess_caption(text_prompt), json.dumps(results)),
+            )
+            with open(self._vectors_path, "ab") as f:
+                f.write(vector.tobytes())
+            self._db.commit()
+            self._count = row + 1
+
+    def _similarities(self, descriptor: np.ndarray) -> np.ndarray:
+        """Similitud coseno de `descriptor` con cada fila del índice."""
+        with self._lock:
+            matrix = self._view()
+        if matrix is None:
+            return np.empty(0, dtype=np.float32)
+
+        query = np.asarray(descriptor, dtype=np.float32)
+        similarities = np.empty(matrix.shape[0], dtype=np.float32)
+        for start in range(0, matrix.shape[0], _SEARCH_CHUNK_ROWS):
+            block = np.asarray(matrix[start : start + _SEARCH_CHUNK_ROWS], dtype=np.float32)
+            similarities[start : start + len(block)] = block @ query
+        return similarities
+
+    def search(self, descriptor: np.ndarray, top_k: int = 1) -> list[tuple[int, float]]:
+        """Las `top_k` filas más parecidas como (fila, similitud coseno), de mayor a menor."""
+        similarities = self._similarities(descriptor)
+        if len(similarities) == 0 or top_k <= 0:
+            return []
+
+        top_k = min(top_k, len(similarities))
+        best = np.argpartition(-similarities, top_k - 1)[:top_k]
+        best = best[np.argsort(-similarities[best])]
+        return [(int(row), float(similarities[row])) for row in best]
+
+    def results(self, row: int) -> Optional[list]:
+        with self._lock:
+            found = self._db.execute(
+                "SELECT results FROM entries WHERE row = ?", (row,)
+            ).fetchone()
+        return json.loads(found[0]) if found else None
+
+    def lookup(self, descriptor: np.ndarray, text_prompt: str = "") -> Optional[list]:
+        """
+        Resultados del recorte más parecido buscado con el mismo prompt, si la
+        similitud supera el umbral.
+        """
+        similarities = self._similarities(descriptor)
+        candidates = np.flatnonzero(similarities >= self.min_similarity)
+        # Las más parecidas primero; basta con las primeras para encontrar
+        # la mejor con el mismo prompt
+        candidates = candidates[np.argsort(-similarities[candidates])][:_LOOKUP_CANDIDATES]
+        found = None
+        if len(candidates):
+            rows = [int(row) for row in candidates]
+            with self._lock:
+                matching = dict(
+                    self._db.execute(
+                        "SELECT row, results FROM entries WHERE text_prompt = ? "
+                        f"AND row IN ({','.join('?' * len(rows))})",
+                        (preprocess_caption(text_prompt), *rows),
+                    ).fetchall()
+                )
+            found = next((matching[row] for row in rows if row in matching), None)
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(found)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": self._count,
+            "min_similarity": self.min_similarity,
+        }
+
+
+local_index = (
+    LocalVisualIndex(LOCAL_INDEX_DIR, LOCAL_INDEX_MIN_SIMILARITY)
+    if LOCAL_INDEX_DIR
+    else None
+)
@@ -0,0 +1,178 @@
+import sys
+import os
+import io
+import json
+import time
+import sqlite3
+import threading
+from typing import Optional
+
+from PIL import Image
+
+current_dir = os.path.dirname(__file__)  # ruta de /src/modules/search
+src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
+sys.path.append(src_dir)
+
+from config import (
+    SEARCH_CACHE_MAX_ENTRIES,
+    SEARCH_CACHE_TTL_SECONDS,
+    SEARCH_CACHE_MAX_DISTANCE,
+    SEARCH_CACHE_SQLITE_PATH,
+)
+from utils.lru import LRUCache
+from utils.utils import preprocess_caption
+
+
+def compute_dhash(image_bytes: bytes, hash_size: int = 8) -> int:
+    """
+    Calcula el dHash (difference hash) de una imagen codificada.
+
+    La imagen se reduce a escala de grises de (hash_size + 1) x hash_size y cada
+    bit indica si un píxel es más brillante que su vecino derecho. Imágenes casi
+    idénticas (recompresión, pequeños cambios de recorte) dan hashes cercanos en
+    distancia de Hamming.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("L", (hash_size * 4, hash_size * 4))  # Solo afecta a JPEG
+        gray = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+
+    pixels = gray.tobytes()  # Un byte por píxel en modo "L"
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class PerceptualSearchCache:
+    """
+    Caché de resultados de búsqueda indexada por hash perceptual y text prompt.
+
+    Las búsquedas con el mismo prompt (normalizado como las captions de
+    GroundingDINO) y hashes a distancia de Hamming <= `max_distance` se
+    consideran aciertos: el mismo recorte buscado como "shoe" y como "bag" no
+    comparte resultados. Las entradas caducan tras `ttl_seconds` y, superado
+    `max_entries`, se expulsa la menos usada. Si se indica `sqlite_path`, las
+    entradas se guardan también en SQLite y se recargan al arrancar.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        max_distance: int,
+        sqlite_path: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        # (prompt normalizado, phash) -> (created_at, results)
+        self._entries = LRUCache(max_entries)
+        self._lock = threading.Lock()
+        self._db = None
+        if sqlite_path:
+            self._open_db(sqlite_path)
+
+    def _open_db(self, sqlite_path: str):
+        self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+        columns = [
+            row[1] for row in self._db.execute("PRAGMA table_info(search_cache)")
+        ]
+        if columns and "text_prompt" not in columns:
+            # Tabla anterior sin prompt en la clave: sus entradas no sirven
+            self._db.execute("DROP TABLE search_cache")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            "text_prompt TEXT NOT NULL, phash TEXT NOT NULL, created_at REAL NOT NULL, "
+            "results TEXT NOT NULL, PRIMARY KEY (text_prompt, phash))"
+        )
+        self._db.execute(
+            "DELETE FROM search_cache WHERE created_at < ?",
+            (time.time() - self.ttl_seconds,),
+        )
+        self._db.commit()
+
+        rows = self._db.execute(
+            "SELECT text_prompt, phash, created_at, results FROM search_cache "
+            "ORDER BY created_at DESC LIMIT ?",
+            (self.max_entries,),
+        ).fetchall()
+        for prompt, phash, created_at, results in reversed(rows):
+            self._entries.put(
+                (prompt, int(phash, 16)), (created_at, json.loads(results))
+            )
+
+    def get(self, phash: int, text_prompt: str = "") -> Optional[list]:
+        """
+        Retorna los resultados del hash más cercano dentro del umbral entre
+        los guardados con el mismo prompt, o None.
+        """
+        prompt = preprocess_caption(text_prompt)
+        with self._lock:
+            self._purge_expired()
+
+            best_key, best_distance = None, self.max_distance + 1
+            if (prompt, phash) in self._entries:
+                best_key, best_distance = (prompt, phash), 0
+            else:
+                for key, _ in self._entries.items():
+                    if key[0] != prompt:
+                        continue
+                    distance = hamming_distance(phash, key[1])
+                    if distance < best_distance:
+                        best_key, best_distance = key, distance
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return self._entries.get(best_key)[1]
+
+    def put(self, phash: int, results: list, text_prompt: str = ""):
+        """Guarda los resultados asociados a `phash` y `text_prompt`."""
+        prompt = preprocess_caption(text_prompt)
+        created_at = time.time()
+        with self._lock:
+            evicted = self._entries.put((prompt, phash), (created_at, results))
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?)",
+                    (prompt, f"{phash:016x}", created_at, json.dumps(results)),
+                )
+                self._db.executemany(
+                    "DELETE FROM search_cache WHERE text_prompt = ? AND phash = ?",
+                    [(key[0], f"{key[1]:016x}") for key in evicted],
+                )
+                self._db.commit()
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        for key, (created_at, _) in self._entries.items():
+            if created_at < cutoff:
+                self._entries.pop(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+lens_search_cache = PerceptualSearchCache(
+    SEARCH_CACHE_MAX_ENTRIES,
+    SEARCH_CACHE_TTL_SECONDS,
+    SEARCH_CACHE_MAX_DISTANCE,
+    SEARCH_CACHE_SQLITE_PATH,
+)
@@ -0,0 +1,254 @@
+import sys
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+current_dir = os.path.dirname(__file__)  # ruta de /src/modules/search
+src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
+sys.path.append(src_dir)
+
+from config import (
+    SEARCH_DEADLINE_SECONDS,
+    SEARCH_HEDGE_SECONDS,
+    SEARCH_MAX_RESULTS,
+    SEARCH_PROVIDERS,
+)
+from modules.observability.tracing import SEARCH_PROVIDER_OUTCOMES
+from modules.search import google_lens_search
+
+logger = logging.getLogger(__name__)
+
+SearchProvider = Callable[[str], Awaitable[list[dict]]]
+
+NO_TITLE = "Sin título"
+NO_LINK = "Link no disponible"
+NO_THUMBNAIL = "Thumbnail no disponible"
+NO_PRICE = "Precio no disponible"
+
+# Parámetros de seguimiento que no cambian la página de destino
+_TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "ref", "ref_", "srsltid", "spm"}
+
+
+def canonical_url(url: str) -> Optional[str]:
+    """
+    Forma canónica de una URL para detectar duplicados: esquema y host en
+    minúsculas y sin "www.", sin fragmento, sin parámetros de seguimiento
+    (utm_*, gclid...), con el resto de parámetros ordenados y sin barra final.
+    Retorna None si no es una URL http(s).
+    """
+    try:
+        parts = urlsplit(url.strip())
+    except (AttributeError, ValueError):
+        return None
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return None
+
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in _TRACKING_PARAMS
+    )
+    return urlunsplit(
+        ("https", host, parts.path.rstrip("/") or "/", urlencode(query), "")
+    )
+
+
+def _price_text(price) -> str:
+    # SerpAPI devuelve el precio como {"value": "10,99 €", "extracted_value": ...}
+    if isinstance(price, dict):
+        price = price.get("value") or price.get("extracted_value")
+    return str(price) if price else NO_PRICE
+
+
+def normalize_result(item: dict) -> dict:
+    """Lleva un resultado de cualquier proveedor a title/link/thumbnail/price."""
+    link = item.get("link") or item.get("image_url") or NO_LINK
+    return {
+        "title": item.get("title") or item.get("display_name") or NO_TITLE,
+        "link": link,
+        "thumbnail": item.get("thumbnail") or item.get("image_url") or NO_THUMBNAIL,
+        "price": _price_text(item.get("price")),
+    }
+
+
+def merge_results(
+    results_by_provider: dict[str, list[dict]],
+    max_results: int,
+    weights: Optional[dict[str, float]] = None,
+) -> list[dict]:
+    """
+    Une los resultados de varios proveedores, elimina duplicados por URL
+    canónica y ordena por relevancia.
+
+    Cada aparición suma `peso / (1 + posición)` (fusión por rango recíproco):
+    un producto que aparece arriba en varios proveedores queda por delante de
+    uno que solo aparece en uno. Los campos que faltan en una aparición se
+    completan con los de las demás.
+
+    Cada resultado tiene title/link/thumbnail/price (el precio siempre como
+    texto) y `sources`, los proveedores que lo devolvieron (esquema descrito
+    en el README).
+    """
+    weights = weights or {}
+    merged: dict[str, dict] = {}
+    scores: dict[str, float] = {}
+    first_seen: dict[str, int] = {}
+
+    for provider, items in results_by_provider.items():
+        weight = weights.get(provider, 1.0)
+        for position, item in enumerate(items):
+            result = normalize_result(item)
+            key = canonical_url(result["link"]) or f"{provider}:{position}"
+            if key not in merged:
+                merged[key] = dict(result, sources=[provider])
+                first_seen[key] = len(first_seen)
+                scores[key] = 0.0
+            else:
+                existing = merged[key]
+                for field, missing in (
+                    ("title", NO_TITLE),
+                    ("thumbnail", NO_THUMBNAIL),
+                    ("price", NO_PRICE),
+                ):
+                    if existing[field] == missing and result[field] != missing:
+                        existing[field] = result[field]
+                if provider not in existing["sources"]:
+                    existing["sources"].append(provider)
+            scores[key] += weight / (1 + position)
+
+    ranked = sorted(merged, key=lambda key: (-scores[key], first_seen[key]))
+    return [merged[key] for key in ranked[:max_results]]
+
+
+class SearchOrchestrator:
+    """
+    Consulta varios proveedores de búsqueda visual en paralelo y une sus
+    resultados.
+
+    - `deadline_seconds`: límite global; los proveedores que no han respondido
+      a tiempo se abandonan y se usa lo que haya llegado.
+    - `hedge_seconds`: cuando un proveedor responde con resultados, el resto
+      tiene como mucho este margen adicional (None = esperar hasta el límite).
+
+    Un proveedor que falla o no responde no hace fallar la búsqueda.
+    Con `on_partial`, cada vez que un proveedor responde (también el último,
+    y aunque no aporte nada) se llama con la unión de los resultados recibidos
+    hasta el momento y el nombre del proveedor.
+    """
+
+    def __init__(
+        self,
+        providers: dict[str, SearchProvider],
+        deadline_seconds: float,
+        hedge_seconds: Optional[float] = None,
+        max_results: int = 10,
+        weights: Optional[dict[str, float]] = None,
+    ):
+        self.providers = providers
+        self.deadline_seconds = deadline_seconds
+        self.hedge_seconds = hedge_seconds
+        self.max_results = max_results
+        self.weights = weights or {}
+
+    async def search(
+        self,
+        image_url: str,
+        on_partial: Optional[Callable[[list[dict], str], Awaitable[None]]] = None,
+    ) -> list[dict]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_seconds
+        tasks = {
+            asyncio.create_task(self._query(name, provider, image_url)): name
+            for name, provider in self.providers.items()
+        }
+
+        results: dict[str, list[dict]] = {}
+        pending = set(tasks)
+        while pending:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                results[tasks[task]] = task.result()
+                if task.result() and self.hedge_seconds is not None:
+                    deadline = min(deadline, loop.time() + self.hedge_seconds)
+                if on_partial is not None:
+                    await on_partial(self._merge(results), tasks[task])
+
+        for task in pending:
+            task.cancel()
+            SEARCH_PROVIDER_OUTCOMES.labels(tasks[task], "timeout").inc()
+            logger.warning(f"Search provider {tasks[task]} missed the deadline")
+
+        return self._merge(results)
+
+    def _merge(self, results: dict[str, list[dict]]) -> list[dict]:
+        # Orden estable: el de configuración, no el de llegada
+        ordered = {name: results[name] for name in self.providers if name in results}
+        return merge_results(ordered, self.max_results, self.weights)
+
+    async def _query(
+        self, name: str, provider: SearchProvider, image_url: str
+    ) -> list[dict]:
+        try:
+            items = await provider(image_url)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            SEARCH_PROVIDER_OUTCOMES.labels(name, "error").inc()
+            logger.error(f"Search provider {name} failed: {str(e)}")
+            return []
+        SEARCH_PROVIDER_OUTCOMES.labels(name, "ok").inc()
+        return items or []
+
+
+# SerpAPI es síncrono; se ejecuta en el pool de hilos. Un hilo que supera el
+# límite no se puede interrumpir, pero su resultado se descarta sin retrasar
+# la respuesta. Los proveedores de Vision usan los clientes gRPC asíncronos
+# compartidos y sí se cancelan al vencer el límite.
+async def _lens_provider(image_url: str) -> list[dict]:
+    return await asyncio.to_thread(
+        google_lens_search.search_similar_product_online, image_url
+    )
+
+
+async def _product_search_provider(image_url: str) -> list[dict]:
+    return await google_lens_search.product_search_async(image_url)
+
+
+async def _web_detection_provider(image_url: str) -> list[dict]:
+    return await google_lens_search.related_search_async(image_url)
+
+
+PROVIDERS: dict[str, SearchProvider] = {
+    "lens": _lens_provider,
+    "product_search": _product_search_provider,
+    "web_detection": _web_detection_provider,
+}
+
+
+def build_orchestrator(provider_names: list[str]) -> SearchOrchestrator:
+    unknown = [name for name in provider_names if name not in PROVIDERS]
+    if unknown:
+        raise ValueError(
+            f"Unknown search providers {unknown}, expected some of {sorted(PROVIDERS)}"
+        )
+    return SearchOrchestrator(
+        {name: PROVIDERS[name] for name in provider_names},
+        deadline_seconds=SEARCH_DEADLINE_SECONDS,
+        hedge_seconds=SEARCH_HEDGE_SECONDS if SEARCH_HEDGE_SECONDS >= 0 else None,
+        max_results=SEARCH_MAX_RESULTS,
+        # Lens es el proveedor de referencia para productos
+        weights={"lens": 1.0, "web_detection": 0.7, "product_search": 0.7},
+    )
+
+
+search_orchestrator = build_orchestrator(SEARCH_PROVIDERS)
@@ -0,0 +1,150 @@
+import sys
+import os
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+import google.auth
+from google.auth.transport.requests import Request
+from google.cloud import vision
+from google.oauth2 import service_account
+
+current_dir = os.path.dirname(__file__)  # ruta de /src/modules/search
+src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
+sys.path.append(src_dir)
+
+from config import VISION_CREDENTIALS_REFRESH_MARGIN_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+
+class VisionClientManager:
+    """
+    Clientes de Google Cloud Vision compartidos por todo el proceso.
+
+    Las credenciales se cargan una sola vez (GOOGLE_APPLICATION_CREDENTIALS o,
+    si no está definida, las credenciales por defecto del entorno) y los
+    clientes se crean una sola vez, reutilizando su canal gRPC entre
+    peticiones. Los clientes asíncronos (`grpc_asyncio`) están ligados al event
+    loop en el que se crean; si cambia el loop se vuelven a crear.
+
+    Mientras hay clientes asíncronos, una tarea en segundo plano renueva el
+    token antes de que caduque, de modo que ninguna petición espera a la
+    renovación.
+    """
+
+    def __init__(
+        self, refresh_margin_seconds: float, fallback_refresh_seconds: float = 600
+    ):
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.fallback_refresh_seconds = fallback_refresh_seconds
+        self._credentials = None
+        self._lock = threading.Lock()
+        self._vision_client = None
+        self._product_search_client = None
+        self._async_clients: dict[str, object] = {}
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def credentials(self):
+        """Credenciales de la cuenta de servicio, cargadas una sola vez."""
+        if self._credentials is None:
+            with self._lock:
+                if self._credentials is None:
+                    self._credentials = self._load_credentials()
+        return self._credentials
+
+    @staticmethod
+    def _load_credentials():
+        credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+        if credentials_path:
+            return service_account.Credentials.from_service_account_file(
+                credentials_path, scopes=_SCOPES
+            )
+        credentials, _ = google.auth.default(scopes=_SCOPES)
+        return credentials
+
+    # --- Clientes síncronos ---
+    def get_vision_client(self) -> vision.ImageAnnotatorClient:
+        if self._vision_client is None:
+            credentials = self.credentials()  # Fuera del lock: también lo toma
+            with self._lock:
+                if self._vision_client is None:
+                    self._vision_client = vision.ImageAnnotatorClient(
+                        credentials=credentials
+                    )
+        return self._vision_client
+
+    def get_product_search_client(self) -> vision.ProductSearchClient:
+        if self._product_search_client is None:
+            credentials = self.credentials()
+            with self._lock:
+                if self._product_search_client is None:
+                    self._product_search_client = vision.ProductSearchClient(
+                        credentials=credentials
+                    )
+        return self._product_search_client
+
+    # --- Clientes asíncronos ---
+    def get_async_vision_client(self) -> vision.ImageAnnotatorAsyncClient:
+        return self._get_async_client("vision", vision.ImageAnnotatorAsyncClient)
+
+    def get_async_product_search_client(self) -> vision.ProductSearchAsyncClient:
+        return self._get_async_client(
+            "product_search", vision.ProductSearchAsyncClient
+        )
+
+    def _get_async_client(self, name: str, client_class):
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            # Los canales grpc_asyncio de otro loop no se pueden reutilizar
+            self._async_clients = {}
+            self._async_loop = loop
+            self._refresh_task = None
+        if name not in self._async_clients:
+            self._async_clients[name] = client_class(credentials=self.credentials())
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = loop.create_task(self._refresh_credentials())
+        return self._async_clients[name]
+
+    async def _refresh_credentials(self):
+        credentials = self.credentials()
+        refreshed = False
+        while True:
+            if credentials.expiry is not None:
+                expiry = credentials.expiry.replace(tzinfo=timezone.utc)
+                remaining = (expiry - datetime.now(timezone.utc)).total_seconds()
+                delay = max(0.0, remaining - self.refresh_margin_seconds)
+            elif not refreshed:
+                delay = 0.0  # Aún sin token: se obtiene ya
+            else:
+                # Credenciales sin caducidad conocida: intervalo fijo
+                delay = self.fallback_refresh_seconds
+            await asyncio.sleep(delay)
+            try:
+                await asyncio.to_thread(credentials.refresh, Request())
+                refreshed = True
+                logger.debug("Google Cloud credentials refreshed")
+            except Exception as e:
+                logger.error(f"Error refreshing Google Cloud credentials: {str(e)}")
+                await asyncio.sleep(30)
+
+    async def close(self):
+        """Cancela la renovación y cierra los canales asíncronos (al apagar la app)."""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        for client in self._async_clients.values():
+            try:
+                await client.transport.close()
+            except Exception as e:
+                logger.error(f"Error closing Vision client: {str(e)}")
+        self._async_clients = {}
+        self._async_loop = None
+
+
+vision_clients = VisionClientManager(VISION_CREDENTIALS_REFRESH_MARGIN_SECONDS)
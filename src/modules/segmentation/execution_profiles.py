@@ -0,0 +1,308 @@
+import sys
+import os
+import copy
+import time
+import logging
+import contextlib
+from typing import Optional
+
+current_dir = os.path.dirname(__file__)  # ruta de /src/modules/segmentation
+src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
+sys.path.append(src_dir)
+
+from config import (
+    AUTOTUNE_IMAGE_PATH,
+    AUTOTUNE_ITERATIONS,
+    AUTOTUNE_MIN_IOU,
+    AUTOTUNE_PROFILES,
+    EXECUTION_PROFILE,
+    EXECUTION_PROFILES,
+    get_device,
+)
+
+logger = logging.getLogger(__name__)
+
+AUTO = "auto"
+REFERENCE_PROFILE = "fp32"
+_OPTIONS = {"inference_mode", "autocast", "channels_last", "compile", "num_threads", "devices"}
+
+
+class ExecutionProfile:
+    """
+    Forma de ejecutar GroundingDINO y SAM: modo sin gradientes, precisión
+    (autocast), formato de memoria, torch.compile e hilos. El perfil no cambia
+    los pesos; `prepare_dino` y `prepare_sam` retornan la variante del modelo
+    que debe usarse y `context` envuelve cada forward pass.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        inference_mode: bool = False,
+        autocast: Optional[str] = None,
+        channels_last: bool = False,
+        compile: bool = False,
+        num_threads: int = 0,
+        devices: Optional[list[str]] = None,
+    ):
+        if autocast not in (None, "float16", "bfloat16"):
+            raise ValueError(
+                f"Profile '{name}': autocast must be float16 or bfloat16, got {autocast!r}"
+            )
+        self.name = name
+        self.inference_mode = inference_mode
+        self.autocast = autocast
+        self.channels_last = channels_last
+        self.compile = compile
+        self.num_threads = num_threads
+        self.devices = devices
+
+    @classmethod
+    def from_config(cls, name: str, options: dict) -> "ExecutionProfile":
+        unknown = set(options) - _OPTIONS
+        if unknown:
+            raise ValueError(
+                f"Profile '{name}' has unknown options {sorted(unknown)}, "
+                f"expected some of {sorted(_OPTIONS)}"
+            )
+        return cls(name, **options)
+
+    def supports(self, device: str) -> bool:
+        return self.devices is None or device.split(":")[0] in self.devices
+
+    def context(self, device: str):
+        """Contexto para un forward pass con este perfil."""
+        import torch
+
+        stack = contextlib.ExitStack()
+        stack.enter_context(torch.inference_mode() if self.inference_mode else torch.no_grad())
+        if self.autocast:
+            stack.enter_context(
+                torch.autocast(
+                    device_type=device.split(":")[0], dtype=getattr(torch, self.autocast)
+                )
+            )
+        return stack
+
+    def prepare_dino(self, model):
+        import torch
+
+        if self.channels_last:
+            model.to(memory_format=torch.channels_last)
+        if self.compile:
+            # Las imágenes llegan con tamaños distintos: formas dinámicas
+            model = torch.compile(model, dynamic=True)
+        return model
+
+    def prepare_sam(self, sam_model):
+        import torch
+
+        if self.channels_last:
+            sam_model.to(memory_format=torch.channels_last)
+        if self.compile:
+            # Copia superficial: comparte pesos, pero con su propio encoder
+            # compilado (el modelo original queda intacto)
+            compiled = copy.copy(sam_model)
+            compiled._modules = dict(sam_model._modules)
+            compiled.image_encoder = torch.compile(sam_model.image_encoder)
+            sam_model = compiled
+        return sam_model
+
+    def release(self, *models):
+        """Deshace los cambios en sitio (formato de memoria) sobre los modelos base."""
+        if self.channels_last:
+            import torch
+
+            for model in models:
+                model.to(memory_format=torch.contiguous_format)
+
+    @contextlib.contextmanager
+    def threads(self):
+        """Aplica `num_threads` durante el bloque y restaura el valor anterior."""
+        import torch
+
+        previous = torch.get_num_threads()
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        try:
+            yield
+        finally:
+            torch.set_num_threads(previous)
+
+    def apply_threads(self):
+        if self.num_threads:
+            import torch
+
+            torch.set_num_threads(self.num_threads)
+
+    def __repr__(self) -> str:
+        return f"ExecutionProfile({self.name!r})"
+
+
+def get_profile(name: str) -> ExecutionProfile:
+    if name not in EXECUTION_PROFILES:
+        raise ValueError(
+            f"Unknown execution profile '{name}', expected one of "
+            f"{sorted(EXECUTION_PROFILES)} or '{AUTO}'"
+        )
+    return ExecutionProfile.from_config(name, EXECUTION_PROFILES[name])
+
+
+# Hasta que termine el autotuning se usa la referencia en precisión completa
+_active = get_profile(REFERENCE_PROFILE if EXECUTION_PROFILE == AUTO else EXECUTION_PROFILE)
+
+
+def active_profile() -> ExecutionProfile:
+    return _active
+
+
+def set_active_profile(profile: ExecutionProfile):
+    global _active
+    _active = profile
+    profile.apply_threads()
+    logger.info("Execution profile: %s", profile.name)
+
+
+def inference_context():
+    """Contexto de los forward pass de producción (perfil activo)."""
+    return _active.context(get_device())
+
+
+def select_profile(measurements: list[dict], min_iou: float) -> Optional[str]:
+    """
+    Nombre del perfil más rápido que no falló y cuyas salidas se parecen a
+    las de la referencia (IoU de la box de DINO y de la máscara de SAM >=
+    `min_iou`). None si ninguno cumple.
+    """
+    valid = [
+        m
+        for m in measurements
+        if m.get("error") is None
+        and m["dino_iou"] >= min_iou
+        and m["sam_iou"] >= min_iou
+    ]
+    if not valid:
+        return None
+    return min(valid, key=lambda m: m["latency_ms"])["profile"]
+
+
+def _calibration_image(image_path: Optional[str]):
+    from PIL import Image, ImageDraw
+
+    if image_path:
+        with Image.open(image_path) as image:
+            return image.convert("RGB")
+    # Fondo gris con un objeto rojo centrado
+    image = Image.new("RGB", (800, 600), (200, 200, 200))
+    ImageDraw.Draw(image).ellipse((200, 150, 600, 450), fill=(200, 30, 30))
+    return image
+
+
+def _box_iou(a, b) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return float(intersection / union) if union > 0 else 1.0
+
+
+def _mask_iou(a, b) -> float:
+    import numpy as np
+
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+def _measure(profile, processor, dino, sam, image, iterations: int, device: str):
+    """Retorna (ms por iteración DINO + SAM, mejor box de DINO, máscara de SAM)."""
+    import numpy as np
+    from segment_anything import SamPredictor
+
+    dino_variant = profile.prepare_dino(dino)
+    predictor = SamPredictor(profile.prepare_sam(sam))
+    inputs = processor(images=image, text="object.", return_tensors="pt").to(device)
+    image_np = np.array(image)
+    w, h = image.size
+    sam_box = np.array([w / 4, h / 4, 3 * w / 4, 3 * h / 4], dtype=np.float32)
+
+    def run():
+        with profile.context(device):
+            outputs = dino_variant(**inputs)
+            best = outputs.logits[0].sigmoid().max(-1).values.argmax()
+            cx, cy, bw, bh = outputs.pred_boxes[0, best].float().cpu().tolist()
+            predictor.set_image(image_np)
+            masks, _, _ = predictor.predict(box=sam_box[None, :], multimask_output=False)
+        return (cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2), masks[0]
+
+    with profile.threads():
+        run()  # Calentamiento (y compilación, si la hay)
+        times = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            box, mask = run()
+            times.append(time.perf_counter() - start)
+    return 1000 * float(np.median(times)), box, mask
+
+
+def autotune(
+    registry,
+    profile_names: Optional[list[str]] = None,
+    iterations: int = AUTOTUNE_ITERATIONS,
+    min_iou: float = AUTOTUNE_MIN_IOU,
+    image_path: Optional[str] = AUTOTUNE_IMAGE_PATH,
+) -> tuple[ExecutionProfile, list[dict]]:
+    """
+    Mide cada perfil sobre la imagen de calibración, elige el más rápido que
+    respeta `min_iou` frente a "fp32" y lo instala en `registry` (modelos y
+    perfil activo). Retorna el perfil elegido y las mediciones.
+    """
+    from segment_anything import SamPredictor
+
+    device = get_device()
+    processor, dino = registry.get_dino()
+    sam = registry.get_sam_predictor().model
+    image = _calibration_image(image_path)
+
+    names = [REFERENCE_PROFILE] + [
+        name for name in (profile_names or EXECUTION_PROFILES) if name != REFERENCE_PROFILE
+    ]
+    reference = None
+    measurements = []
+    for name in names:
+        profile = get_profile(name)
+        if not profile.supports(device):
+            continue
+        try:
+            latency_ms, box, mask = _measure(
+                profile, processor, dino, sam, image, iterations, device
+            )
+            if reference is None:
+                reference = (box, mask)
+            measurements.append(
+                {
+                    "profile": name,
+                    "latency_ms": latency_ms,
+                    "dino_iou": _box_iou(box, reference[0]),
+                    "sam_iou": _mask_iou(mask, reference[1]),
+                }
+            )
+        except Exception as e:
+            if reference is None:
+                raise  # Sin referencia no se puede comparar nada
+            logger.warning("Execution profile %s failed: %s", name, e)
+            measurements.append({"profile": name, "error": str(e)})
+        finally:
+            profile.release(dino, sam)
+
+    for m in measurements:
+        if m.get("error") is None:
+            logger.info(
+                "Autotune %-14s %8.1f ms  dino IoU %.3f  sam IoU %.3f",
+                m["profile"], m["latency_ms"], m["dino_iou"], m["sam_iou"],
+            )
+
+    chosen = get_profile(select_profile(measurements, min_iou) or REFERENCE_PROFILE)
+    registry.set_dino(processor, chosen.prepare_dino(dino))
+    registry.set_sam_predictor(SamPredictor(chosen.prepare_sam(sam)))
+    set_active_profile(chosen)
+    return chosen, measurements
@@ -1,50 +1,343 @@
+import numpy as np
 from PIL import Image
-import torch
 import sys
 import os
+import time
+import queue
+import threading
+from concurrent.futures import Future, InvalidStateError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Optional
 
 current_dir = os.path.dirname(__file__)  # ruta de /src/modules/segmentation
 src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
 sys.path.append(src_dir)
 
-from transformers import AutoProcessor, GroundingDinoForObjectDetection
-from config import DEVICE, GROUNDING_DINO_MODEL
+from config import (
+    DINO_BATCH_MAX_SIZE,
+    DINO_BATCH_MAX_WAIT_MS,
+    DINO_BATCH_RESULT_TIMEOUT_SECONDS,
+    DINO_TEXT_CACHE_SIZE,
+    get_device,
+)
+from modules.segmentation.execution_profiles import inference_context
+from modules.segmentation.model_registry import model_registry
+from modules.segmentation.model_server import remote_client
+from modules.segmentation.text_cache import CaptionTokenizer, install_text_cache
 from utils.utils import preprocess_caption
 
-processor = AutoProcessor.from_pretrained(GROUNDING_DINO_MODEL)
-model_dino = (
-    GroundingDinoForObjectDetection.from_pretrained(GROUNDING_DINO_MODEL)
-    .to(DEVICE)
-    .eval()
-)
+caption_tokenizer = CaptionTokenizer(DINO_TEXT_CACHE_SIZE)
 
 
-def get_grounding_dino_boxes(
-    image: Image.Image, text_prompt: str, box_threshold: float, text_threshold: float
-):
+def detect_batch(
+    images: list[Image.Image],
+    text_prompts: list[str],
+    box_threshold: float,
+    text_threshold: float,
+) -> list[dict]:
     """
-    Retorna la bounding box con el score más alto, su score y el text prompt.
+    Ejecuta GroundingDINO sobre un lote de imágenes en un único forward pass.
+
+    El processor rellena (padding) imágenes y captions hasta el tamaño mayor del
+    lote. Retorna un diccionario con 'scores', 'labels' y 'boxes' por imagen, en
+    coordenadas de la imagen original.
+
+    La tokenización y la salida del encoder de texto se cachean por caption
+    (DINO_TEXT_CACHE_SIZE), así que para prompts repetidos solo se ejecutan el
+    backbone de imagen y las capas de fusión.
     """
-    inputs = processor(
-        images=image, text=preprocess_caption(text_prompt), return_tensors="pt"
-    ).to(DEVICE)
+    processor, model_dino = model_registry.get_dino()
+    install_text_cache(model_dino, DINO_TEXT_CACHE_SIZE)
+    device = get_device()
 
-    with torch.no_grad():
+    inputs = dict(processor.image_processor(images=images, return_tensors="pt"))
+    inputs.update(
+        caption_tokenizer(
+            processor.tokenizer,
+            [preprocess_caption(prompt) for prompt in text_prompts],
+        )
+    )
+    inputs = {name: tensor.to(device) for name, tensor in inputs.items()}
+
+    with inference_context():
         outputs = model_dino(**inputs)
 
-    width, height = image.size
-    postprocessed = processor.post_process_grounded_object_detection(
+    return processor.post_process_grounded_object_detection(
         outputs=outputs,
-        input_ids=inputs.input_ids,
-        target_sizes=[(height, width)],  # (alto, ancho)
+        input_ids=inputs["input_ids"],
+        target_sizes=[(image.height, image.width) for image in images],  # (alto, ancho)
         box_threshold=box_threshold,
         text_threshold=text_threshold,
     )
 
-    results = postprocessed[0]  # Diccionario con 'scores', 'labels', 'boxes'
+
+def prewarm_text_cache(text_prompts: list[str]):
+    """
+    Precalcula la tokenización y las features de texto de los prompts más
+    habituales, con imágenes diminutas. Las features se cachean sin padding,
+    así que sirven igual para peticiones individuales que en lotes.
+    """
+    if DINO_TEXT_CACHE_SIZE <= 0 or not text_prompts:
+        return
+    dummy_image = Image.new("RGB", (64, 64), (127, 127, 127))
+    detect_batch([dummy_image] * len(text_prompts), list(text_prompts), 1.0, 1.0)
+
+
+class DinoBatchScheduler:
+    """
+    Agrupa peticiones de detección concurrentes en lotes dinámicos.
+
+    Cada llamada a `submit` encola la petición y espera su resultado. Un hilo
+    dedicado recoge peticiones durante como máximo `max_wait_ms` (o hasta
+    `max_batch_size`), ejecuta `detect_batch` una vez por combinación de umbrales
+    y reparte los resultados a cada llamante.
+
+    Toda petición recogida se resuelve, con resultado o con excepción (también
+    si el post-procesado retorna menos resultados que imágenes), y ningún
+    llamante espera más de `result_timeout` segundos.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int,
+        max_wait_ms: float,
+        result_timeout: Optional[float] = None,
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.result_timeout = result_timeout
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(
+        self,
+        image: Image.Image,
+        text_prompt: str,
+        box_threshold: float,
+        text_threshold: float,
+    ) -> dict:
+        """Encola una detección y bloquea hasta que su lote se haya procesado."""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((image, text_prompt, box_threshold, text_threshold, future))
+        try:
+            return future.result(timeout=self.result_timeout)
+        except FutureTimeoutError:
+            future.cancel()  # El hilo la descarta si aún no la ha procesado
+            raise TimeoutError(
+                f"GroundingDINO batch did not finish in {self.result_timeout}s"
+            )
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="dino-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _collect_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                self._process(batch)
+            except Exception as e:
+                # Un error inesperado no puede matar el hilo ni dejar esperando
+                for item in batch:
+                    _resolve(item[4], exception=e)
+
+    def _process(self, batch: list):
+        # post_process_grounded_object_detection usa un único par de umbrales
+        groups: dict[tuple[float, float], list] = {}
+        for item in batch:
+            if item[4].set_running_or_notify_cancel():
+                groups.setdefault((item[2], item[3]), []).append(item)
+
+        for (box_threshold, text_threshold), items in groups.items():
+            try:
+                results = detect_batch(
+                    [item[0] for item in items],
+                    [item[1] for item in items],
+                    box_threshold,
+                    text_threshold,
+                )
+            except Exception as e:
+                for item in items:
+                    _resolve(item[4], exception=e)
+                continue
+            if len(results) != len(items):
+                error = RuntimeError(
+                    f"GroundingDINO returned {len(results)} results "
+                    f"for {len(items)} images"
+                )
+                for item in items:
+                    _resolve(item[4], exception=error)
+                continue
+            for item, result in zip(items, results):
+                _resolve(item[4], result=result)
+
+
+def _resolve(future: Future, result=None, exception: Optional[BaseException] = None):
+    """Resuelve un future si nadie lo ha hecho antes."""
+    if future.done():
+        return
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+dino_scheduler = DinoBatchScheduler(
+    DINO_BATCH_MAX_SIZE, DINO_BATCH_MAX_WAIT_MS, DINO_BATCH_RESULT_TIMEOUT_SECONDS
+)
+
+
+def _detect(
+    image: Image.Image, text_prompt: str, box_threshold: float, text_threshold: float
+) -> dict:
+    """Detecta con el scheduler de lotes si está activo, o directamente."""
+    if DINO_BATCH_MAX_SIZE > 1:
+        return dino_scheduler.submit(image, text_prompt, box_threshold, text_threshold)
+    return detect_batch([image], [text_prompt], box_threshold, text_threshold)[0]
+
+
+def get_grounding_dino_boxes(
+    image: Image.Image, text_prompt: str, box_threshold: float, text_threshold: float
+):
+    """
+    Retorna la bounding box con el score más alto, su score y el text prompt.
+    """
+    remote = remote_client()
+    if remote is not None:
+        return remote.grounding_dino_boxes(image, text_prompt, box_threshold, text_threshold)
+
+    # Diccionario con 'scores', 'labels', 'boxes'
+    results = _detect(image, text_prompt, box_threshold, text_threshold)
     max_score_index = results["scores"].argmax().item()
 
     best_box = results["boxes"][max_score_index]
     best_score = results["scores"][max_score_index]
 
     return best_box, best_score, text_prompt
+
+
+def get_grounding_dino_boxes_batch(
+    images: list[Image.Image],
+    text_prompts: list[str],
+    box_threshold: float,
+    text_threshold: float,
+) -> list[Optional[tuple]]:
+    """
+    Versión por lotes de `get_grounding_dino_boxes`: un único forward pass para
+    todas las imágenes. Retorna (best_box, best_score, text_prompt) por imagen,
+    o None si en esa imagen no se detectó nada.
+    """
+    remote = remote_client()
+    if remote is not None:
+        return remote.grounding_dino_boxes_batch(
+            images, text_prompts, box_threshold, text_threshold
+        )
+
+    detections = []
+    results = detect_batch(images, text_prompts, box_threshold, text_threshold)
+    for result, text_prompt in zip(results, text_prompts):
+        if len(result["scores"]) == 0:
+            detections.append(None)
+            continue
+        max_score_index = result["scores"].argmax().item()
+        detections.append(
+            (
+                result["boxes"][max_score_index],
+                result["scores"][max_score_index],
+                text_prompt,
+            )
+        )
+    return detections
+
+
+def box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """IoU entre una box (x1, y1, x2, y2) y un array de boxes (N, 4)."""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+
+def non_max_suppression(
+    boxes: np.ndarray, scores: np.ndarray, iou_threshold: float
+) -> list[int]:
+    """
+    Índices de las boxes que se conservan, de mayor a menor score, descartando
+    las que solapan con una ya elegida más de `iou_threshold`.
+    """
+    order = np.argsort(-scores)
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(int(best))
+        rest = order[1:]
+        order = rest[box_iou(boxes[best], boxes[rest]) <= iou_threshold]
+    return keep
+
+
+def get_grounding_dino_detections(
+    image: Image.Image,
+    text_prompt: str,
+    box_threshold: float,
+    text_threshold: float,
+    top_k: int,
+    nms_iou_threshold: float = 0.0,
+) -> list[dict]:
+    """
+    Retorna hasta `top_k` detecciones por encima de `box_threshold`, de mayor a
+    menor score, como diccionarios con 'box' (np.ndarray x1, y1, x2, y2),
+    'score' y 'label'. Con `nms_iou_threshold` > 0 se aplica NMS antes de
+    quedarse con las `top_k` mejores.
+    """
+    remote = remote_client()
+    if remote is not None:
+        return remote.grounding_dino_detections(
+            image, text_prompt, box_threshold, text_threshold, top_k, nms_iou_threshold
+        )
+
+    results = _detect(image, text_prompt, box_threshold, text_threshold)
+    boxes = results["boxes"].detach().cpu().numpy()
+    scores = results["scores"].detach().cpu().numpy()
+    labels = results.get("text_labels", results["labels"])
+
+    if nms_iou_threshold > 0:
+        order = non_max_suppression(boxes, scores, nms_iou_threshold)
+    else:
+        order = np.argsort(-scores).tolist()
+
+    return [
+        {
+            "box": boxes[index],
+            "score": float(scores[index]),
+            "label": labels[index] or text_prompt,
+        }
+        for index in order[:top_k]
+    ]
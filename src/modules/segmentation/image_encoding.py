@@ -0,0 +1,123 @@
+import io
+from abc import ABC, abstractmethod
+
+import numpy as np
+from PIL import Image
+
+
+class ImageEncoder(ABC):
+    """
+    Codificador de imágenes para los recortes segmentados.
+
+    `quality` va de 1 a 100; los formatos sin pérdida lo ignoran
+    (`supports_quality = False`). La extensión de la clave en el almacén de
+    imágenes se deduce de `mime_type`.
+    """
+
+    name = ""
+    mime_type = ""
+    supports_quality = True
+
+    def encode(self, image: Image.Image, quality: int) -> bytes:
+        buffer = io.BytesIO()
+        self._save(image, buffer, quality)
+        return buffer.getvalue()
+
+    @abstractmethod
+    def _save(self, image: Image.Image, buffer: io.BytesIO, quality: int):
+        ...
+
+
+class WebPEncoder(ImageEncoder):
+    name = "webp"
+    mime_type = "image/webp"
+
+    def _save(self, image, buffer, quality):
+        image.save(buffer, "WEBP", quality=quality, method=2)
+
+
+class JpegEncoder(ImageEncoder):
+    name = "jpeg"
+    mime_type = "image/jpeg"
+
+    def _save(self, image, buffer, quality):
+        image.save(buffer, "JPEG", quality=quality, optimize=True)
+
+
+class PngEncoder(ImageEncoder):
+    name = "png"
+    mime_type = "image/png"
+    supports_quality = False
+
+    def _save(self, image, buffer, quality):
+        image.save(buffer, "PNG", optimize=True)
+
+
+ENCODERS = {
+    encoder.name: encoder for encoder in (WebPEncoder(), JpegEncoder(), PngEncoder())
+}
+
+
+def get_encoder(name: str) -> ImageEncoder:
+    """Retorna el codificador registrado con ese nombre ('webp', 'jpeg', 'png')."""
+    try:
+        return ENCODERS[name.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unknown image format '{name}', expected one of {sorted(ENCODERS)}"
+        )
+
+
+def encode_to_target_size(
+    image: Image.Image,
+    encoder: ImageEncoder,
+    target_bytes: int,
+    min_quality: int = 30,
+    max_quality: int = 85,
+    max_steps: int = 5,
+) -> bytes:
+    """
+    Codifica con la mayor calidad cuyo resultado no supera `target_bytes`.
+
+    Primero prueba `max_quality` (el caso habitual en recortes pequeños cuesta
+    una sola codificación) y si no cabe hace una búsqueda binaria de como
+    máximo `max_steps` pasos. Si ni `min_quality` cabe, retorna esa versión.
+    Con `target_bytes <= 0` codifica directamente a `max_quality`.
+    """
+    best = encoder.encode(image, max_quality)
+    if (
+        target_bytes <= 0
+        or not encoder.supports_quality
+        or len(best) <= target_bytes
+    ):
+        return best
+
+    low, high = min_quality, max_quality - 1
+    best = None
+    for _ in range(max_steps):
+        if low > high:
+            break
+        quality = (low + high) // 2
+        data = encoder.encode(image, quality)
+        if len(data) <= target_bytes:
+            best = data
+            low = quality + 1
+        else:
+            high = quality - 1
+    if best is None:
+        best = encoder.encode(image, min_quality)
+    return best
+
+
+def composite_on_white(image: Image.Image, mask: np.ndarray) -> Image.Image:
+    """
+    Pega los píxeles de `image` bajo `mask` sobre un fondo blanco.
+
+    PIL usa la máscara como alfa en `paste`, sin crear copias de 3 canales de
+    la máscara ni del fondo en numpy. `image` y `mask` deben tener el mismo
+    tamaño (recorta antes de llamar).
+    """
+    mask_image = Image.fromarray(np.ascontiguousarray(mask, dtype=bool))
+    composite = Image.new("RGB", image.size, (255, 255, 255))
+    composite.paste(image.convert("RGB"), (0, 0), mask_image)
+    return composite
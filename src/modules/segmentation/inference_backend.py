@@ -0,0 +1,87 @@
+import sys
+import os
+import logging
+
+current_dir = os.path.dirname(__file__)  # ruta de /src/modules/segmentation
+src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
+sys.path.append(src_dir)
+
+from config import (
+    INFERENCE_BACKEND,
+    INFERENCE_INTEROP_THREADS,
+    INFERENCE_NUM_THREADS,
+    get_device,
+)
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("pytorch", "int8")
+
+
+def resolve_backend(backend: str = INFERENCE_BACKEND) -> str:
+    """
+    Backend efectivo para el dispositivo actual. La cuantización dinámica int8
+    solo tiene kernels en CPU; en GPU se usa siempre "pytorch".
+    """
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown inference backend '{backend}', expected one of {BACKENDS}"
+        )
+    if backend == "int8" and get_device() != "cpu":
+        logger.warning("INFERENCE_BACKEND=int8 only applies on CPU, using pytorch")
+        return "pytorch"
+    return backend
+
+
+_threads_configured = False
+
+
+def configure_cpu_threads():
+    """
+    Fija los hilos intra-op (dentro de cada operador) e inter-op de PyTorch.
+    Con varios workers de inferencia conviene repartir los núcleos entre
+    ellos en lugar de que cada forward intente usarlos todos.
+    """
+    global _threads_configured
+    if _threads_configured:
+        return
+    import torch
+
+    if INFERENCE_NUM_THREADS > 0:
+        torch.set_num_threads(INFERENCE_NUM_THREADS)
+    if INFERENCE_INTEROP_THREADS > 0:
+        try:
+            torch.set_num_interop_threads(INFERENCE_INTEROP_THREADS)
+        except RuntimeError:
+            # Solo se puede fijar antes del primer trabajo inter-op
+            logger.warning("Inter-op threads already initialised, keeping default")
+    _threads_configured = True
+    logger.info(
+        "PyTorch CPU threads: intra-op=%d inter-op=%d",
+        torch.get_num_threads(),
+        torch.get_num_interop_threads(),
+    )
+
+
+def quantize_int8(model):
+    """
+    Cuantización dinámica int8 de las capas lineales: pesos en int8 y
+    activaciones cuantizadas al vuelo. Las capas lineales concentran casi todo
+    el cómputo de los transformers de GroundingDINO (Swin + BERT + decoder) y
+    del encoder ViT de SAM.
+    """
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def prepare_model(model, backend: str = INFERENCE_BACKEND):
+    """Adapta un modelo ya cargado (y en modo eval) al backend configurado."""
+    backend = resolve_backend(backend)
+    if get_device() == "cpu":
+        configure_cpu_threads()
+    if backend == "int8":
+        model = quantize_int8(model)
+    return model
@@ -0,0 +1,213 @@
+import sys
+import os
+import logging
+import threading
+
+current_dir = os.path.dirname(__file__)  # ruta de /src/modules/segmentation
+src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
+sys.path.append(src_dir)
+
+from config import (
+    DINO_PREWARM_PROMPTS,
+    EXECUTION_PROFILE,
+    GROUNDING_DINO_MODEL,
+    INFERENCE_BACKEND,
+    MODEL_SERVER_ADDRESS,
+    SAM_CHECKPOINT_PATH,
+    SAM_MODEL_TYPE,
+    get_device,
+)
+from modules.segmentation.execution_profiles import AUTO, active_profile
+from modules.segmentation.inference_backend import prepare_model
+from modules.segmentation.model_server import remote_client
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """
+    Carga perezosa de GroundingDINO y SAM.
+
+    Los modelos no se cargan al importar los módulos de segmentación sino la
+    primera vez que se piden, o en segundo plano con `start_warmup`. El warmup
+    ejecuta además un forward pass de prueba para inicializar kernels y
+    allocators antes de recibir tráfico.
+
+    Con MODEL_SERVER_ADDRESS los modelos viven en el servidor de modelos: el
+    warmup solo espera a que ese proceso esté listo.
+    """
+
+    def __init__(self):
+        self._dino = None  # (processor, model)
+        self._sam_predictor = None
+        self._dino_lock = threading.Lock()
+        self._sam_load_lock = threading.Lock()
+        # SamPredictor guarda estado entre set_image() y predict(); todos los
+        # usos (peticiones y warmup) deben serializarse con este lock.
+        self.sam_lock = threading.Lock()
+        self._warmup_thread = None
+        self.state = "idle"  # idle | warming | ready | error
+        self.error = None
+
+    def get_dino(self):
+        """Retorna (processor, model) de GroundingDINO, cargándolos si hace falta."""
+        if self._dino is None:
+            with self._dino_lock:
+                if self._dino is None:
+                    self._dino = self._load(self._load_dino)
+                    self._mark_loaded()
+        return self._dino
+
+    def get_sam_predictor(self):
+        """Retorna el SamPredictor compartido, cargándolo si hace falta."""
+        if self._sam_predictor is None:
+            with self._sam_load_lock:
+                if self._sam_predictor is None:
+                    self._sam_predictor = self._load(self._load_sam_predictor)
+                    self._mark_loaded()
+        return self._sam_predictor
+
+    def _load(self, loader):
+        """Ejecuta una carga; si falla, el registro queda en "error"."""
+        try:
+            return loader()
+        except Exception as e:
+            self.state = "error"
+            self.error = str(e)
+            logger.error(f"Error loading models: {str(e)}")
+            raise
+
+    def _mark_loaded(self):
+        """
+        Fuera del warmup (que fija su propio estado), una carga perezosa
+        correcta limpia un error anterior y, con ambos modelos cargados,
+        deja el registro en "ready".
+        """
+        if self.state == "warming":
+            return
+        both_loaded = self._dino is not None and self._sam_predictor is not None
+        self.state = "ready" if both_loaded else "idle"
+        self.error = None
+
+    def _load_dino(self):
+        from transformers import AutoProcessor, GroundingDinoForObjectDetection
+
+        logger.info("Loading GroundingDINO (%s)", GROUNDING_DINO_MODEL)
+        processor = AutoProcessor.from_pretrained(GROUNDING_DINO_MODEL)
+        model = (
+            GroundingDinoForObjectDetection.from_pretrained(GROUNDING_DINO_MODEL)
+            .to(get_device())
+            .eval()
+        )
+        return processor, active_profile().prepare_dino(prepare_model(model))
+
+    def _load_sam_predictor(self):
+        from segment_anything import SamPredictor, sam_model_registry
+
+        logger.info("Loading SAM (%s)", SAM_MODEL_TYPE)
+        sam_model = (
+            sam_model_registry[SAM_MODEL_TYPE](checkpoint=SAM_CHECKPOINT_PATH)
+            .to(get_device())
+            .eval()
+        )
+        return SamPredictor(active_profile().prepare_sam(prepare_model(sam_model)))
+
+    def set_dino(self, processor, model):
+        """Inyecta un GroundingDINO ya construido (benchmarks, pruebas)."""
+        self._dino = (processor, model)
+
+    def set_sam_predictor(self, predictor):
+        """Inyecta un SamPredictor ya construido (benchmarks, pruebas)."""
+        self._sam_predictor = predictor
+
+    def warmup(self):
+        """
+        Carga ambos modelos, ejecuta un forward pass con entradas de prueba y
+        precalcula las features de texto de DINO_PREWARM_PROMPTS. Con
+        EXECUTION_PROFILE=auto mide además los perfiles de ejecución e instala
+        el más rápido (ver `execution_profiles.autotune`).
+        """
+        self.state = "warming"
+        remote = remote_client()
+        if remote is not None:
+            try:
+                remote.wait_until_ready()
+                self.state = "ready"
+                logger.info("Model server at %s is ready", MODEL_SERVER_ADDRESS)
+            except Exception as e:
+                self.state = "error"
+                self.error = str(e)
+                logger.error(f"Model server is not available: {str(e)}")
+                raise
+            return
+
+        import numpy as np
+        import torch
+        from PIL import Image
+
+        try:
+            processor, model = self.get_dino()
+            dummy_image = Image.new("RGB", (64, 64), (127, 127, 127))
+            inputs = processor(
+                images=dummy_image, text="object.", return_tensors="pt"
+            ).to(get_device())
+            with torch.no_grad():
+                model(**inputs)
+
+            if DINO_PREWARM_PROMPTS:
+                from modules.segmentation.grounding_dino import prewarm_text_cache
+
+                prewarm_text_cache(DINO_PREWARM_PROMPTS)
+
+            predictor = self.get_sam_predictor()
+            with self.sam_lock:
+                predictor.set_image(np.full((64, 64, 3), 127, dtype=np.uint8))
+                predictor.reset_image()
+
+            if EXECUTION_PROFILE == AUTO:
+                from modules.segmentation.execution_profiles import autotune
+
+                with self.sam_lock:
+                    autotune(self)
+
+            self.state = "ready"
+            logger.info("Models warmed up and ready")
+        except Exception as e:
+            self.state = "error"
+            self.error = str(e)
+            logger.error(f"Error warming up models: {str(e)}")
+            raise
+
+    def start_warmup(self) -> threading.Thread:
+        """Lanza `warmup` en un hilo en segundo plano (idempotente)."""
+        if self._warmup_thread is None:
+            self.state = "warming"
+            self._warmup_thread = threading.Thread(
+                target=self._warmup_quietly, name="model-warmup", daemon=True
+            )
+            self._warmup_thread.start()
+        return self._warmup_thread
+
+    def _warmup_quietly(self):
+        try:
+            self.warmup()
+        except Exception:
+            pass  # El error queda registrado en self.state / self.error
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "backend": INFERENCE_BACKEND,
+            "execution_profile": active_profile().name,
+            "dino_loaded": self._dino is not None,
+            "sam_loaded": self._sam_predictor is not None,
+            "model_server": MODEL_SERVER_ADDRESS or None,
+            "error": self.error,
+        }
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,409 @@
+import sys
+import os
+import time
+import queue
+import logging
+import threading
+from multiprocessing import resource_tracker
+from multiprocessing.connection import AuthenticationError, Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Optional
+
+import numpy as np
+from PIL import Image
+
+current_dir = os.path.dirname(__file__)  # ruta de /src/modules/segmentation
+src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
+sys.path.append(src_dir)
+
+from config import (
+    MODEL_SERVER_ADDRESS,
+    MODEL_SERVER_AUTHKEY,
+    MODEL_SERVER_TIMEOUT_SECONDS,
+    MODEL_WARMUP_ON_STARTUP,
+)
+
+logger = logging.getLogger(__name__)
+
+# Alineación de cada array dentro del segmento de memoria compartida
+_ALIGNMENT = 64
+# Las conexiones se autentican con un secreto compartido (HMAC) y las
+# peticiones se deserializan con pickle: sin secreto no se arranca nada
+MIN_AUTHKEY_BYTES = 16
+LOOPBACK_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+
+class ModelServerError(RuntimeError):
+    """Fallo de una llamada al servidor de modelos (conexión o inferencia)."""
+
+
+def parse_address(address: str):
+    """
+    "host:puerto" -> (host, puerto); cualquier otro valor es un socket Unix.
+    Solo se admiten hosts de loopback: el servidor no debe ser accesible
+    desde otras máquinas.
+    """
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit() and "/" not in address:
+        host = host.strip("[]") or "127.0.0.1"
+        if host not in LOOPBACK_HOSTS:
+            raise ValueError(
+                f"Model server address must be a Unix socket path or a loopback "
+                f"host (127.0.0.1, localhost, ::1), got {address!r}"
+            )
+        return (host, int(port))
+    return address
+
+
+def check_authkey(authkey: bytes):
+    if len(authkey or b"") < MIN_AUTHKEY_BYTES:
+        raise ValueError(
+            f"Set MODEL_SERVER_AUTHKEY to a secret of at least {MIN_AUTHKEY_BYTES} "
+            "bytes, shared by the model server and the API workers"
+        )
+
+
+def _layout(specs: list[tuple]) -> tuple[list[int], int]:
+    """Offsets de cada array (forma, dtype) en el segmento y tamaño total."""
+    offsets = []
+    size = 0
+    for shape, dtype in specs:
+        offsets.append(size)
+        nbytes = int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+        size += -(-nbytes // _ALIGNMENT) * _ALIGNMENT
+    return offsets, max(size, 1)
+
+
+def _views(segment: SharedMemory, specs: list[tuple]) -> list[np.ndarray]:
+    offsets, _ = _layout(specs)
+    return [
+        np.ndarray(shape, dtype=dtype, buffer=segment.buf, offset=offset)
+        for (shape, dtype), offset in zip(specs, offsets)
+    ]
+
+
+def _attach(name: str) -> SharedMemory:
+    """Abre un segmento creado por el cliente, que es quien lo libera."""
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    segment = SharedMemory(name=name)
+    # Antes de 3.13 abrir un segmento también lo registra en el resource
+    # tracker de este proceso, que lo borraría (y avisaría) al terminar
+    resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+def _to_numpy(value) -> np.ndarray:
+    if hasattr(value, "detach"):
+        value = value.detach().float().cpu().numpy()
+    return np.asarray(value)
+
+
+class ModelServerClient:
+    """
+    Cliente del servidor de modelos.
+
+    Cada llamada crea un segmento de memoria compartida con las entradas
+    (imágenes) y el hueco de las salidas (máscaras), que el servidor lee y
+    rellena en sitio; por la conexión solo viajan el nombre del segmento, las
+    formas y los parámetros. El cliente es dueño del segmento y lo libera al
+    terminar la llamada.
+
+    Una conexión no admite llamadas simultáneas: se mantiene un pool de
+    conexiones abiertas y cada llamada usa una libre (o abre otra).
+    """
+
+    def __init__(self, address: str, authkey: bytes, timeout: float):
+        check_authkey(authkey)
+        parse_address(address)
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+
+    def _connect(self):
+        try:
+            return Client(parse_address(self.address), authkey=self.authkey)
+        except (OSError, AuthenticationError) as e:
+            raise ModelServerError(
+                f"Cannot reach the model server at {self.address}: {e}"
+            ) from e
+
+    def _roundtrip(self, request: dict):
+        for attempt in range(2):
+            try:
+                connection, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                connection, reused = self._connect(), False
+            try:
+                connection.send(request)
+                if not connection.poll(self.timeout):
+                    connection.close()
+                    raise ModelServerError(
+                        f"Model server did not answer {request['method']} "
+                        f"within {self.timeout:.0f}s"
+                    )
+                status, payload = connection.recv()
+            except (OSError, EOFError) as e:
+                connection.close()
+                if reused and attempt == 0:
+                    continue  # Conexión del pool caída (p. ej. servidor reiniciado)
+                raise ModelServerError(f"Lost connection to the model server: {e}") from e
+            self._idle.put(connection)
+            if status == "error":
+                raise ModelServerError(payload)
+            return payload
+
+    def call(
+        self, method: str, inputs: list[np.ndarray] = (), outputs: list[tuple] = (), **args
+    ):
+        """
+        Ejecuta `method` en el servidor. `inputs` son arrays que se copian a
+        memoria compartida y `outputs` las (forma, dtype) de los arrays que el
+        servidor rellena. Retorna (resultado, arrays de salida).
+        """
+        inputs = [np.ascontiguousarray(array) for array in inputs]
+        specs = [(array.shape, array.dtype.str) for array in inputs] + [
+            (tuple(shape), np.dtype(dtype).str) for shape, dtype in outputs
+        ]
+        request = {"method": method, "args": args, "segment": None, "inputs": len(inputs)}
+        if not specs:
+            return self._roundtrip(request), []
+
+        segment = SharedMemory(create=True, size=_layout(specs)[1])
+        views = _views(segment, specs)
+        try:
+            for index, array in enumerate(inputs):
+                views[index][...] = array
+            request.update(segment=segment.name, specs=specs)
+            result = self._roundtrip(request)
+            # Copia: el segmento se libera al salir
+            return result, [np.array(view) for view in views[len(inputs):]]
+        finally:
+            views = None  # Sin vistas vivas el segmento se puede cerrar
+            segment.close()
+            segment.unlink()
+
+    def status(self) -> dict:
+        return self.call("status")[0]
+
+    def wait_until_ready(self, poll_seconds: float = 1.0) -> dict:
+        """Espera a que el servidor responda y termine su warmup."""
+        while True:
+            try:
+                status = self.status()
+            except ModelServerError as e:
+                logger.info("Waiting for the model server: %s", e)
+                time.sleep(poll_seconds)
+                continue
+            if status["state"] == "error":
+                raise ModelServerError(f"Model server failed to load: {status['error']}")
+            if status["state"] != "warming":
+                return status
+            time.sleep(poll_seconds)
+
+    # --- Equivalentes remotos de las funciones de inferencia ---
+    def grounding_dino_boxes(self, image, text_prompt, box_threshold, text_threshold):
+        (box, score, prompt), _ = self.call(
+            "grounding_dino_boxes",
+            [np.asarray(image)],
+            text_prompt=text_prompt,
+            box_threshold=box_threshold,
+            text_threshold=text_threshold,
+        )
+        return box, score, prompt
+
+    def grounding_dino_boxes_batch(self, images, text_prompts, box_threshold, text_threshold):
+        detections, _ = self.call(
+            "grounding_dino_boxes_batch",
+            [np.asarray(image) for image in images],
+            text_prompts=list(text_prompts),
+            box_threshold=box_threshold,
+            text_threshold=text_threshold,
+        )
+        return detections
+
+    def grounding_dino_detections(
+        self, image, text_prompt, box_threshold, text_threshold, top_k, nms_iou_threshold
+    ):
+        detections, _ = self.call(
+            "grounding_dino_detections",
+            [np.asarray(image)],
+            text_prompt=text_prompt,
+            box_threshold=box_threshold,
+            text_threshold=text_threshold,
+            top_k=top_k,
+            nms_iou_threshold=nms_iou_threshold,
+        )
+        return detections
+
+    def segment_with_sam(self, image_pil, box, multimask_output):
+        image_np = np.asarray(image_pil)
+        score, (mask,) = self.call(
+            "segment_with_sam",
+            [image_np],
+            [(image_np.shape[:2], np.bool_)],
+            box=_to_numpy(box),
+            multimask_output=multimask_output,
+        )
+        return mask, score
+
+    def segment_boxes_with_sam(self, image_pil, boxes):
+        image_np = np.asarray(image_pil)
+        boxes = _to_numpy(boxes)
+        scores, (masks,) = self.call(
+            "segment_boxes_with_sam",
+            [image_np],
+            [((len(boxes), *image_np.shape[:2]), np.bool_)],
+            boxes=boxes,
+        )
+        return masks, scores
+
+
+def local_handlers() -> dict[str, Callable]:
+    """
+    Métodos del servidor sobre los modelos de este proceso. Cada uno recibe
+    las entradas y salidas (vistas de la memoria compartida) y los parámetros.
+    """
+    from modules.segmentation import grounding_dino, sam_segmentation
+    from modules.segmentation.model_registry import model_registry
+
+    def grounding_dino_boxes(inputs, outputs, **args):
+        box, score, prompt = grounding_dino.get_grounding_dino_boxes(
+            Image.fromarray(inputs[0]), **args
+        )
+        return _to_numpy(box), float(score), prompt
+
+    def grounding_dino_boxes_batch(inputs, outputs, **args):
+        detections = grounding_dino.get_grounding_dino_boxes_batch(
+            [Image.fromarray(image) for image in inputs], **args
+        )
+        return [
+            None if d is None else (_to_numpy(d[0]), float(d[1]), d[2]) for d in detections
+        ]
+
+    def grounding_dino_detections(inputs, outputs, **args):
+        return grounding_dino.get_grounding_dino_detections(
+            Image.fromarray(inputs[0]), **args
+        )
+
+    def segment_with_sam(inputs, outputs, **args):
+        mask, score = sam_segmentation.segment_with_sam(Image.fromarray(inputs[0]), **args)
+        outputs[0][...] = mask
+        return score
+
+    def segment_boxes_with_sam(inputs, outputs, **args):
+        masks, scores = sam_segmentation.segment_boxes_with_sam(
+            Image.fromarray(inputs[0]), **args
+        )
+        outputs[0][...] = masks
+        return scores
+
+    return {
+        "status": lambda inputs, outputs: model_registry.status(),
+        "grounding_dino_boxes": grounding_dino_boxes,
+        "grounding_dino_boxes_batch": grounding_dino_boxes_batch,
+        "grounding_dino_detections": grounding_dino_detections,
+        "segment_with_sam": segment_with_sam,
+        "segment_boxes_with_sam": segment_boxes_with_sam,
+    }
+
+
+class ModelServer:
+    """
+    Proceso que carga GroundingDINO y SAM una sola vez y atiende la inferencia
+    de todos los workers de la API.
+
+    Cada conexión se atiende en su propio hilo; las peticiones concurrentes de
+    distintos workers se agrupan en el scheduler de lotes de DINO y se
+    serializan en SAM igual que dentro de un único proceso.
+    """
+
+    def __init__(self, address: str, authkey: bytes, handlers: dict[str, Callable]):
+        check_authkey(authkey)
+        parse_address(address)
+        self.address = address
+        self.authkey = authkey
+        self.handlers = handlers
+
+    def serve_forever(self):
+        address = parse_address(self.address)
+        if isinstance(address, str) and os.path.exists(address):
+            os.unlink(address)  # Socket de una ejecución anterior
+        with Listener(address, authkey=self.authkey) as listener:
+            if isinstance(address, str):
+                os.chmod(address, 0o600)  # Solo el usuario del servidor
+            logger.info("Model server listening on %s", self.address)
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    logger.warning("Rejected model server connection: %s", e)
+                    continue
+                threading.Thread(
+                    target=self._serve_connection, args=(connection,), daemon=True
+                ).start()
+
+    def _serve_connection(self, connection):
+        with connection:
+            while True:
+                try:
+                    request = connection.recv()
+                except (OSError, EOFError):
+                    return  # El worker cerró la conexión
+                response = self._dispatch(request)
+                try:
+                    connection.send(response)
+                except OSError:
+                    return  # El worker dejó de esperar (timeout) y cerró
+
+    def _dispatch(self, request: dict) -> tuple:
+        handler = self.handlers.get(request["method"])
+        if handler is None:
+            return "error", f"Unknown model server method '{request['method']}'"
+
+        segment = _attach(request["segment"]) if request["segment"] else None
+        try:
+            views = _views(segment, request["specs"]) if segment else []
+            count = request["inputs"]
+            return "ok", handler(views[:count], views[count:], **request["args"])
+        except Exception as e:
+            logger.exception("Model server method %s failed", request["method"])
+            return "error", f"{type(e).__name__}: {e}"
+        finally:
+            views = None  # Sin vistas vivas el segmento se puede cerrar
+            if segment is not None:
+                segment.close()
+
+
+# Cliente de este proceso: None sin MODEL_SERVER_ADDRESS y dentro del propio
+# servidor (que ejecuta los modelos en local)
+_client = (
+    ModelServerClient(MODEL_SERVER_ADDRESS, MODEL_SERVER_AUTHKEY, MODEL_SERVER_TIMEOUT_SECONDS)
+    if MODEL_SERVER_ADDRESS
+    else None
+)
+
+
+def remote_client() -> Optional[ModelServerClient]:
+    return _client
+
+
+def serve(
+    address: str,
+    authkey: bytes,
+    handlers: Optional[dict[str, Callable]] = None,
+    warmup: bool = MODEL_WARMUP_ON_STARTUP,
+):
+    """Arranca el servidor de modelos en este proceso (no retorna)."""
+    global _client
+    check_authkey(authkey)
+    parse_address(address)
+    _client = None
+    if handlers is None:
+        handlers = local_handlers()
+    if warmup:
+        from modules.segmentation.model_registry import model_registry
+
+        model_registry.start_warmup()
+    ModelServer(address, authkey, handlers).serve_forever()
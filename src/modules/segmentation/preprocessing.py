@@ -0,0 +1,155 @@
+import io
+import math
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Orientaciones EXIF que intercambian ancho y alto (rotaciones de 90/270 grados)
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+_EXIF_ORIENTATION_TAG = 0x0112
+
+
+def _oriented_size(image: Image.Image) -> tuple[int, int]:
+    """Tamaño (ancho, alto) de la imagen una vez aplicada su orientación EXIF."""
+    orientation = image.getexif().get(_EXIF_ORIENTATION_TAG, 1)
+    if orientation in _TRANSPOSED_ORIENTATIONS:
+        return image.height, image.width
+    return image.width, image.height
+
+
+def decode_image(image_bytes: bytes, max_side: Optional[int] = None) -> Image.Image:
+    """
+    Decodifica una imagen en RGB aplicando su orientación EXIF.
+
+    Con `max_side`, el lado mayor del resultado no supera ese valor. En JPEG se
+    usa el modo `draft` del decodificador, que reduce la imagen a 1/2, 1/4 o 1/8
+    durante la propia decodificación (más rápido y sin reservar memoria para la
+    resolución completa); el ajuste fino se hace después con `thumbnail`.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    if max_side is not None and max(image.size) > max_side:
+        # draft elige la menor escala que sigue siendo >= al tamaño pedido
+        scale = max_side / max(image.size)
+        image.draft(
+            "RGB",
+            (math.ceil(image.width * scale), math.ceil(image.height * scale)),
+        )
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    if max_side is not None and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+    return image
+
+
+def downscale(image: Image.Image, max_side: int) -> Image.Image:
+    """Copia de la imagen con el lado mayor limitado a `max_side`."""
+    if max(image.size) <= max_side:
+        return image
+    resized = image.copy()
+    resized.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+    return resized
+
+
+def scale_box(
+    box, from_size: tuple[int, int], to_size: tuple[int, int]
+) -> np.ndarray:
+    """
+    Proyecta una bounding box (x1, y1, x2, y2) de una imagen de tamaño
+    `from_size` a otra de tamaño `to_size` (ambos como (ancho, alto)).
+    """
+    if hasattr(box, "cpu"):  # torch.Tensor
+        box = box.cpu().numpy()
+    sx = to_size[0] / from_size[0]
+    sy = to_size[1] / from_size[1]
+    return np.asarray(box, dtype=np.float32) * np.array(
+        [sx, sy, sx, sy], dtype=np.float32
+    )
+
+
+def mask_crop_bounds(
+    mask: np.ndarray, margin_ratio: float = 0.1
+) -> tuple[int, int, int, int]:
+    """
+    Límites (x1, y1, x2, y2) de la máscara con un margen del `margin_ratio` del
+    ancho de la región, recortados a los límites de la imagen.
+    """
+    rows = np.any(mask, axis=1)
+    cols = np.any(mask, axis=0)
+    y1, y2 = np.where(rows)[0][[0, -1]]
+    x1, x2 = np.where(cols)[0][[0, -1]]
+
+    margin = int((x2 - x1) * margin_ratio)
+    height, width = mask.shape
+    return (
+        max(0, x1 - margin),
+        max(0, y1 - margin),
+        min(width, x2 + margin),
+        min(height, y2 + margin),
+    )
+
+
+class PreparedImage:
+    """
+    Imagen subida preparada para el pipeline.
+
+    Se decodifica una sola vez a la resolución de trabajo mayor (la de DINO) y
+    de ella se obtiene la de SAM. La resolución completa solo se decodifica al
+    final, en `full_resolution_crop`, para el recorte que se sube y se busca.
+    """
+
+    def __init__(self, image_bytes: bytes, dino_max_side: int, sam_max_side: int):
+        self.image_bytes = image_bytes
+        with Image.open(io.BytesIO(image_bytes)) as header:
+            self.full_size = _oriented_size(header)
+        self.dino_image = decode_image(image_bytes, max(dino_max_side, sam_max_side))
+        if max(self.dino_image.size) > dino_max_side:
+            self.dino_image = downscale(self.dino_image, dino_max_side)
+        self.sam_image = downscale(self.dino_image, sam_max_side)
+
+    def dino_box_to_sam(self, box) -> np.ndarray:
+        """Proyecta una box de DINO a coordenadas de la imagen de SAM."""
+        return scale_box(box, self.dino_image.size, self.sam_image.size)
+
+    def full_resolution_crop(
+        self, mask: np.ndarray
+    ) -> tuple[Image.Image, np.ndarray]:
+        """
+        Recorta la imagen original a resolución completa alrededor de la
+        máscara (calculada sobre la imagen de SAM) y retorna el recorte y su
+        máscara reescalada al mismo tamaño.
+        """
+        return self.full_resolution_crops([mask])[0]
+
+    def full_resolution_crops(
+        self, masks: list[np.ndarray]
+    ) -> list[tuple[Image.Image, np.ndarray]]:
+        """Como `full_resolution_crop`, decodificando el original una sola vez."""
+        if self.full_size == self.sam_image.size:
+            full_image = self.sam_image
+        else:
+            full_image = decode_image(self.image_bytes)
+        crops = [self._crop(full_image, mask) for mask in masks]
+        del full_image  # Solo se conservan los recortes
+        return crops
+
+    def _crop(
+        self, full_image: Image.Image, mask: np.ndarray
+    ) -> tuple[Image.Image, np.ndarray]:
+        x1, y1, x2, y2 = mask_crop_bounds(mask)
+        box = scale_box(
+            (x1, y1, x2, y2), self.sam_image.size, self.full_size
+        ).round().astype(int)
+        full_box = (
+            max(0, box[0]),
+            max(0, box[1]),
+            min(self.full_size[0], max(box[2], box[0] + 1)),
+            min(self.full_size[1], max(box[3], box[1] + 1)),
+        )
+        cropped_image = full_image.crop(full_box)
+
+        mask_crop = Image.fromarray(mask[y1:y2, x1:x2].astype(np.uint8) * 255)
+        cropped_mask = (
+            np.array(mask_crop.resize(cropped_image.size, Image.Resampling.NEAREST))
+            > 127
+        )
+        return cropped_image, cropped_mask
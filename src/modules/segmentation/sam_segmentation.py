@@ -1,30 +1,83 @@
 import numpy as np
 from PIL import Image
 
-# Segment-Anything
-from segment_anything import SamPredictor, sam_model_registry
-
 import sys
 import os
-import torch
+import hashlib
+from typing import TYPE_CHECKING, BinaryIO, Union
 
 current_dir = os.path.dirname(__file__)  # ruta de /src/modules/segmentation
 src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
 sys.path.append(src_dir)
 
-from config import DEVICE, SAM_CHECKPOINT_PATH, SAM_MODEL_TYPE
-
-# -------------------------
-#   1) CARGAR MODELOS
-# -------------------------
-sam_model = sam_model_registry[SAM_MODEL_TYPE](checkpoint=SAM_CHECKPOINT_PATH).to(
-    DEVICE
+from config import (
+    SAM_EMBEDDING_CACHE_BYTES,
+    SEGMENTED_IMAGE_FORMAT,
+    SEGMENTED_IMAGE_MAX_QUALITY,
+    SEGMENTED_IMAGE_MAX_SIDE,
+    SEGMENTED_IMAGE_MIN_QUALITY,
+    SEGMENTED_IMAGE_TARGET_BYTES,
+)
+from modules.segmentation.image_encoding import (
+    composite_on_white,
+    encode_to_target_size,
+    get_encoder,
 )
-sam_predictor = SamPredictor(sam_model)
+from modules.segmentation.execution_profiles import inference_context
+from modules.segmentation.model_registry import model_registry
+from modules.segmentation.model_server import remote_client
+from modules.segmentation.preprocessing import mask_crop_bounds
+from utils.lru import LRUCache
+
+if TYPE_CHECKING:
+    import torch
+
+# Embeddings de imagen de SAM por hash del contenido, acotados en bytes: la
+# misma foto con otro `text_prompt` reutiliza la salida del encoder ViT
+sam_embedding_cache = LRUCache(max_bytes=SAM_EMBEDDING_CACHE_BYTES)
+segmented_image_encoder = get_encoder(SEGMENTED_IMAGE_FORMAT)
+
+
+def image_cache_key(image_np: np.ndarray) -> str:
+    """Hash del contenido (píxeles, forma y tipo) de una imagen."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image_np.shape}|{image_np.dtype}".encode())
+    digest.update(np.ascontiguousarray(image_np).data)
+    return digest.hexdigest()
+
+
+def set_image_cached(sam_predictor, image_np: np.ndarray):
+    """
+    Equivalente a `sam_predictor.set_image` que reutiliza los embeddings de
+    imágenes ya vistas. Debe llamarse con `model_registry.sam_lock` adquirido.
+    """
+    if SAM_EMBEDDING_CACHE_BYTES <= 0:
+        sam_predictor.set_image(image_np)
+        return
+
+    key = image_cache_key(image_np)
+    cached = sam_embedding_cache.get(key)
+    if cached is not None:
+        # Acierto: se restaura el estado del predictor sin ejecutar el encoder
+        features, original_size, input_size = cached
+        sam_predictor.reset_image()
+        sam_predictor.features = features
+        sam_predictor.original_size = original_size
+        sam_predictor.input_size = input_size
+        sam_predictor.is_image_set = True
+        return
+
+    sam_predictor.set_image(image_np)
+    features = sam_predictor.features
+    sam_embedding_cache.put(
+        key,
+        (features, sam_predictor.original_size, sam_predictor.input_size),
+        features.element_size() * features.nelement(),
+    )
 
 
 def segment_with_sam(
-    image_pil: Image.Image, box: torch.Tensor, multimask_output=False
+    image_pil: Image.Image, box: "torch.Tensor", multimask_output=False
 ) -> tuple[np.ndarray, float]:
     """
     Segmenta una imagen usando SAM y retorna la máscara y el porcentaje de confianza.
@@ -32,17 +85,22 @@ def segment_with_sam(
     Returns:
         tuple[np.ndarray, float]: Máscara binaria y score de confianza
     """
-    image_np = np.array(image_pil)
-    sam_predictor.set_image(image_np)
+    remote = remote_client()
+    if remote is not None:
+        return remote.segment_with_sam(image_pil, box, multimask_output)
 
-    input_box = box.numpy()
-
-    mask_predictions, scores, _ = sam_predictor.predict(
-        point_coords=None,
-        point_labels=None,
-        box=input_box[None, :],
-        multimask_output=multimask_output,
-    )
+    image_np = np.array(image_pil)
+    input_box = box.cpu().numpy() if hasattr(box, "cpu") else np.asarray(box)
+
+    sam_predictor = model_registry.get_sam_predictor()
+    with model_registry.sam_lock, inference_context():
+        set_image_cached(sam_predictor, image_np)
+        mask_predictions, scores, _ = sam_predictor.predict(
+            point_coords=None,
+            point_labels=None,
+            box=input_box[None, :],
+            multimask_output=multimask_output,
+        )
 
     best_mask_idx = np.argmax(scores)
     confidence_score = float(
@@ -51,56 +109,105 @@ def segment_with_sam(
     return mask_predictions[best_mask_idx], confidence_score
 
 
+def segment_boxes_with_sam(
+    image_pil: Image.Image, boxes: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Segmenta varias boxes (N, 4) de una misma imagen con una sola pasada del
+    encoder de SAM (`set_image`) y una predicción por lotes (`predict_torch`).
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Máscaras (N, alto, ancho) y scores (N,)
+    """
+    remote = remote_client()
+    if remote is not None:
+        return remote.segment_boxes_with_sam(image_pil, boxes)
+
+    import torch
+
+    image_np = np.array(image_pil)
+    sam_predictor = model_registry.get_sam_predictor()
+    with model_registry.sam_lock, inference_context():
+        set_image_cached(sam_predictor, image_np)
+        input_boxes = sam_predictor.transform.apply_boxes_torch(
+            torch.as_tensor(boxes, dtype=torch.float32, device=sam_predictor.device),
+            image_np.shape[:2],
+        )
+        masks, scores, _ = sam_predictor.predict_torch(
+            point_coords=None,
+            point_labels=None,
+            boxes=input_boxes,
+            multimask_output=False,
+        )
+
+    # Con multimask_output=False hay una máscara por box: (N, 1, H, W)
+    return masks[:, 0].cpu().numpy(), scores[:, 0].float().cpu().numpy()
+
+
+def crop_to_mask(
+    image_pil: Image.Image, mask: np.ndarray
+) -> tuple[Image.Image, np.ndarray]:
+    """
+    Recorta la imagen y la máscara al bounding box de la máscara con un margen
+    adicional del 10%, sin convertir la imagen completa a numpy.
+    """
+    x1, y1, x2, y2 = mask_crop_bounds(mask)
+    return image_pil.crop((x1, y1, x2, y2)), mask[y1:y2, x1:x2]
+
+
+def render_segmented_image(image_pil: Image.Image, mask: np.ndarray) -> Image.Image:
+    """
+    Recorta al objeto y pega sus píxeles sobre fondo blanco, con el lado mayor
+    limitado a SEGMENTED_IMAGE_MAX_SIDE. Se reduce antes de componer para no
+    procesar píxeles que luego se descartarían.
+    """
+    cropped_image, cropped_mask = crop_to_mask(image_pil, mask)
+    longest = max(cropped_image.size)
+    if 0 < SEGMENTED_IMAGE_MAX_SIDE < longest:
+        scale = SEGMENTED_IMAGE_MAX_SIDE / longest
+        size = (
+            max(1, round(cropped_image.width * scale)),
+            max(1, round(cropped_image.height * scale)),
+        )
+        cropped_image = cropped_image.resize(size, Image.Resampling.BICUBIC)
+        cropped_mask = np.array(
+            Image.fromarray(cropped_mask).resize(size, Image.Resampling.NEAREST)
+        )
+    return composite_on_white(cropped_image, cropped_mask)
+
+
 def save_optimized_segmented_image(
-    image_pil: Image.Image, mask: np.ndarray, output_path: str
+    image_pil: Image.Image, mask: np.ndarray, output: Union[str, BinaryIO]
 ):
     """
-    Guarda la imagen segmentada en formato JPEG optimizado con fondo blanco,
-    recortada al bounding box con un margen adicional del 10%.
+    Guarda la imagen segmentada con fondo blanco, recortada al bounding box con
+    un margen adicional del 10%, en el formato configurado
+    (SEGMENTED_IMAGE_FORMAT) y ajustando la calidad para no superar
+    SEGMENTED_IMAGE_TARGET_BYTES.
 
     Args:
         image_pil: Imagen original
         mask: Máscara binaria
-        output_path: Ruta de salida para la imagen
+        output: Ruta de salida o buffer binario (p. ej. `io.BytesIO`)
 
     Returns:
-        str: Ruta de la imagen guardada
+        Ruta o buffer donde se ha guardado la imagen
     """
-    # Encontrar los límites de la máscara
-    rows = np.any(mask, axis=1)
-    cols = np.any(mask, axis=0)
-    y1, y2 = np.where(rows)[0][[0, -1]]
-    x1, x2 = np.where(cols)[0][[0, -1]]
-
-    # Calcular el margen (10% del ancho de la región)
-    width = x2 - x1
-    margin = int(width * 0.1)
-
-    # Ajustar las coordenadas con el margen, asegurando que no excedan los límites de la imagen
-    x1 = max(0, x1 - margin)
-    y1 = max(0, y1 - margin)
-    x2 = min(image_pil.width, x2 + margin)
-    y2 = min(image_pil.height, y2 + margin)
-
-    # Recortar la imagen y la máscara
-    image_rgb = image_pil.convert("RGB")
-    image_np = np.array(image_rgb)
-    cropped_image = image_np[y1:y2, x1:x2]
-    cropped_mask = mask[y1:y2, x1:x2]
-
-    # Expandir la máscara a 3 canales
-    mask_3channel = np.repeat(cropped_mask[:, :, np.newaxis], 3, axis=2)
-
-    # Crear fondo blanco del mismo tamaño
-    white_background = np.full_like(cropped_image, 255)
-
-    # Combinar imagen original y fondo blanco
-    segmented_image = np.where(mask_3channel, cropped_image, white_background).astype(
-        np.uint8
+    data = encode_segmented_image(image_pil, mask)
+    if isinstance(output, str):
+        with open(output, "wb") as f:
+            f.write(data)
+    else:
+        output.write(data)
+    return output
+
+
+def encode_segmented_image(image_pil: Image.Image, mask: np.ndarray) -> bytes:
+    """Codifica la imagen segmentada en memoria, sin pasar por disco."""
+    return encode_to_target_size(
+        render_segmented_image(image_pil, mask),
+        segmented_image_encoder,
+        SEGMENTED_IMAGE_TARGET_BYTES,
+        min_quality=SEGMENTED_IMAGE_MIN_QUALITY,
+        max_quality=SEGMENTED_IMAGE_MAX_QUALITY,
     )
-
-    # Convertir y guardar
-    segmented_pil = Image.fromarray(segmented_image)
-    segmented_pil.save(output_path, "JPEG", quality=50, optimize=True)
-
-    return output_path
@@ -0,0 +1,148 @@
+import sys
+import os
+
+current_dir = os.path.dirname(__file__)  # ruta de /src/modules/segmentation
+src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
+sys.path.append(src_dir)
+
+from utils.lru import LRUCache
+
+
+class CaptionTokenizer:
+    """
+    Tokenización de captions de GroundingDINO memoizada por caption ya
+    normalizada (ver `preprocess_caption`). Cada caption se tokeniza una vez y
+    los lotes se rellenan (padding "longest") a partir de las entradas cacheadas.
+    """
+
+    def __init__(self, max_entries: int):
+        self.cache = LRUCache(max_entries)
+
+    def __call__(self, tokenizer, captions: list[str]):
+        encodings = []
+        for caption in captions:
+            key = (id(tokenizer), caption)
+            encoding = self.cache.get(key)
+            if encoding is None:
+                encoding = dict(tokenizer(caption, return_token_type_ids=True))
+                self.cache.put(key, encoding)
+            encodings.append(encoding)
+        return tokenizer.pad(encodings, padding="longest", return_tensors="pt")
+
+
+def _unpadded_length(ids, pad_token_id: int) -> int:
+    """Longitud real de una fila de input_ids rellenada por la derecha."""
+    nonpad = (ids != pad_token_id).nonzero()
+    return int(nonpad[-1]) + 1 if len(nonpad) else 0
+
+
+def make_cached_text_backbone(backbone, max_entries: int):
+    """
+    Envuelve el text backbone (BERT) de GroundingDINO con una caché LRU por
+    caption: la clave son los input_ids sin padding y el valor, su
+    `last_hidden_state` sin padding. Así una caption cacheada se reutiliza
+    aunque llegue en un lote con captions más largas (el padding depende del
+    lote). Las captions nuevas se codifican sin padding, agrupadas por
+    longitud, y el resultado se rellena con ceros hasta la longitud del lote;
+    esas posiciones las enmascara `text_token_mask` en el resto del modelo. La
+    proyección y las capas de fusión con la imagen se siguen ejecutando en
+    cada petición.
+    """
+    import torch
+    from transformers.modeling_outputs import BaseModelOutput
+    from transformers.models.grounding_dino.modeling_grounding_dino import (
+        generate_masks_with_special_tokens_and_transfer_map,
+    )
+
+    pad_token_id = getattr(backbone.config, "pad_token_id", None) or 0
+
+    class CachedTextBackbone(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.backbone = backbone
+            self.cache = LRUCache(max_entries)
+
+        @property
+        def config(self):
+            return self.backbone.config
+
+        def _encode(self, input_ids, token_type_ids, **kwargs):
+            """Codifica filas sin padding (todas de la misma longitud)."""
+            masks, position_ids = generate_masks_with_special_tokens_and_transfer_map(
+                input_ids
+            )
+            outputs = self.backbone(
+                input_ids,
+                masks[:, None, :, :],
+                token_type_ids,
+                position_ids,
+                return_dict=True,
+                **kwargs,
+            )
+            return outputs.last_hidden_state
+
+        def forward(
+            self,
+            input_ids,
+            attention_mask=None,
+            token_type_ids=None,
+            position_ids=None,
+            return_dict=None,
+            **kwargs,
+        ):
+            batch_size, seq_len = input_ids.shape
+            if token_type_ids is None:
+                token_type_ids = torch.zeros_like(input_ids)
+
+            lengths = [
+                _unpadded_length(input_ids[i], pad_token_id) for i in range(batch_size)
+            ]
+            keys = [
+                input_ids[i, : lengths[i]].cpu().numpy().tobytes()
+                for i in range(batch_size)
+            ]
+            hidden = [self.cache.get(key) for key in keys]
+
+            # Filas nuevas agrupadas por longitud: un forward sin padding por grupo
+            missing: dict[int, list[int]] = {}
+            for i in range(batch_size):
+                if hidden[i] is None:
+                    missing.setdefault(lengths[i], []).append(i)
+            for length, rows in missing.items():
+                index = torch.tensor(rows, device=input_ids.device)
+                encoded = self._encode(
+                    input_ids.index_select(0, index)[:, :length],
+                    token_type_ids.index_select(0, index)[:, :length],
+                    **kwargs,
+                )
+                for j, i in enumerate(rows):
+                    hidden[i] = encoded[j].detach()
+                    self.cache.put(keys[i], hidden[i])
+
+            last_hidden_state = torch.stack(
+                [
+                    torch.nn.functional.pad(row, (0, 0, 0, seq_len - row.shape[0]))
+                    for row in hidden
+                ]
+            )
+            if return_dict is False:
+                return (last_hidden_state,)
+            return BaseModelOutput(last_hidden_state=last_hidden_state)
+
+    return CachedTextBackbone()
+
+
+def install_text_cache(model_dino, max_entries: int):
+    """
+    Sustituye (una sola vez) el text backbone de un
+    `GroundingDinoForObjectDetection` por su versión con caché. Retorna la
+    caché de features, o None si está desactivada.
+    """
+    if max_entries <= 0:
+        return None
+    inner = model_dino.model
+    if getattr(inner.text_backbone, "cache", None) is None:
+        inner.text_backbone = make_cached_text_backbone(
+            inner.text_backbone, max_entries
+        )
+    return inner.text_backbone.cache
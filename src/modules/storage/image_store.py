@@ -0,0 +1,268 @@
+import sys
+import os
+import re
+import json
+import asyncio
+import base64
+import hashlib
+import logging
+import mimetypes
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Optional
+from dotenv import load_dotenv
+
+current_dir = os.path.dirname(__file__)  # ruta de /src/modules/storage
+src_dir = os.path.abspath(os.path.join(current_dir, "../../"))
+sys.path.append(src_dir)
+
+from config import (
+    BUCKET_NAME,
+    IMAGE_STORE_BACKEND,
+    IMAGE_STORE_DIR,
+    IMAGE_STORE_SIGNED_URL_SECONDS,
+    PUBLIC_BASE_URL,
+)
+from modules.observability.tracing import external_call
+from modules.search.http_clients import request_with_retry
+from utils.lru import LRUCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# sha256 en hexadecimal + extensión del formato (p. ej. "3fa2...9c.webp")
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+
+
+def content_key(image_data: bytes, content_type: str) -> str:
+    """Clave direccionada por contenido: sha256 de los bytes + extensión."""
+    extension = mimetypes.guess_extension(content_type) or ".bin"
+    return hashlib.sha256(image_data).hexdigest() + extension
+
+
+def content_type_for(key: str) -> str:
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+def is_valid_key(key: str) -> bool:
+    return bool(KEY_PATTERN.match(key))
+
+
+async def upload_to_supabase_storage(
+    image_data: bytes,
+    bucket_name: str,
+    object_name: str,
+    score: float,
+    text_prompt: str,
+    content_type: str = "image/webp",
+) -> bool:
+    """
+    Sube la imagen a Supabase Storage mediante su API REST, con el score y el
+    text_prompt como metadata. Retorna True si la subida fue correcta.
+    """
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")
+    metadata = json.dumps({"score": str(score), "text_prompt": text_prompt})
+
+    with external_call("supabase_storage") as call:
+        response = await request_with_retry(
+            "POST",
+            f"{supabase_url}/storage/v1/object/{bucket_name}/{object_name}",
+            content=image_data,
+            headers={
+                "Authorization": f"Bearer {supabase_key}",
+                "apikey": supabase_key,
+                "Content-Type": content_type,
+                # upsert hace la subida idempotente ante reintentos
+                "x-upsert": "true",
+                "x-metadata": base64.b64encode(metadata.encode("utf-8")).decode(
+                    "ascii"
+                ),
+            },
+        )
+        if response.status_code != 200:
+            call["outcome"] = "error"
+    if response.status_code != 200:
+        logger.error(f"Error al subir la imagen a Supabase: {response.text}")
+        return False
+    return True
+
+
+class ImageStore(ABC):
+    """
+    Almacén de imágenes direccionado por contenido.
+
+    `put` guarda la imagen una sola vez por contenido (dos recortes idénticos
+    comparten clave) y retorna la clave; `public_url` da una URL que los
+    proveedores de búsqueda pueden descargar, `get` lee los bytes (para
+    servirlos en GET /images/{key}) y `exists` comprueba si la clave está
+    guardada sin descargarla.
+    """
+
+    @abstractmethod
+    async def put(
+        self, image_data: bytes, content_type: str, metadata: Optional[dict] = None
+    ) -> str:
+        ...
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def public_url(self, key: str) -> str:
+        ...
+
+
+class LocalImageStore(ImageStore):
+    """
+    Imágenes en disco bajo `root_dir/<2 primeros caracteres>/<clave>`,
+    servidas por la propia API en `{public_base_url}/images/{key}`.
+    """
+
+    def __init__(self, root_dir: str, public_base_url: str):
+        self.root_dir = root_dir
+        self.public_base_url = public_base_url.rstrip("/")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root_dir, key[:2], key)
+
+    def _write(self, key: str, image_data: bytes):
+        path = self._path(key)
+        if os.path.exists(path):
+            return  # Mismo contenido ya guardado
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escritura atómica: un lector nunca ve un fichero a medias
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(image_data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    async def put(
+        self, image_data: bytes, content_type: str, metadata: Optional[dict] = None
+    ) -> str:
+        key = content_key(image_data, content_type)
+        await asyncio.to_thread(self._write, key, image_data)
+        return key
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if not is_valid_key(key):
+            return None
+        return await asyncio.to_thread(self._read, key)
+
+    async def exists(self, key: str) -> bool:
+        return is_valid_key(key) and await asyncio.to_thread(
+            os.path.exists, self._path(key)
+        )
+
+    async def public_url(self, key: str) -> str:
+        return f"{self.public_base_url}/images/{key}"
+
+
+class SupabaseImageStore(ImageStore):
+    """
+    Imágenes en un bucket de Supabase Storage con la clave como nombre de
+    objeto; la URL pública es una URL firmada de duración limitada. Las claves
+    ya subidas por este proceso se recuerdan para no volver a subirlas.
+    """
+
+    def __init__(self, bucket_name: str, signed_url_seconds: int, known_keys: int = 4096):
+        self.bucket_name = bucket_name
+        self.signed_url_seconds = signed_url_seconds
+        self._uploaded = LRUCache(known_keys)
+
+    @staticmethod
+    def _auth_headers() -> dict:
+        supabase_key = os.getenv("SUPABASE_KEY")
+        return {"Authorization": f"Bearer {supabase_key}", "apikey": supabase_key}
+
+    async def put(
+        self, image_data: bytes, content_type: str, metadata: Optional[dict] = None
+    ) -> str:
+        key = content_key(image_data, content_type)
+        if self._uploaded.get(key):
+            return key
+        metadata = metadata or {}
+        stored = await upload_to_supabase_storage(
+            image_data,
+            self.bucket_name,
+            key,
+            metadata.get("score", 0.0),
+            metadata.get("text_prompt", ""),
+            content_type,
+        )
+        if not stored:
+            raise RuntimeError("Could not upload the segmented image to Supabase")
+        self._uploaded.put(key, True)
+        return key
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if not is_valid_key(key):
+            return None
+        with external_call("supabase_storage"):
+            response = await request_with_retry(
+                "GET",
+                f"{os.getenv('SUPABASE_URL')}/storage/v1/object/{self.bucket_name}/{key}",
+                headers=self._auth_headers(),
+            )
+        return response.content if response.status_code == 200 else None
+
+    async def exists(self, key: str) -> bool:
+        if not is_valid_key(key):
+            return False
+        with external_call("supabase_storage"):
+            response = await request_with_retry(
+                "HEAD",
+                f"{os.getenv('SUPABASE_URL')}/storage/v1/object/{self.bucket_name}/{key}",
+                headers=self._auth_headers(),
+            )
+        return response.status_code == 200
+
+    async def public_url(self, key: str) -> str:
+        supabase_url = os.getenv("SUPABASE_URL")
+        with external_call("supabase_storage") as call:
+            response = await request_with_retry(
+                "POST",
+                f"{supabase_url}/storage/v1/object/sign/{self.bucket_name}/{key}",
+                json={"expiresIn": self.signed_url_seconds},
+                headers=self._auth_headers(),
+            )
+            if response.status_code != 200:
+                call["outcome"] = "error"
+        if response.status_code != 200:
+            raise RuntimeError(f"Could not sign the image URL: {response.text}")
+        return f"{supabase_url}/storage/v1{response.json()['signedURL']}"
+
+
+def build_image_store(backend: str) -> ImageStore:
+    if backend == "local":
+        if not PUBLIC_BASE_URL:
+            logger.warning(
+                "IMAGE_STORE_BACKEND=local without PUBLIC_BASE_URL: search "
+                "providers will not be able to fetch the images"
+            )
+        return LocalImageStore(IMAGE_STORE_DIR, PUBLIC_BASE_URL)
+    if backend == "supabase":
+        return SupabaseImageStore(BUCKET_NAME, IMAGE_STORE_SIGNED_URL_SECONDS)
+    raise ValueError(
+        f"Unknown image store backend '{backend}', expected 'local' or 'supabase'"
+    )
+
+
+image_store = build_image_store(IMAGE_STORE_BACKEND)
@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Caché LRU segura entre hilos, acotada en número de entradas y, si se
+    indica `max_bytes`, también en bytes (cada `put` declara lo que ocupa su
+    valor). Un límite a 0 desactiva la caché; None lo deja sin acotar.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Retorna el valor de `key` (o None), marcándolo como el más reciente."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: int = 0) -> list:
+        """
+        Guarda `value` ocupando `nbytes` y retorna las claves expulsadas para
+        hacerle sitio. Un valor mayor que `max_bytes` no se guarda.
+        """
+        if self.max_entries is not None and self.max_entries <= 0:
+            return []
+        if self.max_bytes is not None and (self.max_bytes <= 0 or nbytes > self.max_bytes):
+            return []
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._current_bytes -= previous[1]
+            self._entries[key] = (value, nbytes)
+            self._current_bytes += nbytes
+
+            evicted = []
+            while (
+                self.max_entries is not None and len(self._entries) > self.max_entries
+            ) or (self.max_bytes is not None and self._current_bytes > self.max_bytes):
+                evicted_key, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._current_bytes -= evicted_bytes
+                evicted.append(evicted_key)
+            return evicted
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """Elimina `key` sin contar acierto ni fallo."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._current_bytes -= entry[1]
+            return entry[0]
+
+    def items(self) -> list:
+        """Copia de los pares (clave, valor), de la entrada menos a la más reciente."""
+        with self._lock:
+            return [(key, value) for key, (value, _) in self._entries.items()]
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> dict:
+        """Contadores de aciertos/fallos y ocupación actual de la caché."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -7,7 +7,8 @@ from PIL import Image
 
 def preprocess_caption(caption: str) -> str:
     """Preprocesa el texto para GroundingDINO (minus, sin espacios extras, con punto al final)."""
-    result = caption.lower().strip()
+    # Espacios internos colapsados: "red  shoe" y "red shoe" son la misma caption
+    result = " ".join(caption.lower().split())
     if not result.endswith("."):
         result += "."
     return result
@@ -0,0 +1,31 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import src.app as app_module
+import src.main as main
+from src.main import InferenceExecutor, JobManager
+
+
+@pytest.fixture
+def app_client(monkeypatch: pytest.MonkeyPatch):
+    """
+    TestClient con el arranque y la parada de la app (cola de trabajos en
+    marcha), sin warmup de modelos y con una cola y un pool de inferencia
+    propios del test.
+    """
+    monkeypatch.setattr(app_module, "MODEL_WARMUP_ON_STARTUP", False)
+    monkeypatch.setattr(
+        app_module,
+        "job_manager",
+        JobManager(
+            8,
+            2,
+            60,
+            on_finish=lambda job: app_module.progress_hub.close(job.id, job.to_dict()),
+        ),
+    )
+    executor = InferenceExecutor(2, 4)
+    monkeypatch.setattr(main, "inference_executor", executor)
+    monkeypatch.setattr(app_module, "inference_executor", executor)
+    with TestClient(app_module.app) as client:
+        yield client
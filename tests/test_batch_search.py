@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import pytest
+
+import src.app as app_module
+import src.main as main
+from src.main import InferenceExecutor, JobManager
+
+
+class FakePrepared:
+    def __init__(self, image_bytes: bytes):
+        self.name = image_bytes.decode()
+        self.dino_image = self.name
+        self.sam_image = self.name
+
+    def dino_box_to_sam(self, box):
+        return box
+
+
+@pytest.fixture
+def fake_pipeline(monkeypatch: pytest.MonkeyPatch):
+    detect_calls = []
+
+    def prepare(image_bytes):
+        if image_bytes == b"corrupt":
+            raise ValueError("cannot identify image file")
+        return FakePrepared(image_bytes)
+
+    def detect(images, prompts, box_threshold, text_threshold):
+        detect_calls.append(list(images))
+        return [
+            None if prompt == "nothing" else ([0, 0, 1, 1], 0.9, prompt)
+            for prompt in prompts
+        ]
+
+    async def search(segmented_bytes, score, prompt, report):
+        # Las imágenes terminan en orden inverso al de entrada
+        await asyncio.sleep(0.05 * (5 - int(segmented_bytes.decode()[-1])))
+        return [{"title": prompt}]
+
+    monkeypatch.setattr(main, "DINO_BATCH_MAX_SIZE", 2)
+    monkeypatch.setattr(main, "_prepare_image", prepare)
+    monkeypatch.setattr(main, "get_grounding_dino_boxes_batch", detect)
+    monkeypatch.setattr(main, "segment_with_sam", lambda image, box: ("mask", 0.8))
+    monkeypatch.setattr(
+        main, "_encode_full_resolution_crop", lambda prepared, mask: prepared.name.encode()
+    )
+    monkeypatch.setattr(main, "_search_similar_products", search)
+    monkeypatch.setattr(main, "inference_executor", InferenceExecutor(2, 0))
+    return detect_calls
+
+
+async def collect(images, prompts):
+    return [result async for result in main.process_image_batch(images, prompts)]
+
+
+def test_batch_yields_every_image_once_with_its_index(fake_pipeline):
+    images = [b"img0", b"img1", b"corrupt", b"img3", b"img4"]
+    prompts = ["shoe", "bag", "hat", "nothing", "dress"]
+
+    results = asyncio.run(collect(images, prompts))
+
+    by_index = {result["index"]: result for result in results}
+    assert sorted(by_index) == [0, 1, 2, 3, 4]
+    assert [by_index[i]["status"] for i in range(5)] == [
+        "completed", "completed", "failed", "failed", "completed"
+    ]
+    assert by_index[1]["results"] == [{"title": "bag"}]
+    assert "cannot identify" in by_index[2]["message"]
+    assert "No object" in by_index[3]["message"]
+    # Resultados según terminan, no en el orden de entrada
+    assert [r["index"] for r in results if r["status"] == "completed"] == [4, 1, 0]
+    # Bloques de DINO_BATCH_MAX_SIZE imágenes (sin las que no se decodifican)
+    assert fake_pipeline == [["img0", "img1"], ["img3"], ["img4"]]
+
+
+def test_batch_waits_for_inference_capacity_instead_of_failing(fake_pipeline):
+    images = [f"img{i}".encode() for i in range(5)]
+
+    async def run():
+        # El pool compartido está lleno mientras el lote empieza
+        executor = main.inference_executor
+        executor._pending = executor.max_workers + executor.max_queue_size
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, release, executor)
+        return await collect(images, ["shoe"] * 5)
+
+    def release(executor):
+        executor._pending = 0
+        while executor._waiters:
+            executor._waiters.popleft().set_result(None)
+
+    results = asyncio.run(run())
+    assert sorted(r["index"] for r in results) == [0, 1, 2, 3, 4]
+    assert all(r["status"] == "completed" for r in results)
+
+
+# --- POST /api/search/batch ---
+def post_batch(client, names, prompts):
+    return client.post(
+        "/api/search/batch",
+        files=[("images", (f"{name}.jpg", name.encode(), "image/jpeg")) for name in names],
+        data={"text_prompts": prompts},
+    )
+
+
+def test_batch_endpoint_streams_one_line_per_image_and_a_summary(fake_pipeline, app_client):
+    response = post_batch(app_client, ["img0", "corrupt", "img2"], ["shoe"])
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    by_index = {line["index"]: line for line in lines[:-1]}
+    assert sorted(by_index) == [0, 1, 2]
+    assert by_index[1]["status"] == "failed"
+    assert by_index[2]["filename"] == "img2.jpg"
+    summary = lines[-1]
+    assert summary["status"] == "done"
+    assert (summary["completed"], summary["failed"]) == (2, 1)
+    # El lote es un trabajo de la cola y se puede consultar después
+    job = app_client.get(f"/api/results/{summary['search_id']}").json()
+    assert job["status"] == "completed" and job["completed"] == 2
+
+
+def test_batch_endpoint_returns_429_when_the_search_queue_is_full(
+    fake_pipeline, app_client, monkeypatch
+):
+    manager = JobManager(max_queue_size=1, concurrency=1, result_ttl_seconds=60)
+    monkeypatch.setattr(app_module, "job_manager", manager)
+    # Sin workers: la cola no avanza y un trabajo pendiente la llena
+    manager._queue = asyncio.Queue(maxsize=1)
+    manager._queue.put_nowait(object())
+
+    response = post_batch(app_client, ["img0", "img1"], ["shoe"])
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
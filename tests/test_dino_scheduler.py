@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+import src.modules.segmentation.grounding_dino as grounding_dino
+from src.modules.segmentation.grounding_dino import DinoBatchScheduler
+
+
+def submit_concurrently(scheduler, requests):
+    """Lanza cada (imagen, prompt, box_t, text_t) en su hilo; retorna resultados o excepciones."""
+    outcomes = [None] * len(requests)
+
+    def worker(i, request):
+        try:
+            outcomes[i] = scheduler.submit(*request)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [
+        threading.Thread(target=worker, args=(i, request))
+        for i, request in enumerate(requests)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert not any(thread.is_alive() for thread in threads)
+    return outcomes
+
+
+def test_groups_by_thresholds_and_fans_out_results(monkeypatch: pytest.MonkeyPatch):
+    calls = []
+
+    def fake_detect_batch(images, prompts, box_threshold, text_threshold):
+        calls.append((sorted(images), box_threshold))
+        return [{"image": image, "prompt": prompt} for image, prompt in zip(images, prompts)]
+
+    monkeypatch.setattr(grounding_dino, "detect_batch", fake_detect_batch)
+    scheduler = DinoBatchScheduler(max_batch_size=8, max_wait_ms=200, result_timeout=5)
+
+    outcomes = submit_concurrently(
+        scheduler,
+        [("a", "shoe", 0.3, 0.2), ("b", "bag", 0.3, 0.2), ("c", "hat", 0.5, 0.2)],
+    )
+
+    assert outcomes == [
+        {"image": "a", "prompt": "shoe"},
+        {"image": "b", "prompt": "bag"},
+        {"image": "c", "prompt": "hat"},
+    ]
+    # Un forward por par de umbrales
+    assert sorted(calls) == [(["a", "b"], 0.3), (["c"], 0.5)]
+
+
+def test_result_count_mismatch_fails_every_waiter(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(
+        grounding_dino, "detect_batch", lambda images, *args: [{"boxes": []}]
+    )
+    scheduler = DinoBatchScheduler(max_batch_size=8, max_wait_ms=200, result_timeout=5)
+
+    outcomes = submit_concurrently(
+        scheduler, [("a", "shoe", 0.3, 0.2), ("b", "bag", 0.3, 0.2)]
+    )
+
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert "1 results for 2 images" in str(outcomes[0])
+
+
+def test_detection_error_is_propagated_and_thread_survives(monkeypatch: pytest.MonkeyPatch):
+    def failing_detect_batch(images, *args):
+        raise ValueError("out of memory")
+
+    monkeypatch.setattr(grounding_dino, "detect_batch", failing_detect_batch)
+    scheduler = DinoBatchScheduler(max_batch_size=8, max_wait_ms=1, result_timeout=5)
+
+    with pytest.raises(ValueError, match="out of memory"):
+        scheduler.submit("a", "shoe", 0.3, 0.2)
+
+    monkeypatch.setattr(grounding_dino, "detect_batch", lambda images, *args: ["ok"])
+    assert scheduler.submit("b", "bag", 0.3, 0.2) == "ok"
+
+
+def test_submit_times_out_instead_of_waiting_forever(monkeypatch: pytest.MonkeyPatch):
+    release = threading.Event()
+
+    def slow_detect_batch(images, *args):
+        release.wait(5)
+        return ["late"]
+
+    monkeypatch.setattr(grounding_dino, "detect_batch", slow_detect_batch)
+    scheduler = DinoBatchScheduler(max_batch_size=1, max_wait_ms=1, result_timeout=0.1)
+
+    try:
+        with pytest.raises(TimeoutError):
+            scheduler.submit("a", "shoe", 0.3, 0.2)
+    finally:
+        release.set()
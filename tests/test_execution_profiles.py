@@ -0,0 +1,37 @@
+import pytest
+
+from src.modules.segmentation.execution_profiles import (
+    ExecutionProfile,
+    get_profile,
+    select_profile,
+)
+
+
+def test_profiles_from_config_and_device_filter():
+    fp16 = get_profile("fp16")
+    assert fp16.autocast == "float16" and fp16.channels_last
+    assert fp16.supports("cuda:0") and not fp16.supports("cpu")
+    assert get_profile("bf16").supports("cpu")
+
+
+def test_invalid_profiles_are_rejected():
+    with pytest.raises(ValueError, match="Unknown execution profile"):
+        get_profile("turbo")
+    with pytest.raises(ValueError, match="unknown options"):
+        ExecutionProfile.from_config("bad", {"half": True})
+    with pytest.raises(ValueError, match="autocast"):
+        ExecutionProfile("bad", autocast="int4")
+
+
+def test_select_fastest_profile_within_tolerance():
+    measurements = [
+        {"profile": "fp32", "latency_ms": 900.0, "dino_iou": 1.0, "sam_iou": 1.0},
+        {"profile": "inference", "latency_ms": 850.0, "dino_iou": 1.0, "sam_iou": 1.0},
+        # Más rápido pero se aleja demasiado de la referencia
+        {"profile": "bf16", "latency_ms": 400.0, "dino_iou": 0.95, "sam_iou": 0.7},
+        {"profile": "compiled", "error": "inductor not available"},
+    ]
+
+    assert select_profile(measurements, min_iou=0.9) == "inference"
+    assert select_profile(measurements, min_iou=0.6) == "bf16"
+    assert select_profile(measurements[3:], min_iou=0.9) is None
@@ -0,0 +1,79 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.modules.segmentation.image_encoding import (
+    ImageEncoder,
+    composite_on_white,
+    encode_to_target_size,
+    get_encoder,
+)
+from src.modules.storage.image_store import content_key, content_type_for
+
+
+def noisy_image(size: int = 400) -> Image.Image:
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8))
+
+
+def test_composite_keeps_masked_pixels_and_whitens_the_rest():
+    image = Image.new("RGB", (4, 4), (10, 20, 30))
+    mask = np.zeros((4, 4), bool)
+    mask[1:3, 1:3] = True
+
+    result = np.array(composite_on_white(image, mask))
+
+    assert (result[mask] == [10, 20, 30]).all()
+    assert (result[~mask] == 255).all()
+
+
+@pytest.mark.parametrize("name, fmt", [("webp", "WEBP"), ("jpeg", "JPEG")])
+def test_target_size_is_respected(name, fmt):
+    encoder = get_encoder(name)
+    unconstrained = encoder.encode(noisy_image(), 85)
+    target = len(unconstrained) // 2
+
+    data = encode_to_target_size(noisy_image(), encoder, target, min_quality=5)
+
+    assert len(data) <= target
+    assert Image.open(io.BytesIO(data)).format == fmt
+
+
+def test_small_images_use_max_quality():
+    encoder = get_encoder("webp")
+    image = Image.new("RGB", (32, 32), "white")
+    data = encode_to_target_size(image, encoder, 1_000_000, max_quality=85)
+    assert data == encoder.encode(image, 85)
+
+
+def test_png_ignores_quality_and_unknown_formats_fail():
+    encoder = get_encoder("PNG")
+    assert encoder.mime_type == "image/png"
+    data = encode_to_target_size(noisy_image(64), encoder, 10)
+    assert Image.open(io.BytesIO(data)).format == "PNG"
+
+    with pytest.raises(ValueError):
+        get_encoder("gif")
+
+
+def test_encoders_must_implement_save():
+    with pytest.raises(TypeError):
+        ImageEncoder()
+
+    class Incomplete(ImageEncoder):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+@pytest.mark.parametrize("name", ["webp", "jpeg", "png"])
+def test_store_key_extension_follows_the_encoder_mime_type(name):
+    encoder = get_encoder(name)
+    data = encoder.encode(Image.new("RGB", (8, 8)), 80)
+
+    key = content_key(data, encoder.mime_type)
+
+    assert content_type_for(key) == encoder.mime_type
@@ -0,0 +1,220 @@
+import asyncio
+import base64
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.app as app_module
+import src.modules.storage.image_store as image_store_module
+from src.modules.storage.image_store import (
+    LocalImageStore,
+    SupabaseImageStore,
+    content_key,
+)
+
+# El almacén usa el cliente compartido importado como `modules.search...`
+import modules.search.http_clients as http_clients
+
+
+# --- Servidor HTTP local que simula Supabase Storage ---
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    requests_log: list = []
+    storage_failures_left = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        StandInHandler.requests_log.append((self.path, dict(self.headers), body))
+
+        if self.path.startswith("/storage/v1/object/sign/"):
+            self._reply(200, {"signedURL": f"{self.path[len('/storage/v1'):]}?token=t"})
+        elif self.path.startswith("/storage/v1/object/"):
+            if StandInHandler.storage_failures_left > 0:
+                StandInHandler.storage_failures_left -= 1
+                self._reply(503, {"error": "unavailable"})
+            else:
+                self._reply(200, {"Key": self.path})
+        else:
+            self._reply(404, {})
+
+    def _reply(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in_server(monkeypatch: pytest.MonkeyPatch):
+    StandInHandler.requests_log = []
+    StandInHandler.storage_failures_left = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setenv("SUPABASE_URL", base_url)
+    monkeypatch.setenv("SUPABASE_KEY", "dummy-key")
+    monkeypatch.setattr(http_clients, "HTTP_RETRY_BACKOFF_SECONDS", 0)
+    yield base_url
+    server.shutdown()
+
+
+def run(coro):
+    async def wrapper():
+        try:
+            return await coro
+        finally:
+            await http_clients.close_http_client()
+
+    return asyncio.run(wrapper())
+
+
+def test_content_key_is_sha256_plus_extension():
+    key = content_key(b"crop", "image/webp")
+    assert key == hashlib.sha256(b"crop").hexdigest() + ".webp"
+
+
+def test_local_store_deduplicates_identical_images(tmp_path):
+    store = LocalImageStore(str(tmp_path), "https://api.example.com/")
+
+    async def run():
+        first = await store.put(b"crop", "image/webp")
+        second = await store.put(b"crop", "image/webp")
+        return first, second, await store.get(first), await store.public_url(first)
+
+    first, second, data, url = asyncio.run(run())
+
+    assert first == second
+    assert data == b"crop"
+    assert url == f"https://api.example.com/images/{first}"
+    assert len(list(tmp_path.rglob("*.webp"))) == 1
+
+
+def test_local_store_rejects_keys_outside_the_store(tmp_path):
+    store = LocalImageStore(str(tmp_path), "")
+    assert asyncio.run(store.get("../secret.webp")) is None
+
+
+def test_supabase_store_uploads_each_content_once(monkeypatch: pytest.MonkeyPatch):
+    uploads = []
+
+    async def fake_upload(image_data, bucket, object_name, score, prompt, content_type):
+        uploads.append((object_name, score, prompt, content_type))
+        return True
+
+    monkeypatch.setattr(image_store_module, "upload_to_supabase_storage", fake_upload)
+    store = SupabaseImageStore("images-bucket", signed_url_seconds=60)
+
+    async def run():
+        metadata = {"score": 0.9, "text_prompt": "shoe"}
+        return [await store.put(b"crop", "image/webp", metadata) for _ in range(2)]
+
+    keys = asyncio.run(run())
+
+    assert keys[0] == keys[1]
+    assert uploads == [(keys[0], 0.9, "shoe", "image/webp")]
+
+
+def test_image_route_serves_with_strong_etag_and_304(
+    tmp_path, monkeypatch: pytest.MonkeyPatch
+):
+    store = LocalImageStore(str(tmp_path), "http://testserver")
+    monkeypatch.setattr(app_module, "image_store", store)
+    key = asyncio.run(store.put(b"crop-bytes", "image/webp"))
+    client = TestClient(app_module.app)
+
+    response = client.get(f"/images/{key}")
+    assert response.status_code == 200
+    assert response.content == b"crop-bytes"
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["etag"] == f'"{key.split(".")[0]}"'
+    assert "immutable" in response.headers["cache-control"]
+
+    cached = client.get(f"/images/{key}", headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    assert client.get(f"/images/{'0' * 64}.webp").status_code == 404
+
+
+def test_image_route_does_not_answer_304_for_missing_images(
+    tmp_path, monkeypatch: pytest.MonkeyPatch
+):
+    store = LocalImageStore(str(tmp_path), "http://testserver")
+    monkeypatch.setattr(app_module, "image_store", store)
+    key = content_key(b"never-stored", "image/webp")
+    client = TestClient(app_module.app)
+
+    response = client.get(
+        f"/images/{key}", headers={"If-None-Match": f'"{key.split(".")[0]}"'}
+    )
+
+    assert response.status_code == 404
+    assert not asyncio.run(store.exists(key))
+    assert not asyncio.run(store.exists("../secret.webp"))
+
+
+# --- Subida real a Supabase Storage (contra el servidor local) ---
+def test_supabase_store_uploads_with_metadata_and_signs_urls(stand_in_server):
+    store = SupabaseImageStore("images-bucket", signed_url_seconds=60)
+
+    async def upload_and_sign():
+        key = await store.put(
+            b"webp-bytes", "image/webp", {"score": 0.87, "text_prompt": "red shoe"}
+        )
+        return key, await store.public_url(key)
+
+    key, url = run(upload_and_sign())
+
+    upload, sign = StandInHandler.requests_log
+    assert upload[0] == f"/storage/v1/object/images-bucket/{key}"
+    assert upload[2] == b"webp-bytes"
+    assert upload[1]["Content-Type"] == "image/webp"
+    metadata = json.loads(base64.b64decode(upload[1]["x-metadata"]))
+    assert metadata == {"score": "0.87", "text_prompt": "red shoe"}
+    assert json.loads(sign[2]) == {"expiresIn": 60}
+    assert url == (
+        f"{stand_in_server}/storage/v1/object/sign/images-bucket/{key}?token=t"
+    )
+
+
+def test_supabase_store_retries_transient_storage_errors(stand_in_server):
+    StandInHandler.storage_failures_left = 1
+    store = SupabaseImageStore("images-bucket", signed_url_seconds=60)
+
+    key = run(store.put(b"jpeg-bytes", "image/jpeg"))
+
+    assert key.endswith(".jpg")
+    assert len(StandInHandler.requests_log) == 2
+    assert StandInHandler.requests_log[-1][1]["Content-Type"] == "image/jpeg"
+
+
+def test_supabase_store_raises_when_storage_keeps_failing(stand_in_server):
+    StandInHandler.storage_failures_left = 100
+    store = SupabaseImageStore("images-bucket", signed_url_seconds=60)
+
+    with pytest.raises(RuntimeError, match="Could not upload"):
+        run(store.put(b"webp-bytes", "image/webp"))
+
+
+def test_image_store_backends_implement_the_whole_interface():
+    with pytest.raises(TypeError):
+        image_store_module.ImageStore()
+
+    class Incomplete(image_store_module.ImageStore):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
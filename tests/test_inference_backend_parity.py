@@ -0,0 +1,80 @@
+"""
+Concordancia entre INFERENCE_BACKEND=pytorch e int8 con los modelos reales.
+Se omite si no están instalados torch, transformers y segment_anything o si
+falta el checkpoint de SAM.
+"""
+import copy
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+segment_anything = pytest.importorskip("segment_anything")
+
+from src.config import SAM_CHECKPOINT_PATH
+
+if not os.path.exists(SAM_CHECKPOINT_PATH):
+    pytest.skip("SAM checkpoint not available", allow_module_level=True)
+
+import modules.segmentation.grounding_dino as grounding_dino
+from modules.segmentation.inference_backend import quantize_int8
+from modules.segmentation.model_registry import ModelRegistry
+
+
+def make_image() -> Image.Image:
+    image = Image.new("RGB", (640, 480), (210, 210, 210))
+    ImageDraw.Draw(image).ellipse((200, 140, 440, 340), fill=(200, 30, 30))
+    return image
+
+
+def box_iou(a, b) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1])
+    return intersection / (union - intersection)
+
+
+def mask_iou(a, b) -> float:
+    return np.logical_and(a, b).sum() / np.logical_or(a, b).sum()
+
+
+def predict(registry, image):
+    grounding_dino.model_registry = registry
+    result = grounding_dino.detect_batch([image], ["red circle"], 0.3, 0.1)[0]
+    box = result["boxes"][result["scores"].argmax()].numpy()
+
+    predictor = registry.get_sam_predictor()
+    predictor.set_image(np.array(image))
+    masks, scores, _ = predictor.predict(box=box[None, :], multimask_output=False)
+    return box, masks[0]
+
+
+@pytest.fixture(scope="module")
+def registries():
+    original = grounding_dino.model_registry
+    fp32 = ModelRegistry()
+    processor, dino = fp32.get_dino()
+    sam = fp32.get_sam_predictor()
+
+    int8 = ModelRegistry()
+    int8.set_dino(processor, quantize_int8(copy.deepcopy(dino)))
+    int8.set_sam_predictor(
+        segment_anything.SamPredictor(quantize_int8(copy.deepcopy(sam.model)))
+    )
+    yield fp32, int8
+    grounding_dino.model_registry = original
+
+
+def test_int8_matches_pytorch_outputs(registries):
+    fp32, int8 = registries
+    image = make_image()
+
+    box_fp32, mask_fp32 = predict(fp32, image)
+    box_int8, mask_int8 = predict(int8, image)
+
+    assert box_iou(box_fp32, box_int8) >= 0.9
+    assert mask_iou(mask_fp32, mask_int8) >= 0.9
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+import pytest
+
+import src.main as main
+from src.main import InferenceExecutor, InferenceQueueFullError
+
+
+def test_rejects_tasks_beyond_workers_plus_queue():
+    executor = InferenceExecutor(max_workers=1, max_queue_size=1)
+    release = threading.Event()
+
+    async def run():
+        running = [
+            asyncio.create_task(executor.run(release.wait, 5)) for _ in range(2)
+        ]
+        await asyncio.sleep(0)  # Las dos tareas ocupan el hilo y la cola
+        assert executor.pending == 2
+
+        with pytest.raises(InferenceQueueFullError):
+            await executor.run(lambda: None)
+
+        release.set()
+        await asyncio.gather(*running)
+        assert executor.pending == 0
+        # Con hueco vuelve a aceptar tareas
+        assert await executor.run(lambda: "ok") == "ok"
+
+    try:
+        asyncio.run(run())
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_pending_is_released_when_the_task_fails():
+    executor = InferenceExecutor(max_workers=1, max_queue_size=0)
+
+    def fail():
+        raise ValueError("boom")
+
+    async def run():
+        with pytest.raises(ValueError):
+            await executor.run(fail)
+        assert executor.pending == 0
+
+    asyncio.run(run())
+    executor.shutdown()
+
+
+def test_run_when_available_waits_for_a_free_slot():
+    executor = InferenceExecutor(max_workers=1, max_queue_size=0)
+    release = threading.Event()
+
+    async def run():
+        blocking = asyncio.create_task(executor.run(release.wait, 5))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(executor.run_when_available(lambda: "ok"))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+
+        release.set()
+        assert await waiting == "ok"
+        await blocking
+
+    try:
+        asyncio.run(run())
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_pipeline_waits_for_inference_capacity_instead_of_failing(monkeypatch):
+    class FakePrepared:
+        dino_image = sam_image = type("FakeImage", (), {"size": (100, 50)})()
+        full_size = (100, 50)
+
+        def dino_box_to_sam(self, box):
+            return box
+
+    async def search(segmented_bytes, score, prompt, report, on_partial=None):
+        return [{"title": prompt}]
+
+    executor = InferenceExecutor(max_workers=1, max_queue_size=0)
+    release = threading.Event()
+    monkeypatch.setattr(main, "inference_executor", executor)
+    monkeypatch.setattr(main, "_prepare_image", lambda image_bytes: FakePrepared())
+    monkeypatch.setattr(
+        main, "get_grounding_dino_boxes", lambda **kwargs: ([0, 0, 1, 1], 0.9, "shoe")
+    )
+    monkeypatch.setattr(main, "segment_with_sam", lambda image, box: ("mask", 0.8))
+    monkeypatch.setattr(main, "_encode_full_resolution_crop", lambda prepared, mask: b"crop")
+    monkeypatch.setattr(main, "_search_similar_products", search)
+
+    async def no_progress(message: str):
+        pass
+
+    async def run():
+        # Otra petición ocupa el único hilo y la cola queda llena
+        blocking = asyncio.create_task(executor.run(release.wait, 5))
+        await asyncio.sleep(0)
+        assert executor.is_full
+
+        pipeline = asyncio.create_task(
+            main.process_image_pipeline(b"img", "shoe", no_progress)
+        )
+        await asyncio.sleep(0.05)
+        assert not pipeline.done()
+
+        release.set()
+        results, *_ = await pipeline
+        await blocking
+        return results
+
+    try:
+        assert asyncio.run(run()) == [{"title": "shoe"}]
+    finally:
+        release.set()
+        executor.shutdown()
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from src.modules.jobs.job_manager import JobManager, JobQueueFullError
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# --- Test del flujo completo de un trabajo ---
+def test_job_completes_and_exposes_result():
+    async def scenario():
+        manager = JobManager(max_queue_size=4, concurrency=1, result_ttl_seconds=60)
+        await manager.start()
+
+        async def handler(job):
+            job.progress_steps.append("working")
+            return {"results": [1, 2, 3]}
+
+        job = manager.submit(handler)
+        assert job.status == "queued"
+        await manager.wait(job, timeout=1)
+        await manager.stop()
+        return manager, job
+
+    manager, job = run(scenario())
+    data = manager.get(job.id).to_dict()
+    assert data["status"] == "completed"
+    assert data["results"] == [1, 2, 3]
+    assert data["progress_steps"] == ["working"]
+
+
+# --- Test de errores en el trabajo ---
+def test_failed_job_reports_error():
+    async def scenario():
+        manager = JobManager(4, 1, 60)
+        await manager.start()
+
+        async def handler(job):
+            raise ValueError("boom")
+
+        job = manager.submit(handler)
+        await manager.wait(job, timeout=1)
+        await manager.stop()
+        return job
+
+    job = run(scenario())
+    assert job.status == "failed"
+    assert job.to_dict()["message"] == "boom"
+
+
+# --- Test de backpressure con la cola llena ---
+def test_submit_raises_when_queue_is_full():
+    async def scenario():
+        manager = JobManager(max_queue_size=1, concurrency=1, result_ttl_seconds=60)
+        await manager.start()
+        release = asyncio.Event()
+
+        async def handler(job):
+            await release.wait()
+            return {}
+
+        manager.submit(handler)
+        await asyncio.sleep(0)  # El worker toma el primer trabajo
+        manager.submit(handler)  # Ocupa el único hueco de la cola
+        with pytest.raises(JobQueueFullError) as exc_info:
+            manager.submit(handler)
+        assert exc_info.value.retry_after >= 1
+
+        release.set()
+        await manager.stop()
+
+    run(scenario())
+
+
+# --- Test de límite de concurrencia ---
+def test_concurrency_limit_is_respected():
+    async def scenario():
+        manager = JobManager(max_queue_size=10, concurrency=2, result_ttl_seconds=60)
+        await manager.start()
+        running = 0
+        peak = 0
+
+        async def handler(job):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return {}
+
+        jobs = [manager.submit(handler) for _ in range(6)]
+        for job in jobs:
+            await manager.wait(job, timeout=1)
+        await manager.stop()
+        return peak
+
+    assert run(scenario()) == 2
+
+
+# --- Test de expiración de resultados ---
+def test_finished_jobs_expire(monkeypatch):
+    import src.modules.jobs.job_manager as job_manager
+
+    async def scenario():
+        manager = JobManager(4, 1, result_ttl_seconds=60)
+        await manager.start()
+
+        async def handler(job):
+            return {}
+
+        job = manager.submit(handler)
+        await manager.wait(job, timeout=1)
+        await manager.stop()
+        return manager, job
+
+    manager, job = run(scenario())
+    now = job.finished_at + 61
+    monkeypatch.setattr(job_manager.time, "time", lambda: now)
+    assert manager.get(job.id) is None
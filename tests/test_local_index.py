@@ -0,0 +1,142 @@
+import io
+import multiprocessing
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from src.modules.search.local_index import (
+    DESCRIPTOR_DIM,
+    LocalVisualIndex,
+    compute_descriptor,
+)
+
+RESULTS = [{"title": "Zapatilla", "link": "https://shop/x", "thumbnail": "t", "price": "10€"}]
+
+
+def make_crop(color, offset: int = 0, quality: int = 90) -> bytes:
+    """Recorte sobre fondo blanco, como los que produce el pipeline."""
+    image = Image.new("RGB", (200, 200), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((40 + offset, 50, 150 + offset, 160), fill=color)
+    draw.ellipse((60, 70, 110, 120), fill=(20, 20, 120))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def test_descriptor_is_normalized_and_separates_products():
+    red = compute_descriptor(make_crop((200, 30, 30)))
+    red_again = compute_descriptor(make_crop((200, 30, 30), offset=4))
+    green = compute_descriptor(make_crop((30, 180, 40)))
+
+    assert red.shape == (DESCRIPTOR_DIM,)
+    assert np.isclose(np.linalg.norm(red), 1.0)
+    assert float(red @ red_again) > 0.97
+    assert float(red @ green) < float(red @ red_again) - 0.2
+
+
+def test_lookup_serves_confident_matches_only(tmp_path):
+    index = LocalVisualIndex(str(tmp_path), min_similarity=0.97)
+    index.add(compute_descriptor(make_crop((200, 30, 30))), RESULTS, "red shoe")
+
+    similar = compute_descriptor(make_crop((200, 30, 30), quality=70))
+    assert index.lookup(similar, "red shoe") == RESULTS
+    assert index.lookup(compute_descriptor(make_crop((30, 180, 40))), "red shoe") is None
+    assert index.stats()["hits"] == 1 and index.stats()["misses"] == 1
+
+
+def test_search_returns_top_k_by_similarity(tmp_path):
+    index = LocalVisualIndex(str(tmp_path), min_similarity=0.97)
+    colors = [(200, 30, 30), (30, 180, 40), (210, 40, 30), (240, 220, 20)]
+    for i, color in enumerate(colors):
+        index.add(compute_descriptor(make_crop(color)), [{"title": str(i)}])
+
+    matches = index.search(compute_descriptor(make_crop((200, 30, 30))), top_k=2)
+
+    assert [row for row, _ in matches] == [0, 2]
+    assert matches[0][1] >= matches[1][1]
+
+
+def test_index_persists_and_drops_partial_rows(tmp_path):
+    index = LocalVisualIndex(str(tmp_path), min_similarity=0.97)
+    descriptor = compute_descriptor(make_crop((200, 30, 30)))
+    index.add(descriptor, RESULTS)
+    # Vector escrito a medias sin metadata (p. ej. el proceso murió)
+    with open(tmp_path / "vectors.f16", "ab") as f:
+        f.write(b"\x00" * 10)
+
+    reopened = LocalVisualIndex(str(tmp_path), min_similarity=0.97)
+
+    assert len(reopened) == 1
+    assert reopened.lookup(descriptor) == RESULTS
+    reopened.add(compute_descriptor(make_crop((30, 180, 40))), [])
+    assert len(LocalVisualIndex(str(tmp_path), min_similarity=0.97)) == 2
+
+
+def test_lookup_only_serves_results_for_the_same_prompt(tmp_path):
+    index = LocalVisualIndex(str(tmp_path), min_similarity=0.97)
+    descriptor = compute_descriptor(make_crop((200, 30, 30)))
+    index.add(descriptor, RESULTS, "red shoe")
+    index.add(descriptor, [{"title": "Bolso"}], "bag")
+
+    assert index.lookup(descriptor, "Red  Shoe") == RESULTS
+    assert index.lookup(descriptor, "bag.") == [{"title": "Bolso"}]
+    assert index.lookup(descriptor, "hat") is None
+
+
+def test_prompts_of_older_indexes_are_normalized(tmp_path):
+    index = LocalVisualIndex(str(tmp_path), min_similarity=0.97)
+    descriptor = compute_descriptor(make_crop((200, 30, 30)))
+    index.add(descriptor, RESULTS)
+    # Fila guardada antes de normalizar los prompts
+    index._db.execute("UPDATE entries SET text_prompt = 'Red Shoe'")
+    index._db.commit()
+
+    reopened = LocalVisualIndex(str(tmp_path), min_similarity=0.97)
+
+    assert reopened.lookup(descriptor, "red shoe") == RESULTS
+
+
+def _add_rows(directory: str, worker: int, count: int):
+    index = LocalVisualIndex(directory, min_similarity=0.97)
+    for i in range(count):
+        vector = np.zeros(DESCRIPTOR_DIM, dtype=np.float32)
+        vector[(worker * count + i) % DESCRIPTOR_DIM] = 1.0
+        index.add(vector, [{"worker": worker, "i": i, "dim": int(vector.argmax())}])
+
+
+def test_workers_sharing_the_directory_append_without_clobbering(tmp_path):
+    directory = str(tmp_path)
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=_add_rows, args=(directory, worker, 15))
+        for worker in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    index = LocalVisualIndex(directory, min_similarity=0.97)
+    assert len(index) == 60
+    added = {(r["worker"], r["i"]) for r in (index.results(row)[0] for row in range(60))}
+    assert len(added) == 60
+    # Cada fila conserva su propio vector junto a su metadata
+    vectors = np.memmap(tmp_path / "vectors.f16", dtype=np.float16, mode="r")
+    vectors = vectors.reshape(60, DESCRIPTOR_DIM)
+    for row in range(60):
+        assert int(vectors[row].argmax()) == index.results(row)[0]["dim"]
+
+
+def test_rows_added_by_another_worker_are_visible(tmp_path):
+    reader = LocalVisualIndex(str(tmp_path), min_similarity=0.97)
+    writer = LocalVisualIndex(str(tmp_path), min_similarity=0.97)
+    descriptor = compute_descriptor(make_crop((200, 30, 30)))
+    assert reader.lookup(descriptor, "shoe") is None
+
+    writer.add(descriptor, RESULTS, "shoe")
+
+    assert reader.lookup(descriptor, "shoe") == RESULTS
+    reader.add(compute_descriptor(make_crop((30, 180, 40))), [], "shoe")
+    assert len(writer.search(descriptor, top_k=5)) == 2
@@ -0,0 +1,80 @@
+from src.utils.lru import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["hits"] == 3
+
+
+def test_zero_entries_disables_the_cache():
+    cache = LRUCache(max_entries=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None and len(cache) == 0
+
+
+def test_pop_and_items_follow_recency_order():
+    cache = LRUCache(max_entries=3)
+    for key in "abc":
+        cache.put(key, key.upper(), nbytes=1)
+    cache.get("a")
+
+    assert [key for key, _ in cache.items()] == ["b", "c", "a"]
+    assert cache.pop("c") == "C" and "c" not in cache
+    assert cache.pop("c") is None
+    assert cache.stats()["bytes"] == 2
+
+
+# --- Test de aciertos y fallos ---
+def test_byte_bounded_cache_counts_hits_and_misses():
+    cache = LRUCache(max_bytes=100)
+    assert cache.get("a") is None
+    cache.put("a", "features-a", nbytes=10)
+    assert cache.get("a") == "features-a"
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+    assert stats["bytes"] == 10
+
+
+# --- Test de expulsión LRU por bytes ---
+def test_evicts_least_recently_used_when_over_byte_budget():
+    cache = LRUCache(max_bytes=30)
+    cache.put("a", "A", nbytes=10)
+    cache.put("b", "B", nbytes=10)
+    cache.put("c", "C", nbytes=10)
+
+    # Se usa "a" para que "b" pase a ser la entrada menos reciente
+    assert cache.get("a") == "A"
+    assert cache.put("d", "D", nbytes=10) == ["b"]
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+    assert cache.get("d") == "D"
+    assert cache.stats()["bytes"] == 30
+
+
+# --- Test de entradas mayores que el presupuesto ---
+def test_ignores_entries_larger_than_budget():
+    cache = LRUCache(max_bytes=10)
+    cache.put("big", "X", nbytes=11)
+    assert cache.get("big") is None
+    assert cache.stats()["bytes"] == 0
+
+
+# --- Test de reemplazo de una clave existente ---
+def test_replacing_key_updates_size():
+    cache = LRUCache(max_bytes=50)
+    cache.put("a", "A1", nbytes=20)
+    cache.put("a", "A2", nbytes=5)
+    assert cache.get("a") == "A2"
+    assert cache.stats()["bytes"] == 5
@@ -0,0 +1,174 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.app as app_module
+import src.modules.segmentation.model_registry as registry_module
+from src.main import InferenceExecutor, JobManager
+from src.modules.segmentation.model_registry import ModelRegistry
+
+
+class FakeLoaders:
+    """Cargadores de modelos de prueba que cuentan las llamadas."""
+
+    def __init__(self, fail_with=None):
+        self.calls = {"dino": 0, "sam": 0}
+        self.fail_with = fail_with
+
+    def install(self, registry: ModelRegistry) -> ModelRegistry:
+        registry._load_dino = lambda: self._load("dino", ("processor", "dino"))
+        registry._load_sam_predictor = lambda: self._load("sam", "predictor")
+        return registry
+
+    def _load(self, name, model):
+        self.calls[name] += 1
+        if self.fail_with is not None:
+            raise self.fail_with
+        return model
+
+
+class FakeModelServer:
+    """Cliente del servidor de modelos: el warmup solo espera a que esté listo."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.release = threading.Event()
+
+    def wait_until_ready(self):
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+
+
+# --- Carga perezosa ---
+def test_models_load_on_first_use_and_only_once():
+    loaders = FakeLoaders()
+    registry = loaders.install(ModelRegistry())
+    assert registry.state == "idle"
+
+    assert registry.get_dino() == ("processor", "dino")
+    assert registry.state == "idle"  # SAM aún no está cargado
+    assert registry.get_sam_predictor() == "predictor"
+    registry.get_dino()
+    registry.get_sam_predictor()
+
+    assert loaders.calls == {"dino": 1, "sam": 1}
+    assert registry.is_ready
+    assert registry.status()["dino_loaded"] and registry.status()["sam_loaded"]
+
+
+def test_concurrent_first_uses_load_the_model_once():
+    loaders = FakeLoaders()
+    registry = loaders.install(ModelRegistry())
+
+    threads = [threading.Thread(target=registry.get_dino) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loaders.calls["dino"] == 1
+
+
+def test_failed_lazy_load_is_reported_and_retried():
+    loaders = FakeLoaders(fail_with=OSError("checkpoint not found"))
+    registry = loaders.install(ModelRegistry())
+
+    with pytest.raises(OSError):
+        registry.get_sam_predictor()
+    assert registry.state == "error"
+    assert registry.status()["error"] == "checkpoint not found"
+
+    loaders.fail_with = None
+    assert registry.get_sam_predictor() == "predictor"
+    assert registry.state == "idle" and registry.error is None
+
+
+# --- Warmup en segundo plano ---
+def test_start_warmup_runs_once_in_the_background(monkeypatch):
+    server = FakeModelServer()
+    monkeypatch.setattr(registry_module, "remote_client", lambda: server)
+    registry = ModelRegistry()
+
+    thread = registry.start_warmup()
+    assert registry.start_warmup() is thread
+    assert registry.state == "warming"
+
+    server.release.set()
+    thread.join(5)
+    assert registry.is_ready
+
+
+def test_failed_warmup_leaves_the_error_in_the_state(monkeypatch):
+    server = FakeModelServer(error=ConnectionRefusedError("no server"))
+    server.release.set()
+    monkeypatch.setattr(registry_module, "remote_client", lambda: server)
+    registry = ModelRegistry()
+
+    registry.start_warmup().join(5)  # El hilo no propaga la excepción
+
+    assert registry.state == "error"
+    assert registry.error == "no server"
+
+
+# --- /health/ready ---
+@pytest.fixture
+def readiness(app_client, monkeypatch):
+    def check(registry: ModelRegistry, warmup_on_startup: bool):
+        monkeypatch.setattr(app_module, "model_registry", registry)
+        monkeypatch.setattr(app_module, "MODEL_WARMUP_ON_STARTUP", warmup_on_startup)
+        response = app_client.get("/health/ready")
+        return response.status_code, response.json()["models"]["state"]
+
+    return check
+
+
+def test_lazy_registry_is_ready_until_a_load_fails(readiness):
+    loaders = FakeLoaders()
+    registry = loaders.install(ModelRegistry())
+    assert readiness(registry, warmup_on_startup=False) == (200, "idle")
+
+    loaders.fail_with = RuntimeError("CUDA out of memory")
+    with pytest.raises(RuntimeError):
+        registry.get_dino()
+    assert readiness(registry, warmup_on_startup=False) == (503, "error")
+
+
+def test_warmup_registry_is_ready_only_once_warmed(readiness):
+    registry = ModelRegistry()
+    assert readiness(registry, warmup_on_startup=True) == (503, "idle")
+
+    registry.state = "warming"
+    assert readiness(registry, warmup_on_startup=True) == (503, "warming")
+    assert readiness(registry, warmup_on_startup=False) == (503, "warming")
+
+    registry.state = "ready"
+    assert readiness(registry, warmup_on_startup=True) == (200, "ready")
+
+    registry.state = "error"
+    assert readiness(registry, warmup_on_startup=True) == (503, "error")
+
+
+# --- Arranque y parada de la app ---
+def test_lifespan_starts_warmup_and_the_job_queue(monkeypatch):
+    class RecordingRegistry(ModelRegistry):
+        warmups = 0
+
+        def start_warmup(self):
+            RecordingRegistry.warmups += 1
+
+    manager = JobManager(4, 2, 60)
+    executor = InferenceExecutor(1, 1)
+    monkeypatch.setattr(app_module, "model_registry", RecordingRegistry())
+    monkeypatch.setattr(app_module, "MODEL_WARMUP_ON_STARTUP", True)
+    monkeypatch.setattr(app_module, "job_manager", manager)
+    monkeypatch.setattr(app_module, "inference_executor", executor)
+
+    with TestClient(app_module.app):
+        assert RecordingRegistry.warmups == 1
+        assert len(manager._workers) == 2
+
+    assert manager._workers == []
+    with pytest.raises(RuntimeError):
+        executor._executor.submit(print)  # El pool ya está parado
@@ -0,0 +1,193 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import src.modules.segmentation.sam_segmentation as sam_module
+from src.modules.segmentation.model_server import (
+    ModelServer,
+    ModelServerClient,
+    ModelServerError,
+    parse_address,
+    serve,
+)
+
+AUTHKEY = b"test-model-server-secret"
+
+
+def _serve_fake_models(address: str):
+    # Proceso independiente (como `python src/model_server.py`): los modelos
+    # se sustituyen por funciones de prueba y se usan los manejadores reales
+    import src.modules.segmentation.model_server  # noqa: F401 (añade src al path)
+    import modules.segmentation.sam_segmentation as sam
+    from modules.segmentation.model_server import local_handlers, serve
+
+    def segment_with_sam(image_pil, box, multimask_output=False):
+        mask = np.zeros(np.asarray(image_pil).shape[:2], dtype=bool)
+        x1, y1, x2, y2 = [int(v) for v in box]
+        mask[y1:y2, x1:x2] = True
+        return mask, 0.75
+
+    def double(inputs, outputs, factor):
+        outputs[0][...] = inputs[0] * factor
+        return float(inputs[0].sum())
+
+    def fail(inputs, outputs):
+        raise ValueError("boom")
+
+    sam.segment_with_sam = segment_with_sam
+    handlers = local_handlers()
+    handlers.update(
+        status=lambda inputs, outputs: {"state": "ready", "error": None},
+        double=double,
+        fail=fail,
+    )
+    serve(address, AUTHKEY, handlers, warmup=False)
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    address = str(tmp_path_factory.mktemp("model-server") / "models.sock")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), address],
+        cwd=root,
+        env={**os.environ, "PYTHONPATH": root},
+    )
+    client = ModelServerClient(address, AUTHKEY, timeout=10)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                client.status()
+                break
+            except ModelServerError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        yield client
+    finally:
+        process.terminate()
+        process.wait(5)
+
+
+def shared_segments() -> set:
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+def test_parse_address():
+    assert parse_address("127.0.0.1:7000") == ("127.0.0.1", 7000)
+    assert parse_address(":7000") == ("127.0.0.1", 7000)
+    assert parse_address("[::1]:7000") == ("::1", 7000)
+    assert parse_address("/tmp/models.sock") == "/tmp/models.sock"
+
+
+@pytest.mark.parametrize("address", ["0.0.0.0:7000", "10.0.0.5:7000", "models.internal:7000"])
+def test_non_loopback_tcp_addresses_are_rejected(address):
+    with pytest.raises(ValueError, match="loopback"):
+        parse_address(address)
+    with pytest.raises(ValueError, match="loopback"):
+        ModelServerClient(address, AUTHKEY, timeout=1)
+
+
+@pytest.mark.parametrize("authkey", [b"", b"short"])
+def test_server_and_client_refuse_to_start_without_a_secret(tmp_path, authkey):
+    address = str(tmp_path / "models.sock")
+    with pytest.raises(ValueError, match="MODEL_SERVER_AUTHKEY"):
+        ModelServerClient(address, authkey, timeout=1)
+    with pytest.raises(ValueError, match="MODEL_SERVER_AUTHKEY"):
+        serve(address, authkey, handlers={}, warmup=False)
+    assert not os.path.exists(address)
+
+
+def test_serving_thread_survives_a_client_that_stopped_waiting(tmp_path):
+    class GoneClient:
+        # El cliente cerró la conexión por timeout antes de la respuesta
+        def __init__(self):
+            self.requests = [{"method": "status", "args": {}, "segment": None, "inputs": 0}]
+
+        def recv(self):
+            if not self.requests:
+                raise EOFError
+            return self.requests.pop()
+
+        def send(self, response):
+            raise BrokenPipeError(32, "Broken pipe")
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            pass
+
+    server = ModelServer(
+        str(tmp_path / "models.sock"),
+        AUTHKEY,
+        {"status": lambda inputs, outputs: {"state": "ready"}},
+    )
+    server._serve_connection(GoneClient())  # No lanza
+
+
+def test_arrays_travel_through_shared_memory_and_are_released(client):
+    before = shared_segments()
+    image = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+    total, (doubled,) = client.call("double", [image], [((3, 4), np.float32)], factor=2)
+
+    assert total == 66.0
+    np.testing.assert_array_equal(doubled, image * 2)
+    assert shared_segments() == before
+
+
+def test_remote_errors_are_raised_and_the_connection_is_reused(client):
+    with pytest.raises(ModelServerError, match="ValueError: boom"):
+        client.call("fail", [np.zeros(4)])
+    with pytest.raises(ModelServerError, match="Unknown model server method"):
+        client.call("missing")
+
+    assert client.status()["state"] == "ready"
+    assert client._idle.qsize() == 1
+
+
+def test_concurrent_calls_use_separate_connections(client):
+    results = {}
+
+    def call(index):
+        image = np.full((64, 64), index, dtype=np.int32)
+        results[index] = client.call("double", [image], [((64, 64), np.int32)], factor=3)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for index, (total, (tripled,)) in results.items():
+        assert total == 64 * 64 * index
+        assert (tripled == 3 * index).all()
+
+
+def test_segment_with_sam_runs_in_the_model_server(client, monkeypatch):
+    monkeypatch.setattr(sam_module, "remote_client", lambda: client)
+    image = Image.new("RGB", (40, 30), (255, 0, 0))
+
+    mask, score = sam_module.segment_with_sam(image, np.array([10, 5, 20, 15]))
+
+    assert score == 0.75
+    assert mask.shape == (30, 40) and mask.dtype == bool
+    assert mask.sum() == 10 * 10 and mask[5:15, 10:20].all()
+
+
+def test_unreachable_server_raises_model_server_error(tmp_path):
+    client = ModelServerClient(str(tmp_path / "missing.sock"), AUTHKEY, timeout=1)
+    with pytest.raises(ModelServerError, match="Cannot reach the model server"):
+        client.status()
+
+
+if __name__ == "__main__":
+    _serve_fake_models(sys.argv[1])
@@ -0,0 +1,210 @@
+import asyncio
+import base64
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import src.main as main
+import src.modules.segmentation.sam_segmentation as sam_module
+from src.config import MULTI_OBJECT_MAX_K
+from src.main import InferenceExecutor
+from src.modules.segmentation.grounding_dino import box_iou, non_max_suppression
+from src.modules.segmentation.model_registry import ModelRegistry
+from src.utils.lru import LRUCache
+
+
+def test_box_iou():
+    boxes = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]], float)
+    iou = box_iou(boxes[0], boxes)
+    assert np.allclose(iou, [1.0, 50 / 150, 0.0])
+
+
+def test_nms_keeps_best_of_overlapping_boxes():
+    boxes = np.array(
+        [[0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30], [21, 20, 31, 30]], float
+    )
+    scores = np.array([0.6, 0.9, 0.5, 0.4])
+
+    assert non_max_suppression(boxes, scores, iou_threshold=0.5) == [1, 2]
+    # Con un umbral alto no se suprime nada
+    assert non_max_suppression(boxes, scores, iou_threshold=0.99) == [1, 0, 2, 3]
+
+
+# --- Pipeline de varios objetos con DINO y SAM falsos ---
+
+
+class FakeImage:
+    size = (100, 50)
+
+
+class FakePrepared:
+    dino_image = FakeImage()
+    sam_image = FakeImage()
+    full_size = (200, 100)
+
+    def dino_box_to_sam(self, boxes):
+        return boxes
+
+
+def detection(box, score, label):
+    return {"box": np.array(box, float), "score": score, "label": label}
+
+
+@pytest.fixture
+def fake_models(monkeypatch: pytest.MonkeyPatch):
+    calls = {"detect": [], "segment": [], "search": []}
+    detections = [
+        detection([10, 5, 30, 25], 0.9, "shoe"),
+        detection([40, 5, 60, 25], 0.8, "bag"),
+        detection([70, 5, 90, 25], 0.7, "hat"),
+    ]
+
+    def detect(image, text_prompt, box_threshold, text_threshold, top_k, nms_iou_threshold):
+        calls["detect"].append((text_prompt, top_k))
+        return detections[:top_k]
+
+    def segment(image, boxes):
+        calls["segment"].append(boxes)
+        masks = np.zeros((len(boxes), 50, 100), dtype=bool)
+        masks[0, 5:25, 10:30] = True
+        if len(boxes) > 2:
+            masks[2, 5:25, 70:90] = True  # La máscara de "bag" queda vacía
+        return masks, np.array([0.95, 0.5, 0.85])[: len(boxes)]
+
+    def encode(prepared, masks):
+        return [f"crop-{int(mask.nonzero()[1].min())}".encode() for mask in masks]
+
+    async def search(segmented_bytes, score, prompt, report):
+        calls["search"].append((segmented_bytes, score, prompt))
+        await report("Searching...")
+        return [{"title": f"{prompt} match"}]
+
+    monkeypatch.setattr(main, "_prepare_image", lambda image_bytes: FakePrepared())
+    monkeypatch.setattr(main, "get_grounding_dino_detections", detect)
+    monkeypatch.setattr(main, "segment_boxes_with_sam", segment)
+    monkeypatch.setattr(main, "_encode_full_resolution_crops", encode)
+    monkeypatch.setattr(main, "_search_similar_products", search)
+    monkeypatch.setattr(main, "inference_executor", InferenceExecutor(2, 4))
+    return calls
+
+
+async def no_progress(message: str):
+    pass
+
+
+def test_pipeline_segments_all_boxes_at_once_and_searches_each_object(fake_models):
+    objects, steps = asyncio.run(
+        main.process_multi_object_pipeline(b"img", "shoe. bag. hat.", no_progress, top_k=3)
+    )
+
+    assert fake_models["detect"] == [("shoe. bag. hat.", 3)]
+    (boxes,) = fake_models["segment"]
+    assert boxes.shape == (3, 4)
+    # El objeto con la máscara vacía se descarta; el resto conserva su orden
+    assert [o["label"] for o in objects] == ["shoe", "hat"]
+    shoe, hat = objects
+    assert shoe["box"] == [20.0, 10.0, 60.0, 50.0]  # Coordenadas del original
+    assert shoe["detection_score"] == 0.9
+    assert shoe["segmentation_score"] == pytest.approx(0.95)
+    assert hat["segmentation_score"] == pytest.approx(0.85)
+    assert shoe["segmented_image"].endswith(base64.b64encode(b"crop-10").decode())
+    assert shoe["results"] == [{"title": "shoe match"}]
+    assert sorted(fake_models["search"]) == [
+        (b"crop-10", 0.9, "shoe"),
+        (b"crop-70", 0.7, "hat"),
+    ]
+    assert "Segmented 2 object(s) successfully" in steps
+    assert "[object 1/2] Searching..." in steps
+
+
+def test_pipeline_without_detections_returns_no_objects(fake_models, monkeypatch):
+    monkeypatch.setattr(main, "get_grounding_dino_detections", lambda **kwargs: [])
+
+    objects, steps = asyncio.run(
+        main.process_multi_object_pipeline(b"img", "unicorn", no_progress, top_k=3)
+    )
+
+    assert objects == []
+    assert steps[-1] == "Detected 0 object(s)"
+    assert fake_models["segment"] == [] and fake_models["search"] == []
+
+
+def test_segment_boxes_with_sam_runs_one_batched_prediction(monkeypatch):
+    torch = pytest.importorskip("torch")
+
+    class FakeTransform:
+        def apply_boxes_torch(self, boxes, original_size):
+            return boxes * 2
+
+    class FakeSamPredictor:
+        device = "cpu"
+        transform = FakeTransform()
+
+        def __init__(self):
+            self.set_image_calls = 0
+            self.predicted_boxes = None
+
+        def set_image(self, image_np):
+            self.set_image_calls += 1
+            self.features = torch.zeros(1, 4)
+            self.original_size = image_np.shape[:2]
+            self.input_size = image_np.shape[:2]
+
+        def reset_image(self):
+            pass
+
+        def predict_torch(self, point_coords, point_labels, boxes, multimask_output):
+            self.predicted_boxes = boxes
+            masks = torch.zeros(len(boxes), 1, 30, 40, dtype=torch.bool)
+            masks[0, 0, 5:15, 10:20] = True
+            scores = torch.tensor([[0.9], [0.4]])
+            return masks, scores, None
+
+    predictor = FakeSamPredictor()
+    registry = ModelRegistry()
+    registry.set_sam_predictor(predictor)
+    monkeypatch.setattr(sam_module, "model_registry", registry)
+    monkeypatch.setattr(sam_module, "remote_client", lambda: None)
+    monkeypatch.setattr(sam_module, "sam_embedding_cache", LRUCache(max_bytes=1 << 20))
+
+    boxes = np.array([[10, 5, 20, 15], [0, 0, 40, 30]], float)
+    masks, scores = sam_module.segment_boxes_with_sam(
+        Image.new("RGB", (40, 30)), boxes
+    )
+
+    assert predictor.set_image_calls == 1
+    assert predictor.predicted_boxes.tolist() == (boxes * 2).tolist()
+    assert masks.shape == (2, 30, 40) and masks.dtype == bool
+    assert masks[0].sum() == 100 and not masks[1].any()
+    np.testing.assert_allclose(scores, [0.9, 0.4])
+
+
+# --- POST /api/search con top_k ---
+@pytest.mark.parametrize("top_k", [0, MULTI_OBJECT_MAX_K + 1])
+def test_search_rejects_top_k_out_of_range(app_client, top_k):
+    response = app_client.post(
+        "/api/search",
+        files={"image": ("shoe.jpg", b"img", "image/jpeg")},
+        data={"text_prompt": "shoe", "top_k": str(top_k)},
+    )
+
+    assert response.status_code == 422
+    assert "top_k must be between 1 and" in response.json()["message"]
+
+
+def test_search_with_top_k_returns_one_group_per_object(fake_models, app_client):
+    response = app_client.post(
+        "/api/search",
+        files={"image": ("shelf.jpg", b"img", "image/jpeg")},
+        data={"text_prompt": "shoe. bag. hat.", "top_k": "3"},
+    )
+    assert response.status_code == 202
+
+    search_id = response.json()["search_id"]
+    result = app_client.get(f"/api/results/{search_id}", params={"wait": 5}).json()
+
+    assert result["status"] == "completed"
+    assert [o["label"] for o in result["objects"]] == ["shoe", "hat"]
+    assert result["objects"][0]["results"] == [{"title": "shoe match"}]
+    assert "results" not in result
@@ -0,0 +1,59 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from src.modules.segmentation.preprocessing import (
+    PreparedImage,
+    decode_image,
+    scale_box,
+)
+
+
+def make_jpeg(width: int, height: int, orientation: int = 1) -> bytes:
+    image = Image.new("RGB", (width, height), "white")
+    # Cuadrado rojo en la esquina superior izquierda (antes de orientar)
+    image.paste((200, 30, 30), (0, 0, width // 4, height // 4))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=95, exif=exif)
+    return buffer.getvalue()
+
+
+def test_decode_caps_longest_side():
+    image = decode_image(make_jpeg(4000, 3000), max_side=1000)
+    assert image.size == (1000, 750)
+    assert image.mode == "RGB"
+
+
+def test_decode_applies_exif_orientation():
+    # Orientación 6: la imagen se muestra girada 90 grados (retrato)
+    image = decode_image(make_jpeg(800, 600, orientation=6), max_side=400)
+    assert image.size == (300, 400)
+
+
+def test_prepared_image_sizes():
+    prepared = PreparedImage(make_jpeg(4000, 3000, orientation=6), 1333, 1024)
+    assert prepared.full_size == (3000, 4000)
+    assert max(prepared.dino_image.size) == 1333
+    assert max(prepared.sam_image.size) == 1024
+
+
+def test_scale_box_round_trip():
+    box = scale_box([10, 20, 110, 220], (400, 300), (4000, 3000))
+    assert np.allclose(box, [100, 200, 1100, 2200])
+    assert np.allclose(scale_box(box, (4000, 3000), (400, 300)), [10, 20, 110, 220])
+
+
+def test_full_resolution_crop_back_projects_mask():
+    prepared = PreparedImage(make_jpeg(2048, 1536), 1333, 512)
+    mask = np.zeros((prepared.sam_image.height, prepared.sam_image.width), bool)
+    mask[100:200, 100:300] = True
+
+    cropped_image, cropped_mask = prepared.full_resolution_crop(mask)
+
+    # La región se proyecta a la resolución completa (factor 4)
+    assert cropped_image.size == cropped_mask.shape[::-1]
+    assert abs(cropped_image.width - 4 * 237) <= 4
+    assert cropped_mask.mean() > 0.5
@@ -0,0 +1,107 @@
+import asyncio
+
+from src.modules.jobs.progress_hub import ProgressHub
+
+# --- WebSockets dummy ---
+
+
+class DummyWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+    async def close(self):
+        self.closed = True
+
+
+class BlockedWebSocket(DummyWebSocket):
+    """Cliente lento: nunca completa un envío."""
+
+    async def send_json(self, message):
+        await asyncio.Event().wait()
+
+
+class DeadWebSocket(DummyWebSocket):
+    async def send_json(self, message):
+        raise ConnectionError("client gone")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# --- Test de entrega solo a los suscriptores del trabajo ---
+def test_publish_only_reaches_subscribers_of_that_job():
+    async def scenario():
+        hub = ProgressHub(max_queue_size=8)
+        ws_a, ws_b = DummyWebSocket(), DummyWebSocket()
+        hub.subscribe("job-a", ws_a)
+        hub.subscribe("job-b", ws_b)
+
+        hub.publish("job-a", {"progress": "step 1"})
+        await asyncio.sleep(0.01)
+        return ws_a, ws_b
+
+    ws_a, ws_b = run(scenario())
+    assert ws_a.sent == [{"progress": "step 1"}]
+    assert ws_b.sent == []
+
+
+# --- Test de backlog y cierre del canal ---
+def test_backlog_then_close_sends_final_message():
+    async def scenario():
+        hub = ProgressHub(max_queue_size=8)
+        ws = DummyWebSocket()
+        subscriber = hub.subscribe("job", ws, backlog=[{"progress": "old"}])
+        hub.publish("job", {"progress": "new"})
+        hub.close("job", {"status": "completed"})
+        await asyncio.wait_for(subscriber.task, timeout=1)
+        return hub, ws
+
+    hub, ws = run(scenario())
+    assert ws.sent == [{"progress": "old"}, {"progress": "new"}, {"status": "completed"}]
+    assert ws.closed
+    assert hub.subscriber_count("job") == 0
+
+
+# --- Test de cliente lento: drop-oldest sin bloquear al publicador ---
+def test_slow_subscriber_drops_oldest_without_blocking():
+    async def scenario():
+        hub = ProgressHub(max_queue_size=2)
+        slow, fast = BlockedWebSocket(), DummyWebSocket()
+        slow_subscriber = hub.subscribe("job", slow)
+        hub.subscribe("job", fast)
+        await asyncio.sleep(0)
+
+        for i in range(10):
+            hub.publish("job", {"progress": i})  # No debe bloquear
+            await asyncio.sleep(0)  # El cliente rápido consume a su ritmo
+        await asyncio.sleep(0.01)
+
+        pending = []
+        while not slow_subscriber.queue.empty():
+            pending.append(slow_subscriber.queue.get_nowait())
+        hub.unsubscribe("job", slow_subscriber)
+        return fast, slow_subscriber, pending
+
+    fast, slow_subscriber, pending = run(scenario())
+    assert [m["progress"] for m in fast.sent] == list(range(10))
+    # Solo quedan los mensajes más recientes
+    assert len(pending) <= 2
+    assert pending[-1]["progress"] == 9
+    assert slow_subscriber.dropped >= 7
+
+
+# --- Test de cliente caído ---
+def test_dead_subscriber_is_removed():
+    async def scenario():
+        hub = ProgressHub(max_queue_size=8)
+        subscriber = hub.subscribe("job", DeadWebSocket())
+        hub.publish("job", {"progress": "x"})
+        await asyncio.wait_for(subscriber.task, timeout=1)
+        return hub
+
+    assert run(scenario()).subscriber_count("job") == 0
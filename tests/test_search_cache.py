@@ -0,0 +1,114 @@
+import io
+
+from PIL import Image, ImageDraw
+
+from src.modules.search.search_cache import (
+    PerceptualSearchCache,
+    compute_dhash,
+    hamming_distance,
+)
+
+RESULTS = [{"title": "Zapatilla", "link": "https://shop/x", "thumbnail": "t", "price": "10€"}]
+
+
+def make_image_bytes(offset: int = 0, quality: int = 90) -> bytes:
+    image = Image.new("RGB", (200, 200), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((40 + offset, 50, 150 + offset, 160), fill=(200, 30, 30))
+    draw.ellipse((60, 70, 110, 120), fill=(20, 20, 120))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+# --- Tests del hash perceptual ---
+def test_near_duplicates_have_close_hashes():
+    original = compute_dhash(make_image_bytes())
+    recompressed = compute_dhash(make_image_bytes(quality=40))
+    assert hamming_distance(original, recompressed) <= 4
+
+
+# --- Tests de la caché ---
+def test_near_duplicate_lookup_hits():
+    cache = PerceptualSearchCache(max_entries=10, ttl_seconds=60, max_distance=4)
+    cache.put(0b1111_0000, RESULTS)
+
+    assert cache.get(0b1111_0001) == RESULTS  # distancia 1
+    assert cache.get(0b0000_1111) is None  # distancia 8
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    import src.modules.search.search_cache as search_cache
+
+    now = [1000.0]
+    monkeypatch.setattr(search_cache.time, "time", lambda: now[0])
+    cache = PerceptualSearchCache(max_entries=10, ttl_seconds=60, max_distance=0)
+    cache.put(42, RESULTS)
+
+    now[0] += 61
+    assert cache.get(42) is None
+
+
+def test_evicts_least_recently_used():
+    cache = PerceptualSearchCache(max_entries=2, ttl_seconds=60, max_distance=0)
+    cache.put(1, RESULTS)
+    cache.put(2, RESULTS)
+    cache.get(1)
+    cache.put(3, RESULTS)
+
+    assert cache.get(2) is None
+    assert cache.get(1) == RESULTS
+    assert cache.get(3) == RESULTS
+
+
+def test_sqlite_backend_survives_restart(tmp_path):
+    db_path = str(tmp_path / "search_cache.db")
+    cache = PerceptualSearchCache(10, 60, 0, sqlite_path=db_path)
+    cache.put(2**63 + 5, RESULTS)  # Hash de 64 bits con el bit alto activo
+
+    reloaded = PerceptualSearchCache(10, 60, 0, sqlite_path=db_path)
+    assert reloaded.get(2**63 + 5) == RESULTS
+
+
+def test_prompt_is_part_of_the_key():
+    cache = PerceptualSearchCache(max_entries=10, ttl_seconds=60, max_distance=4)
+    cache.put(0b1111_0000, RESULTS, "red shoe")
+
+    # Mismo recorte con otro prompt: otra búsqueda
+    assert cache.get(0b1111_0000, "bag") is None
+    assert cache.get(0b1111_0001, "bag") is None
+    # El prompt se normaliza como las captions de GroundingDINO
+    assert cache.get(0b1111_0000, "Red  Shoe") == RESULTS
+    assert cache.get(0b1111_0001, "red shoe.") == RESULTS
+
+
+def test_sqlite_backend_keeps_prompts_apart(tmp_path):
+    db_path = str(tmp_path / "search_cache.db")
+    cache = PerceptualSearchCache(10, 60, 0, sqlite_path=db_path)
+    cache.put(7, RESULTS, "shoe")
+    cache.put(7, [], "bag")
+
+    reloaded = PerceptualSearchCache(10, 60, 0, sqlite_path=db_path)
+    assert reloaded.get(7, "shoe") == RESULTS
+    assert reloaded.get(7, "bag") == []
+
+
+def test_sqlite_table_without_prompts_is_discarded(tmp_path):
+    import sqlite3
+
+    db_path = str(tmp_path / "search_cache.db")
+    db = sqlite3.connect(db_path)
+    db.execute(
+        "CREATE TABLE search_cache ("
+        "phash TEXT PRIMARY KEY, created_at REAL NOT NULL, results TEXT NOT NULL)"
+    )
+    db.execute("INSERT INTO search_cache VALUES ('0000000000000007', 1e12, '[]')")
+    db.commit()
+    db.close()
+
+    cache = PerceptualSearchCache(10, 60, 0, sqlite_path=db_path)
+    assert cache.get(7) is None
+    cache.put(7, RESULTS, "shoe")
+    assert PerceptualSearchCache(10, 60, 0, sqlite_path=db_path).get(7, "shoe") == RESULTS
@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+from src.modules.search.search_orchestrator import (
+    SearchOrchestrator,
+    canonical_url,
+    merge_results,
+)
+
+
+def item(link, title="Producto", price=None):
+    return {"title": title, "link": link, "thumbnail": link + ".jpg", "price": price}
+
+
+def provider(items, delay=0.0, error=None):
+    async def search(image_url):
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return items
+
+    return search
+
+
+# --- Tests de normalización y unión ---
+def test_canonical_url_drops_tracking_and_fragments():
+    assert canonical_url(
+        "http://WWW.Shop.com/p/1/?utm_source=lens&color=red&gclid=x#reviews"
+    ) == canonical_url("https://shop.com/p/1?color=red")
+    assert canonical_url("Link no disponible") is None
+
+
+def test_merge_deduplicates_and_ranks_shared_results_first():
+    merged = merge_results(
+        {
+            "lens": [item("https://a.com/1"), item("https://b.com/2?utm_medium=x")],
+            "web_detection": [
+                item("https://www.b.com/2", price={"value": "10 €"}),
+                item("https://c.com/3"),
+            ],
+        },
+        max_results=10,
+    )
+
+    assert [r["link"] for r in merged] == [
+        "https://b.com/2?utm_medium=x",
+        "https://a.com/1",
+        "https://c.com/3",
+    ]
+    assert merged[0]["price"] == "10 €"
+    assert merged[0]["sources"] == ["lens", "web_detection"]
+    assert merged[1]["price"] == "Precio no disponible"
+
+
+# --- Tests del límite de tiempo y de los fallos ---
+def test_slow_provider_is_abandoned_at_the_deadline():
+    orchestrator = SearchOrchestrator(
+        {
+            "lens": provider([item("https://a.com/1")], delay=0.01),
+            "slow": provider([item("https://b.com/2")], delay=5),
+        },
+        deadline_seconds=0.2,
+    )
+
+    start = time.perf_counter()
+    results = asyncio.run(orchestrator.search("https://img"))
+
+    assert time.perf_counter() - start < 1
+    assert [r["link"] for r in results] == ["https://a.com/1"]
+
+
+def test_hedging_stops_waiting_once_a_provider_answers():
+    orchestrator = SearchOrchestrator(
+        {
+            "lens": provider([item("https://a.com/1")], delay=0.01),
+            "slow": provider([item("https://b.com/2")], delay=0.5),
+        },
+        deadline_seconds=5,
+        hedge_seconds=0.05,
+    )
+
+    start = time.perf_counter()
+    results = asyncio.run(orchestrator.search("https://img"))
+
+    assert time.perf_counter() - start < 0.4
+    assert len(results) == 1
+
+
+def test_failing_provider_does_not_fail_the_search():
+    orchestrator = SearchOrchestrator(
+        {
+            "broken": provider([], error=RuntimeError("boom")),
+            "lens": provider([item("https://a.com/1")]),
+        },
+        deadline_seconds=1,
+    )
+    assert len(asyncio.run(orchestrator.search("https://img"))) == 1
+
+
+def test_every_provider_response_is_reported_as_it_arrives():
+    orchestrator = SearchOrchestrator(
+        {
+            "lens": provider([item("https://a.com/1")], delay=0.01),
+            "empty": provider([], delay=0.02),
+            "slow": provider([item("https://b.com/2")], delay=0.1),
+        },
+        deadline_seconds=5,
+    )
+    partials = []
+
+    async def on_partial(results, source):
+        partials.append((source, [r["link"] for r in results]))
+
+    results = asyncio.run(orchestrator.search("https://img", on_partial))
+
+    # También el último proveedor y los que no aportan resultados
+    assert partials == [
+        ("lens", ["https://a.com/1"]),
+        ("empty", ["https://a.com/1"]),
+        ("slow", [r["link"] for r in results]),
+    ]
+    assert {r["link"] for r in results} == {"https://a.com/1", "https://b.com/2"}
+
+
+def test_a_single_provider_is_reported_too():
+    orchestrator = SearchOrchestrator(
+        {"lens": provider([item("https://a.com/1")])}, deadline_seconds=5
+    )
+    partials = []
+
+    async def on_partial(results, source):
+        partials.append(source)
+
+    asyncio.run(orchestrator.search("https://img", on_partial))
+    assert partials == ["lens"]
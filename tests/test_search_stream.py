@@ -0,0 +1,278 @@
+import asyncio
+import base64
+import io
+import json
+
+import pytest
+from PIL import Image
+
+import src.app as app_module
+import src.main as main
+from src.main import InferenceExecutor, JobManager
+from src.modules.search.search_cache import PerceptualSearchCache
+from src.modules.search.search_orchestrator import SearchOrchestrator
+from src.modules.storage.image_store import LocalImageStore
+
+
+class FakeImage:
+    size = (100, 50)
+
+
+class FakePrepared:
+    dino_image = FakeImage()
+    sam_image = FakeImage()
+    full_size = (200, 100)
+
+    def dino_box_to_sam(self, box):
+        return box
+
+
+def crop_bytes() -> bytes:
+    buffer = io.BytesIO()
+    image = Image.new("RGB", (32, 32), (255, 255, 255))
+    image.paste((200, 30, 30), (8, 8, 24, 24))
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+CROP = crop_bytes()
+
+
+def lens_item(link):
+    return {"title": link, "link": link, "thumbnail": link + ".jpg", "price": None}
+
+
+def provider(items, delay=0.0):
+    async def search(image_url):
+        await asyncio.sleep(delay)
+        return items
+
+    return search
+
+
+def use_providers(monkeypatch, providers: dict):
+    monkeypatch.setattr(
+        main, "search_orchestrator", SearchOrchestrator(providers, deadline_seconds=5)
+    )
+
+
+@pytest.fixture
+def fake_pipeline(monkeypatch: pytest.MonkeyPatch, tmp_path):
+    def detect(image, text_prompt, box_threshold, text_threshold):
+        if text_prompt == "nothing":
+            raise ValueError("No object found")
+        return [10, 5, 50, 25], 0.9, text_prompt
+
+    monkeypatch.setattr(main, "_prepare_image", lambda image_bytes: FakePrepared())
+    monkeypatch.setattr(main, "get_grounding_dino_boxes", detect)
+    monkeypatch.setattr(main, "segment_with_sam", lambda image, box: ("mask", 0.8))
+    monkeypatch.setattr(main, "_encode_full_resolution_crop", lambda prepared, mask: CROP)
+    monkeypatch.setattr(main, "inference_executor", InferenceExecutor(1, 1))
+    # Búsqueda real (caché, almacén y orquestador); solo los proveedores son falsos
+    monkeypatch.setattr(main, "lens_search_cache", PerceptualSearchCache(100, 60, 6))
+    monkeypatch.setattr(main, "local_index", None)
+    monkeypatch.setattr(
+        main, "image_store", LocalImageStore(str(tmp_path), "http://testserver")
+    )
+    # Configuración por defecto: un único proveedor (lens)
+    use_providers(monkeypatch, {"lens": provider([lens_item("https://a.com/1")])})
+
+
+def post(client, prompt, headers=None):
+    return client.post(
+        "/api/search/stream",
+        files={"image": ("shoe.jpg", b"img", "image/jpeg")},
+        data={"text_prompt": prompt},
+        headers=headers or {},
+    )
+
+
+def events_of(response) -> list[dict]:
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def stages_of(events) -> list[str]:
+    return [e["event"] for e in events if e["event"] != "progress"]
+
+
+def test_stream_sends_each_stage_before_the_final_results(fake_pipeline, app_client):
+    response = post(app_client, "shoe")
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = events_of(response)
+    assert stages_of(events) == ["detection", "segmentation", "results", "done"]
+
+    detection, segmentation, partial, done = [e for e in events if e["event"] != "progress"]
+    # Box en coordenadas de la imagen original (el doble que la de DINO)
+    assert detection["box"] == [20.0, 10.0, 100.0, 50.0]
+    assert detection["label"] == "shoe"
+    assert segmentation["segmented_image"].endswith(base64.b64encode(CROP).decode())
+    # Con un único proveedor también llega su respuesta antes de "done"
+    assert partial["source"] == "lens"
+    assert [r["link"] for r in partial["results"]] == ["https://a.com/1"]
+    assert [r["link"] for r in done["results"]] == ["https://a.com/1"]
+
+
+def test_stream_sends_one_results_event_per_provider(fake_pipeline, app_client, monkeypatch):
+    use_providers(
+        monkeypatch,
+        {
+            "lens": provider([lens_item("https://a.com/1")], delay=0.01),
+            "web_detection": provider([lens_item("https://b.com/2")], delay=0.05),
+        },
+    )
+
+    events = events_of(post(app_client, "shoe"))
+
+    partials = [e for e in events if e["event"] == "results"]
+    assert [e["source"] for e in partials] == ["lens", "web_detection"]
+    assert [r["link"] for r in partials[0]["results"]] == ["https://a.com/1"]
+    assert {r["link"] for r in partials[1]["results"]} == {
+        "https://a.com/1",
+        "https://b.com/2",
+    }
+    assert stages_of(events)[-1] == "done"
+
+
+def test_stream_sends_cached_results_as_a_results_event(fake_pipeline, app_client):
+    post(app_client, "shoe")
+
+    events = events_of(post(app_client, "shoe"))
+
+    partials = [e for e in events if e["event"] == "results"]
+    assert [e["source"] for e in partials] == ["cache"]
+    assert [r["link"] for r in partials[0]["results"]] == ["https://a.com/1"]
+    assert stages_of(events) == ["detection", "segmentation", "results", "done"]
+
+
+def test_cached_results_are_not_reused_for_another_prompt(fake_pipeline, app_client):
+    post(app_client, "shoe")
+
+    events = events_of(post(app_client, "bag"))
+
+    partials = [e for e in events if e["event"] == "results"]
+    assert [e["source"] for e in partials] == ["lens"]
+
+
+def test_stream_reports_errors_as_an_event(fake_pipeline, app_client):
+    response = post(app_client, "nothing")
+
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert events[-1]["event"] == "error"
+    assert events[-1]["message"] == "No object found"
+    assert "detection" not in [e["event"] for e in events]
+
+
+def test_stream_uses_server_sent_events_when_asked(fake_pipeline, app_client):
+    response = post(
+        app_client, "shoe", headers={"Accept": "text/event-stream"}
+    )
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    blocks = [b for b in response.text.split("\n\n") if b]
+    names = [b.split("\n")[0] for b in blocks]
+    assert "event: detection" in names
+    assert names[-1] == "event: done"
+    assert json.loads(blocks[-1].split("\n")[1][len("data: "):])["event"] == "done"
+
+
+def test_stream_returns_429_when_the_search_queue_is_full(fake_pipeline, app_client, monkeypatch):
+    manager = JobManager(max_queue_size=1, concurrency=1, result_ttl_seconds=60)
+    monkeypatch.setattr(app_module, "job_manager", manager)
+    # Sin workers: la cola no avanza y un trabajo pendiente la llena
+    manager._queue = asyncio.Queue(maxsize=1)
+    manager._queue.put_nowait(object())
+
+    response = post(app_client, "shoe")
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_stream_keeps_the_request_trace_id(fake_pipeline, app_client, monkeypatch):
+    seen = []
+
+    def detect(image, text_prompt, box_threshold, text_threshold):
+        seen.append(main.trace_id_var.get())
+        return [10, 5, 50, 25], 0.9, text_prompt
+
+    monkeypatch.setattr(main, "get_grounding_dino_boxes", detect)
+
+    response = post(app_client, "shoe", headers={"X-Trace-Id": "trace-123"})
+
+    assert response.headers["X-Trace-Id"] == "trace-123"
+    assert seen == ["trace-123"]
+
+
+def test_identical_streams_share_one_pipeline_run(fake_pipeline, monkeypatch):
+    calls = []
+
+    async def pipeline(image_bytes, text_prompt, publish):
+        calls.append(text_prompt)
+        await publish({"event": "detection", "label": text_prompt})
+        await asyncio.sleep(0.05)
+        return {"results": [{"title": "shared"}], "segmentation_score": 0.8}
+
+    monkeypatch.setattr(app_module, "stream_image_pipeline", pipeline)
+
+    async def run():
+        manager = JobManager(8, 2, 60)
+        monkeypatch.setattr(app_module, "job_manager", manager)
+        await manager.start()
+        try:
+            streams = [await call_stream_endpoint("shoe") for _ in range(2)]
+            return await asyncio.gather(*(collect(s) for s in streams))
+        finally:
+            await manager.stop()
+
+    first, second = asyncio.run(run())
+
+    assert calls == ["shoe"]
+    for events in (first, second):
+        assert [e["event"] for e in events] == ["detection", "done"]
+        assert events[-1]["results"] == [{"title": "shared"}]
+
+
+def test_client_disconnect_cancels_the_pipeline(fake_pipeline, monkeypatch):
+    cancelled = asyncio.Event()
+
+    async def pipeline(image_bytes, text_prompt, publish):
+        await publish({"event": "detection"})
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    monkeypatch.setattr(app_module, "stream_image_pipeline", pipeline)
+
+    async def run():
+        manager = JobManager(8, 1, 60)
+        monkeypatch.setattr(app_module, "job_manager", manager)
+        await manager.start()
+        try:
+            stream = await call_stream_endpoint("shoe")
+            assert json.loads(await stream.__anext__())["event"] == "detection"
+            await stream.aclose()
+            await asyncio.wait_for(cancelled.wait(), timeout=1)
+            # El worker de la cola sigue vivo para el siguiente trabajo
+            assert not any(worker.done() for worker in manager._workers)
+        finally:
+            await manager.stop()
+
+    asyncio.run(run())
+
+
+async def call_stream_endpoint(prompt: str):
+    """Llama al endpoint sin servidor HTTP y retorna el iterador del cuerpo."""
+    from starlette.datastructures import UploadFile
+    from starlette.requests import Request
+
+    request = Request({"type": "http", "headers": []})
+    upload = UploadFile(io.BytesIO(b"img"), filename="shoe.jpg")
+    response = await app_module.search_stream(request, upload, prompt)
+    return response.body_iterator
+
+
+async def collect(body_iterator) -> list[dict]:
+    return [json.loads(line) async for line in body_iterator]
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from src.modules.jobs.single_flight import SingleFlight, request_key
+
+
+def test_request_key_normalizes_the_prompt():
+    assert request_key(b"img", "  Red   Shoe ", 1) == request_key(b"img", "red shoe", 1)
+    assert request_key(b"img", "red shoe", 1) != request_key(b"img", "red shoe", 2)
+    assert request_key(b"img", "red shoe", 1) != request_key(b"other", "red shoe", 1)
+
+
+def test_concurrent_identical_calls_share_one_execution_and_progress():
+    flights = SingleFlight()
+    runs = []
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def pipeline(report):
+            runs.append(1)
+            await report("detected")
+            await gate.wait()
+            await report("searched")
+            return {"results": ["x"]}
+
+        progress = {"a": [], "b": []}
+
+        def listener(name):
+            async def callback(message):
+                progress[name].append(message)
+
+            return callback
+
+        first = asyncio.create_task(flights.do("k", pipeline, listener("a")))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(flights.do("k", pipeline, listener("b")))
+        await asyncio.sleep(0)
+        assert flights.in_flight == 1
+        gate.set()
+        results = await asyncio.gather(first, second)
+        return results, progress
+
+    results, progress = asyncio.run(scenario())
+
+    assert runs == [1]
+    assert results[0] is results[1]
+    # El segundo recibe también el progreso emitido antes de engancharse
+    assert progress["a"] == progress["b"] == ["detected", "searched"]
+    assert flights.shared == 1
+    assert flights.in_flight == 0
+
+
+def test_key_is_released_after_completion_and_errors_are_shared():
+    flights = SingleFlight()
+    calls = []
+
+    async def failing(report):
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("no detection")
+
+    async def scenario():
+        outcomes = await asyncio.gather(
+            flights.do("k", failing), flights.do("k", failing), return_exceptions=True
+        )
+        assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+        # Terminada la ejecución, una nueva llamada vuelve a ejecutar
+        with pytest.raises(ValueError):
+            await flights.do("k", failing)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+
+def test_execution_is_cancelled_when_every_caller_cancels():
+    flights = SingleFlight()
+    cancelled = []
+
+    async def slow(report):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def scenario():
+        waiter = asyncio.create_task(flights.do("k", slow))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert cancelled == [True]
+    assert flights.in_flight == 0
@@ -0,0 +1,66 @@
+import pytest
+
+from src.modules.segmentation.text_cache import CaptionTokenizer
+from src.utils.utils import preprocess_caption
+
+
+class CountingTokenizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, caption, return_token_type_ids=True):
+        self.calls.append(caption)
+        ids = [101] + [len(word) for word in caption.split()] + [102]
+        return {"input_ids": ids, "attention_mask": [1] * len(ids)}
+
+    def pad(self, encodings, padding, return_tensors):
+        length = max(len(e["input_ids"]) for e in encodings)
+        return {
+            "input_ids": [e["input_ids"] + [0] * (length - len(e["input_ids"])) for e in encodings]
+        }
+
+
+def test_caption_tokenizer_tokenizes_each_caption_once():
+    tokenizer = CountingTokenizer()
+    tokenize = CaptionTokenizer(max_entries=8)
+
+    tokenize(tokenizer, ["shoe.", "red bag."])
+    batch = tokenize(tokenizer, ["red bag.", "shoe."])
+
+    assert tokenizer.calls == ["shoe.", "red bag."]
+    assert batch["input_ids"] == [[101, 3, 4, 102], [101, 5, 102, 0]]
+
+
+def test_equivalent_prompts_share_a_caption():
+    assert preprocess_caption("  Red   Shoe ") == preprocess_caption("red shoe.")
+
+
+def test_text_features_are_reused_across_batch_padding():
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("transformers.models.grounding_dino.modeling_grounding_dino")
+    from types import SimpleNamespace
+
+    from src.modules.segmentation.text_cache import make_cached_text_backbone
+
+    class FakeBackbone(torch.nn.Module):
+        config = SimpleNamespace(pad_token_id=0)
+
+        def __init__(self):
+            super().__init__()
+            self.rows = []
+
+        def forward(self, input_ids, attention_mask, token_type_ids, position_ids, **kwargs):
+            self.rows.extend(input_ids.tolist())
+            hidden = input_ids.float()[..., None].expand(-1, -1, 4)
+            return SimpleNamespace(last_hidden_state=hidden)
+
+    backbone = FakeBackbone()
+    cached = make_cached_text_backbone(backbone, max_entries=8)
+
+    cached(torch.tensor([[101, 7, 1012, 102]]))  # "shoe." solo (prewarm)
+    padded = cached(torch.tensor([[101, 7, 1012, 102, 0, 0], [101, 8, 9, 10, 1012, 102]]))
+
+    # "shoe." rellenada en el lote sale de la caché; solo se codifica la nueva
+    assert backbone.rows == [[101, 7, 1012, 102], [101, 8, 9, 10, 1012, 102]]
+    assert padded.last_hidden_state.shape == (2, 6, 4)
+    assert padded.last_hidden_state[0, 4:].abs().sum() == 0
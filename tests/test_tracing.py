@@ -0,0 +1,176 @@
+import contextvars
+import logging
+
+import pytest
+from prometheus_client.parser import text_string_to_metric_families
+
+import src.main as main
+from src.main import InferenceExecutor
+
+# Las métricas se registran una sola vez, en el módulo que importa la app
+import modules.observability.tracing as tracing
+
+
+class FakeImage:
+    size = (100, 50)
+
+
+class FakePrepared:
+    dino_image = FakeImage()
+    sam_image = FakeImage()
+    full_size = (200, 100)
+
+    def dino_box_to_sam(self, box):
+        return box
+
+
+@pytest.fixture
+def fake_pipeline(monkeypatch: pytest.MonkeyPatch):
+    """Pipeline con modelos y búsqueda falsos; "nothing" falla en la detección."""
+
+    def detect(image, text_prompt, box_threshold, text_threshold):
+        if text_prompt == "nothing":
+            raise ValueError("No object found")
+        return [10, 5, 50, 25], 0.9, text_prompt
+
+    async def search_similar_products(
+        segmented_bytes, score, prompt, report, on_partial=None
+    ):
+        return [{"title": "shoe", "link": "https://a.com/1"}]
+
+    monkeypatch.setattr(main, "_prepare_image", lambda image_bytes: FakePrepared())
+    monkeypatch.setattr(main, "get_grounding_dino_boxes", detect)
+    monkeypatch.setattr(main, "segment_with_sam", lambda image, box: ("mask", 0.8))
+    monkeypatch.setattr(main, "_encode_full_resolution_crop", lambda prepared, mask: b"crop")
+    monkeypatch.setattr(main, "_search_similar_products", search_similar_products)
+    monkeypatch.setattr(main, "inference_executor", InferenceExecutor(1, 1))
+
+
+def post(client, prompt, headers=None):
+    return client.post(
+        "/api/search/stream",
+        files={"image": ("shoe.jpg", b"img", "image/jpeg")},
+        data={"text_prompt": prompt},
+        headers=headers or {},
+    )
+
+
+def metric_value(metrics_text: str, name: str, **labels) -> float:
+    """Valor de una muestra en la salida de /metrics (0 si aún no existe)."""
+    for family in text_string_to_metric_families(metrics_text):
+        for sample in family.samples:
+            if sample.name == name and sample.labels == labels:
+                return sample.value
+    return 0.0
+
+
+def scrape(client) -> str:
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    return response.text
+
+
+# --- Pipeline completo a través de la API ---
+def test_pipeline_stages_show_up_in_metrics(fake_pipeline, app_client):
+    before = scrape(app_client)
+
+    assert post(app_client, "shoe").status_code == 200
+
+    after = scrape(app_client)
+    for stage in ("decode", "dino", "sam", "encode"):
+        count = "pipeline_stage_duration_seconds_count"
+        assert metric_value(after, count, stage=stage) == (
+            metric_value(before, count, stage=stage) + 1
+        )
+        assert metric_value(after, "pipeline_stage_in_flight", stage=stage) == 0
+    assert metric_value(
+        after, "pipeline_stage_errors_total", stage="dino"
+    ) == metric_value(before, "pipeline_stage_errors_total", stage="dino")
+
+
+def test_failed_stage_increments_its_error_counter(fake_pipeline, app_client):
+    before = scrape(app_client)
+
+    events = post(app_client, "nothing").text.splitlines()
+
+    after = scrape(app_client)
+    assert '"error"' in events[-1]
+    errors = "pipeline_stage_errors_total"
+    assert metric_value(after, errors, stage="dino") == (
+        metric_value(before, errors, stage="dino") + 1
+    )
+    count = "pipeline_stage_duration_seconds_count"
+    assert metric_value(after, count, stage="sam") == metric_value(
+        before, count, stage="sam"
+    )
+
+
+def test_response_echoes_the_incoming_trace_id(fake_pipeline, app_client, caplog):
+    with caplog.at_level(logging.INFO, logger=tracing.logger.name):
+        response = post(app_client, "shoe", headers={"X-Trace-Id": "trace-abc"})
+
+    assert response.headers["X-Trace-Id"] == "trace-abc"
+    stage_logs = [r.getMessage() for r in caplog.records if "stage=dino" in r.getMessage()]
+    assert stage_logs and all("trace_id=trace-abc" in line for line in stage_logs)
+
+
+def test_requests_without_trace_id_get_a_new_one(app_client):
+    first = app_client.get("/metrics").headers["X-Trace-Id"]
+    second = app_client.get("/metrics").headers["X-Trace-Id"]
+
+    assert len(first) == 32 and int(first, 16) >= 0
+    assert first != second
+
+
+# --- Primitivas de trazado ---
+def test_start_trace_sets_the_context_trace_id():
+    def run():
+        generated = tracing.start_trace()
+        assert tracing.trace_id_var.get() == generated and len(generated) == 32
+        assert tracing.start_trace("given") == "given"
+        return tracing.trace_id_var.get()
+
+    assert contextvars.copy_context().run(run) == "given"
+    assert tracing.trace_id_var.get() is None
+
+
+def test_stage_span_measures_successes_and_errors():
+    def value(name):
+        return metric_value(tracing.render_metrics()[0].decode(), name, stage="unit_test")
+
+    count_before = value("pipeline_stage_duration_seconds_count")
+    errors_before = value("pipeline_stage_errors_total")
+
+    with tracing.stage_span("unit_test"):
+        assert value("pipeline_stage_in_flight") == 1
+    with pytest.raises(RuntimeError):
+        with tracing.stage_span("unit_test"):
+            raise RuntimeError("boom")
+
+    assert value("pipeline_stage_duration_seconds_count") == count_before + 2
+    assert value("pipeline_stage_errors_total") == errors_before + 1
+    assert value("pipeline_stage_in_flight") == 0
+
+
+def test_external_call_records_the_outcome():
+    def count(outcome):
+        return metric_value(
+            tracing.render_metrics()[0].decode(),
+            "external_call_duration_seconds_count",
+            service="unit_test",
+            outcome=outcome,
+        )
+
+    ok_before, error_before = count("ok"), count("error")
+
+    with tracing.external_call("unit_test"):
+        pass
+    with tracing.external_call("unit_test") as call:
+        call["outcome"] = "error"  # p. ej. un HTTP 5xx
+    with pytest.raises(TimeoutError):
+        with tracing.external_call("unit_test"):
+            raise TimeoutError
+
+    assert count("ok") == ok_before + 1
+    assert count("error") == error_before + 2
@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+from google.cloud import vision
+
+import src.modules.search.google_lens_search as gls
+from src.modules.search.vision_clients import VisionClientManager
+
+
+class DummyCredentials:
+    expiry = None
+
+    def __init__(self):
+        self.refreshes = 0
+
+    def refresh(self, request):
+        self.refreshes += 1
+
+
+class DummyClient:
+    instances = 0
+
+    def __init__(self, credentials):
+        DummyClient.instances += 1
+        self.credentials = credentials
+
+
+@pytest.fixture
+def manager(monkeypatch: pytest.MonkeyPatch):
+    credentials = DummyCredentials()
+    monkeypatch.setattr(
+        VisionClientManager, "_load_credentials", staticmethod(lambda: credentials)
+    )
+    monkeypatch.setattr(vision, "ImageAnnotatorClient", DummyClient)
+    monkeypatch.setattr(vision, "ImageAnnotatorAsyncClient", DummyClient)
+    DummyClient.instances = 0
+    return VisionClientManager(refresh_margin_seconds=60)
+
+
+def test_sync_client_is_created_once(manager):
+    assert manager.get_vision_client() is manager.get_vision_client()
+    assert DummyClient.instances == 1
+
+
+def test_async_client_is_reused_within_a_loop_and_recreated_across_loops(manager):
+    async def get_twice():
+        first = manager.get_async_vision_client()
+        second = manager.get_async_vision_client()
+        # Espera (acotada) a que la tarea en segundo plano renueve el token
+        credentials = manager.credentials()
+        for _ in range(200):
+            if credentials.refreshes:
+                break
+            await asyncio.sleep(0.01)
+        refreshes = credentials.refreshes
+        manager._refresh_task.cancel()
+        return first, second, refreshes
+
+    first, second, refreshes = asyncio.run(get_twice())
+    assert first is second
+    assert refreshes >= 1
+    other, _, _ = asyncio.run(get_twice())
+    assert other is not first
+
+
+def test_refresh_without_expiry_waits_fallback_interval(
+    manager, monkeypatch: pytest.MonkeyPatch
+):
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+        if len(delays) >= 3:
+            raise asyncio.CancelledError
+        await real_sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+
+    async def run():
+        with pytest.raises(asyncio.CancelledError):
+            await manager._refresh_credentials()
+
+    asyncio.run(run())
+    # Primera renovación inmediata; después, intervalo fijo (no 0 en bucle)
+    assert delays[0] == 0.0
+    assert delays[1:] == [manager.fallback_refresh_seconds] * 2
+
+
+class DummyAnnotateResponse:
+    def __init__(self, response):
+        self.responses = [response]
+
+
+class DummyAsyncVisionClient:
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+
+    async def batch_annotate_images(self, requests, retry=None):
+        self.requests.extend(requests)
+        return DummyAnnotateResponse(self.response)
+
+
+def test_related_search_async_formats_web_detection(monkeypatch: pytest.MonkeyPatch):
+    response = vision.AnnotateImageResponse(
+        web_detection=vision.WebDetection(
+            pages_with_matching_images=[
+                vision.WebDetection.WebPage(
+                    url="https://shop.com/item",
+                    page_title="Item",
+                    full_matching_images=[
+                        vision.WebDetection.WebImage(url="https://shop.com/item.jpg")
+                    ],
+                )
+            ]
+        )
+    )
+    client = DummyAsyncVisionClient(response)
+    monkeypatch.setattr(gls.vision_clients, "get_async_vision_client", lambda: client)
+
+    results = asyncio.run(gls.related_search_async("https://example.com/img.jpg"))
+
+    assert results == [
+        {
+            "title": "Item",
+            "link": "https://shop.com/item",
+            "thumbnail": "https://shop.com/item.jpg",
+            "price": "Precio no disponible",
+        }
+    ]
+    assert client.requests[0].features[0].type_ == vision.Feature.Type.WEB_DETECTION
+
+
+def test_related_search_async_raises_on_api_error(monkeypatch: pytest.MonkeyPatch):
+    response = vision.AnnotateImageResponse(error={"message": "quota exceeded"})
+    client = DummyAsyncVisionClient(response)
+    monkeypatch.setattr(gls.vision_clients, "get_async_vision_client", lambda: client)
+
+    with pytest.raises(RuntimeError, match="quota exceeded"):
+        asyncio.run(gls.related_search_async("https://example.com/img.jpg"))